@@ -0,0 +1,69 @@
+"""Throughput de codificación por códec: voice_codecs vs audioop.
+
+Codifica varios segundos de PCM16 a 8 kHz con cada códec y muestra millones
+de muestras por segundo. La columna "generador" es el camino anterior de
+PCM 8-bit unsigned (`bytes((b + 128) % 256 for b in ...)`).
+
+Uso: python benchmarks/bench_codecs.py [segundos_de_audio]
+"""
+import math
+import os
+import struct
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import voice_codecs  # noqa: E402
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:  # Python 3.13+
+        audioop = None
+
+RATE = 8000
+
+
+def throughput(fn, data, samples, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return samples / best / 1e6
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    samples = int(RATE * seconds)
+    pcm = struct.pack(f"<{samples}h", *(
+        int(12000 * math.sin(2 * math.pi * 440 * i / RATE)) for i in range(samples)
+    ))
+    voice_codecs.encode(pcm[:2], voice_codecs.CODEC_ULAW)  # construir tablas fuera de la medición
+    voice_codecs.encode(pcm[:2], voice_codecs.CODEC_ALAW)
+
+    rows = [
+        ("μ-law", lambda d: voice_codecs.encode_ulaw(d),
+         audioop and (lambda d: audioop.lin2ulaw(d, 2))),
+        ("A-law", lambda d: voice_codecs.encode_alaw(d),
+         audioop and (lambda d: audioop.lin2alaw(d, 2))),
+        ("PCM8 signed", lambda d: voice_codecs.encode_pcm8(d, True),
+         audioop and (lambda d: audioop.lin2lin(d, 2, 1))),
+        ("PCM8 unsigned", lambda d: voice_codecs.encode_pcm8(d, False),
+         audioop and (lambda d: bytes((b + 128) % 256 for b in audioop.lin2lin(d, 2, 1)))),
+        ("PCM16", lambda d: voice_codecs.encode_pcm16(d), None),
+    ]
+    backend = "numpy" if voice_codecs.numpy_or_none() is not None else "map+tabla"
+    print(f"{seconds:.0f} s de audio ({samples} muestras), backend={backend}")
+    print(f"{'códec':<15}{'voice_codecs':>14}{'audioop':>12}   (Mmuestras/s)")
+    for name, ours, ref in rows:
+        ref_txt = f"{throughput(ref, pcm, samples):12.1f}" if ref else f"{'-':>12}"
+        print(f"{name:<15}{throughput(ours, pcm, samples):14.1f}{ref_txt}")
+
+
+if __name__ == "__main__":
+    main()
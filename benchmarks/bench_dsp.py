@@ -0,0 +1,106 @@
+"""Throughput del pipeline de reproducción: dsp.PlaybackPipeline vs audioop.
+
+Convierte audio sintético al μ-law 8 kHz del módem con el pipeline NumPy
+(bloques de 1 s más master() sobre el archivo completo, como prompt_cache)
+y con la cadena audioop anterior por bloques de 1024 frames (lin2lin,
+tomono, ratecv, avg/bias, rms/mul, lin2ulaw), y muestra cuántas veces
+tiempo real procesa cada uno.
+
+Uso: python benchmarks/bench_dsp.py [segundos_de_audio]
+"""
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dsp import PlaybackPipeline, encode_samples, master  # noqa: E402
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:  # Python 3.13+
+        audioop = None
+
+BLOCK_FRAMES = 1024
+TARGET_RMS = 5000
+CASES = (
+    # (descripción, tasa, canales, ancho)
+    ("8 kHz mono 8-bit", 8000, 1, 1),
+    ("16 kHz mono 16-bit", 16000, 1, 2),
+    ("44.1 kHz estéreo 16-bit", 44100, 2, 2),
+    ("48 kHz estéreo 32-bit", 48000, 2, 4),
+)
+
+
+def synth(rate, channels, width, seconds):
+    t = np.arange(int(rate * seconds)) / rate
+    x = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * np.random.default_rng(1).standard_normal(len(t))
+    x = np.repeat(x[:, None], channels, axis=1).ravel()
+    if width == 1:
+        return ((x * 127) + 128).astype(np.uint8).tobytes()
+    if width == 2:
+        return (x * 32767).astype("<i2").tobytes()
+    return (x * 2147483647).astype("<i4").tobytes()
+
+
+def run_pipeline(data, rate, channels, width):
+    step = max(rate, BLOCK_FRAMES) * channels * width
+    p = PlaybackPipeline(rate, channels, width, 8000)
+    chunks = [p.process(data[i:i + step]) for i in range(0, len(data), step)]
+    chunks.append(p.flush())
+    samples, _ = master(np.concatenate(chunks), 8000, target_rms=TARGET_RMS)
+    encode_samples(samples, 130)
+
+
+def run_audioop(data, rate, channels, width):
+    step = BLOCK_FRAMES * channels * width
+    state = None
+    for i in range(0, len(data), step):
+        block = data[i:i + step]
+        if width != 2:
+            if width == 1:
+                block = audioop.bias(block, 1, -128)
+            block = audioop.lin2lin(block, width, 2)
+        if channels != 1:
+            block = audioop.tomono(block, 2, 0.5, 0.5)
+        if rate != 8000:
+            block, state = audioop.ratecv(block, 2, 1, rate, 8000, state)
+        avg = audioop.avg(block, 2)
+        if avg:
+            block = audioop.bias(block, 2, -avg)
+        rms = audioop.rms(block, 2)
+        if rms:
+            block = audioop.mul(block, 2, min(3.0, max(0.3, TARGET_RMS / rms)))
+        audioop.lin2ulaw(block, 2)
+
+
+def realtime_factor(fn, data, rate, channels, width, seconds, repeat=3):
+    best = min(_timed(fn, data, rate, channels, width) for _ in range(repeat))
+    return seconds / best
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    print(f"{seconds:.0f} s de audio por caso -> μ-law 8 kHz")
+    print(f"{'entrada':<26}{'dsp (x RT)':>12}{'audioop (x RT)':>16}")
+    for name, rate, channels, width in CASES:
+        data = synth(rate, channels, width, seconds)
+        ours = realtime_factor(run_pipeline, data, rate, channels, width, seconds)
+        ref = (f"{realtime_factor(run_audioop, data, rate, channels, width, seconds):16.0f}"
+               if audioop else f"{'-':>16}")
+        print(f"{name:<26}{ours:12.0f}{ref}")
+
+
+if __name__ == "__main__":
+    main()
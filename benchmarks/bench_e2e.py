@@ -0,0 +1,151 @@
+"""Benchmark de punta a punta contra el módem simulado (modem_sim).
+
+Lanza run.py como subproceso con PORT apuntando al pty de SimModem, hace
+sonar la línea y mide, por códec:
+- ring->ATA: desde el RING que completa MAX_RINGS hasta que llega ATA
+- ATA->audio: desde ATA hasta el primer byte de audio dentro de VTX
+- jitter: atraso de cada bloque respecto del ritmo ideal (umbral 20 ms)
+- CPU de run.py durante la llamada (utime+stime de /proc, solo Linux)
+
+Uso: python benchmarks/bench_e2e.py [códecs separados por coma] [llamadas]
+  ej: python benchmarks/bench_e2e.py 130,129,128,132 3
+"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modem_sim import SimModem  # noqa: E402
+from voice_codecs import bytes_per_sample  # noqa: E402
+
+RATE = 8000
+MAX_RINGS = 2
+RING_INTERVAL = 1.5  # más que RING_DEBOUNCE de call_session
+READY_TIMEOUT = 120.0  # la primera compilación del prompt puede tardar
+
+
+def process_cpu(pid: int):
+    """Segundos de CPU (usuario + sistema) del proceso, o None."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RunPy:
+    """run.py en un subproceso conectado al módem simulado."""
+
+    def __init__(self, port: str, codec: int, workdir: str):
+        env = dict(
+            os.environ,
+            PORT=port,
+            NUMBER="59800000000",
+            LINES="",
+            MAX_RINGS=str(MAX_RINGS),
+            VSM_CODEC=str(codec),
+            AUTO_VSM="0",
+            SAMPLE_RATE=str(RATE),
+            PLAY_AUDIO="1",
+            PLAY_ONLY="0",
+            WEBHOOK_URL="",
+            MODEM_PROFILE_FILE="",
+            PROMPT_CACHE_DIR="",
+            LOG_FILE=os.path.join(workdir, "calls_log.csv"),
+            CALL_STORE_FILE=os.path.join(workdir, "calls.db"),
+        )
+        self.bytes_per_sample = bytes_per_sample(codec)
+        self.ready = threading.Event()
+        self.output = []
+        self.proc = subprocess.Popen(
+            [sys.executable, "-u", os.path.join(ROOT, "run.py")],
+            cwd=ROOT, env=env, text=True,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        )
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for text in self.proc.stdout:
+            self.output.append(text)
+            if "Esperando llamadas" in text:
+                self.ready.set()
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGINT)
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+def run_call(sim: SimModem, child: RunPy, index: int) -> dict:
+    cpu0 = process_cpu(child.proc.pid)
+    t0 = time.monotonic()
+    last_ring = sim.ring(MAX_RINGS, number=f"09912345{index}", interval=RING_INTERVAL)
+    hangup = sim.wait_for("cmd", "ATH", after=t0, timeout=60)
+    cpu1 = process_cpu(child.proc.pid)
+    ata = sim.find("cmd", "ATA", after=t0)
+    capture = sim.captures[-1] if sim.captures and sim.captures[-1].started >= t0 else None
+    result = {"answered": hangup is not None}
+    if ata is not None and last_ring is not None:
+        result["ring_to_ata_ms"] = (ata - last_ring) * 1000.0
+    if capture is not None and capture.first_byte is not None and ata is not None:
+        result["ata_to_audio_ms"] = (capture.first_byte - ata) * 1000.0
+    if capture is not None:
+        result.update(capture.timing(RATE * child.bytes_per_sample))
+    if cpu0 is not None and cpu1 is not None:
+        result["cpu_s"] = cpu1 - cpu0
+    return result
+
+
+def bench_codec(codec: int, calls: int):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir, SimModem() as sim:
+        child = RunPy(sim.port, codec, workdir)
+        try:
+            if not child.ready.wait(READY_TIMEOUT):
+                print(f"codec {codec}: run.py no arrancó\n" + "".join(child.output[-20:]))
+                return results
+            for i in range(calls):
+                results.append(run_call(sim, child, i))
+                time.sleep(0.5)
+        finally:
+            child.stop()
+    return results
+
+
+def fmt(values, unit=""):
+    values = [v for v in values if v is not None]
+    if not values:
+        return "-"
+    return f"{sum(values) / len(values):8.1f}{unit} (peor {max(values):.1f})"
+
+
+def main():
+    codecs = [int(c) for c in (sys.argv[1] if len(sys.argv) > 1 else "130,129,128,132").split(",")]
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    print(f"{calls} llamada(s) por códec, MAX_RINGS={MAX_RINGS}, timbre cada {RING_INTERVAL} s")
+    for codec in codecs:
+        results = bench_codec(codec, calls)
+        answered = sum(1 for r in results if r.get("answered"))
+        print(f"\ncódec {codec}: {answered}/{len(results)} llamadas completas")
+        print(f"  ring->ATA      {fmt([r.get('ring_to_ata_ms') for r in results], ' ms')}")
+        print(f"  ATA->audio     {fmt([r.get('ata_to_audio_ms') for r in results], ' ms')}")
+        print(f"  atraso máx.    {fmt([r.get('max_late_ms') for r in results], ' ms')}")
+        print(f"  atraso p99     {fmt([r.get('p99_late_ms') for r in results], ' ms')}")
+        print(f"  bloques >20ms  {fmt([r.get('late_chunks') for r in results])}")
+        print(f"  audio/pared    {fmt([r.get('audio_s') for r in results], ' s')} / "
+              f"{fmt([r.get('wall_s') for r in results], ' s')}")
+        print(f"  CPU por llamada{fmt([r.get('cpu_s') for r in results], ' s')}")
+
+
+if __name__ == "__main__":
+    main()
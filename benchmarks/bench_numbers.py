@@ -0,0 +1,111 @@
+"""Normalización de Caller ID: normalize_phone_number anterior vs phone_numbers.
+
+Genera un corpus de strings NMBR crudos (con troncal, con 00, con '+', con
+separadores, privados/no disponibles) donde una parte de los llamantes se
+repite, y mide el costo por número de la función original (re.sub + prefijos)
+contra PhoneNormalizer con su memo LRU, en frío y en caliente. También compara
+la limpieza de no imprimibles de cada línea del módem.
+
+Uso: python benchmarks/bench_numbers.py [tamaño_del_corpus]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modem_at import clean_line  # noqa: E402
+from phone_numbers import PhoneNormalizer, plan_for  # noqa: E402
+
+COUNTRY_CODE = "598"
+TRUNK_PREFIX = "0"
+
+
+def legacy_normalize(raw_number: str) -> str:
+    """Réplica de la normalize_phone_number original de run.py."""
+    if not raw_number:
+        return raw_number
+    value = re.sub(r"[^0-9+]", "", raw_number.strip())
+    if value.startswith("+"):
+        return value
+    if TRUNK_PREFIX and value.startswith(TRUNK_PREFIX):
+        value = value[len(TRUNK_PREFIX):]
+    if COUNTRY_CODE and not value.startswith(COUNTRY_CODE):
+        return f"+{COUNTRY_CODE}{value}"
+    return f"+{value}"
+
+
+def random_number(rng: random.Random) -> str:
+    national = rng.choice(("9", "2", "4")) + "".join(rng.choice("0123456789") for _ in range(7))
+    style = rng.random()
+    if style < 0.4:
+        return "0" + national
+    if style < 0.55:
+        return national
+    if style < 0.7:
+        return "+598" + national
+    if style < 0.8:
+        return "00598" + national
+    if style < 0.9:
+        return f"0{national[:2]} {national[2:5]} {national[5:]}"
+    return "0054911" + "".join(rng.choice("0123456789") for _ in range(8))
+
+
+def build_corpus(size: int, repeat: float = 0.6, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    regulars = [random_number(rng) for _ in range(2000)]
+    corpus = []
+    for _ in range(size):
+        r = rng.random()
+        if r < 0.03:
+            corpus.append(rng.choice(("P", "O", "PRIVATE")))
+        elif r < repeat:
+            corpus.append(rng.choice(regulars))
+        else:
+            corpus.append(random_number(rng))
+    return corpus, regulars
+
+
+def measure(fn, corpus) -> float:
+    start = time.perf_counter()
+    for raw in corpus:
+        fn(raw)
+    return (time.perf_counter() - start) / len(corpus) * 1e9
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    corpus, regulars = build_corpus(size)
+    regular_set = set(regulars)
+    repeats = [raw for raw in corpus if raw in regular_set]
+    print(f"Corpus: {size} NMBR, {len(set(corpus))} distintos")
+
+    legacy_ns = measure(legacy_normalize, corpus)
+    normalizer = PhoneNormalizer(plan_for(COUNTRY_CODE, TRUNK_PREFIX))
+    cold_ns = measure(normalizer.normalize, corpus)
+    warm_ns = measure(normalizer.normalize, corpus)
+    info = normalizer.cache_info()
+    legacy_repeat_ns = measure(legacy_normalize, repeats)
+    repeat_ns = measure(normalizer.normalize, repeats)
+    print(f"  normalize_phone_number anterior  {legacy_ns:7.0f} ns/número")
+    print(f"  PhoneNormalizer (frío)           {cold_ns:7.0f} ns/número")
+    print(f"  PhoneNormalizer (caliente)       {warm_ns:7.0f} ns/número  "
+          f"(memo {info.hits} hits / {info.misses} misses)")
+    print(f"  solo llamantes repetidos ({len(regulars)} números): anterior {legacy_repeat_ns:.0f} ns, "
+          f"PhoneNormalizer {repeat_ns:.0f} ns")
+
+    changed = sum(1 for raw in set(corpus) if legacy_normalize(raw) != normalizer.normalize(raw))
+    print(f"  resultados distintos a la versión anterior: {changed} de {len(set(corpus))} "
+          "(00/internacionales, privados y largos ambiguos)")
+
+    lines = ["RING", "NMBR = 099123456", "DATE = 0101", "\x10R", "OK", "TIME = 1200"] * (size // 6)
+    unprintable = re.compile(r'[^\x20-\x7E]')
+    regex_ns = measure(lambda t: unprintable.sub('', t), lines)
+    clean_ns = measure(clean_line, lines)
+    print(f"\nLimpieza de líneas: re.sub {regex_ns:5.0f} ns/línea, clean_line {clean_ns:5.0f} ns/línea")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Micro-benchmark del camino de transmisión VTX.
+
+Compara el bucle anterior de play_audio (acumular con `+=`, re-cortar la
+cola y escapar DLE por frame) contra FrameWriter sobre frames precompilados.
+Escribe a un sumidero nulo y sin dormir, para medir solo CPU y memoria.
+
+Uso: python benchmarks/bench_tx.py [segundos_de_audio]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_cache import FRAME_MS, escape_dle, frame_payload  # noqa: E402
+from tx_writer import FrameWriter  # noqa: E402
+
+RATE = 8000
+
+
+class NullSink:
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return len(data)
+
+
+def legacy_loop(payload: bytes, sink):
+    """Réplica del bucle original de play_audio (sin el sleep)."""
+    frame_bytes = max(int(RATE * 0.02), 1)
+    out_buffer = b''
+    for i in range(0, len(payload), 1024):
+        out_buffer += payload[i:i + 1024]
+        while len(out_buffer) >= frame_bytes:
+            chunk = out_buffer[:frame_bytes]
+            out_buffer = out_buffer[frame_bytes:]
+            sink.write(escape_dle(chunk))
+    if out_buffer:
+        sink.write(escape_dle(out_buffer))
+
+
+def framed_loop(frames, sink):
+    FrameWriter(sink, sleep=lambda _: None).write_frames(frames)
+
+
+def measure(name, fn, audio_seconds, repeat=5):
+    best = None
+    for _ in range(repeat):
+        sink = NullSink()
+        start = time.process_time()
+        fn(sink)
+        cpu = time.process_time() - start
+        best = cpu if best is None else min(best, cpu)
+    tracemalloc.start()
+    fn(NullSink())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<28} {best / audio_seconds * 1e6:10.1f} µs CPU/s audio"
+          f"   pico {peak / 1024:8.1f} KiB")
+
+
+def main():
+    audio_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    rng = random.Random(1234)
+    payload = bytes(rng.randrange(256) for _ in range(int(RATE * audio_seconds)))
+    frames = frame_payload(payload, RATE)
+    print(f"{audio_seconds:.0f} s de audio, {len(frames)} frames de {FRAME_MS} ms")
+    measure("legacy (+= / slice / escape)", lambda s: legacy_loop(payload, s), audio_seconds)
+    measure("FrameWriter (precompilado)", lambda s: framed_loop(frames, s), audio_seconds)
+
+
+if __name__ == "__main__":
+    main()
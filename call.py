@@ -1,35 +1,45 @@
-import serial
-import wave
-import time
+"""Encola una devolución de llamada en el dialer de run.py.
 
-def main():
-    # Inicializar el puerto serial
-    phone = serial.Serial('/dev/ttyACM0', 112500, timeout=5)
-    
-    # Configurar módem para transmisión de voz
-    phone.write('AT\r\n'.encode())
-    phone.write('AT+FCLASS=8\r\n'.encode())   # Modo voz
-    phone.write('AT+VSM=0,8000\r\n'.encode()) # Formato PCM 8kHz
-    
-    # Abrir archivo de audio
-    music = wave.open('voices/busy_lines.wav', 'rb')
+Uso: python call.py NÚMERO [AUDIO]
+
+run.py tiene que estar corriendo con DIALER=1 y DIALER_API_PORT configurado;
+la llamada la hace la primera línea libre, con reintentos si da ocupado o no
+contesta. Sin argumentos lista las devoluciones pendientes.
+"""
+import os
+import sys
+
+import requests
+from dotenv import load_dotenv
 
-    # Marcar el número
-    number = '099837840'
-    command = f'ATDT{number}\r\n'
-    phone.write(command.encode())
-    time.sleep(10)  # Esperar a que se conecte
 
-    # Iniciar transmisión de voz
-    phone.write('AT+VTX\r\n'.encode())
-    
-    cont = True
-    while cont:
-        frame = music.readframes(1024)
-        if not frame:  # readframes devuelve bytes vacíos al final
-            cont = False
-        else:
-            phone.write(frame)  # enviar datos al módem
+def main():
+    load_dotenv()
+    port = int(os.getenv("DIALER_API_PORT", "0"))
+    addr = os.getenv("DIALER_API_ADDR", "127.0.0.1")
+    if not port:
+        print("❌ DIALER_API_PORT no está configurado (ver example.env)")
+        return 1
+    url = f"http://{addr}:{port}/callbacks"
+    try:
+        if len(sys.argv) < 2:
+            for job in requests.get(url, timeout=5).json():
+                print(f"{job['id']}  {job['number']}  intentos={job['attempts']}  {job['last_result']}")
+            return 0
+        body = {"number": sys.argv[1]}
+        if len(sys.argv) > 2:
+            body["audio_file"] = sys.argv[2]
+        response = requests.post(url, json=body, timeout=5)
+    except requests.RequestException as e:
+        print(f"❌ No se pudo contactar al dialer en {url}: {e}")
+        return 1
+    if response.status_code != 202:
+        print(f"❌ {response.status_code}: {response.text}")
+        return 1
+    job = response.json()
+    print(f"📋 Devolución {job['id']} encolada para {job['number']}")
+    return 0
+
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""Registro estructurado de llamadas con escritura en búfer y rotación.
+
+El archivo queda abierto durante toda la ejecución: cada evento es una
+escritura en memoria y un hilo lo vuelca a disco (flush + fsync) cada
+`flush_interval` segundos, o antes si se acumulan `flush_every` registros.
+Al superar `max_bytes` o cambiar el día se renombra el archivo con la fecha y
+se comprime con gzip en segundo plano, conservando `backups` archivos.
+
+Formato CSV (con encabezado) o JSON Lines, con el esquema de CALL_FIELDS.
+"""
+import csv
+import glob
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime
+
+CALL_FIELDS = (
+    "timestamp",          # ISO local del evento
+    "call_id",
+    "line",               # puerto del módem
+    "local_number",
+    "number",             # número entrante (E.164 o 'unknown')
+    "event",              # answered_with_audio, hangup_after_webhook, busy, ...
+    "rings",
+    "answer_latency_ms",  # primer RING -> contestar
+    "playback_ms",        # inicio de VTX -> fin del audio (o colgar)
+    "webhook",            # queued, spooled, dropped, disabled
+    "caller_name",        # NAME del Caller ID, si vino
+    "voicemail",          # ruta del mensaje grabado, si hubo
+    "menu_option",        # dígito de MENU elegido, si hubo
+    "route",              # regla de ROUTES aplicada (vacío: sin reglas)
+)
+
+# Sufijo de los archivos rotados: .AAAAMMDD-HHMMSS[-n][.legacy].gz
+_ARCHIVE_RE = re.compile(r"\.(\d{8}-\d{6})(?:-(\d+))?(?:\.legacy)?\.gz$")
+
+
+def _archive_order(path: str) -> tuple:
+    """Orden cronológico de un archivo rotado (fecha y luego -n, numérico)."""
+    match = _ARCHIVE_RE.search(path)
+    return match.group(1), int(match.group(2) or 0)
+
+
+def session_record(session, line: str, local_number: str, event: str,
+                   webhook: str = "") -> dict:
+    """Arma un registro a partir de una CallSession."""
+    t = session.times
+    record = {
+        "timestamp": datetime.now().isoformat(),
+        "call_id": session.call_id or "",
+        "line": line,
+        "local_number": local_number,
+        "number": session.incoming_number,
+        "event": event,
+        "rings": session.ring_count,
+        "answer_latency_ms": "",
+        "playback_ms": "",
+        "webhook": webhook,
+        "caller_name": session.caller.record.name,
+        "voicemail": session.recording_path or "",
+        "menu_option": session.menu_option or "",
+        "route": session.route or "",
+    }
+    if t.first_ring is not None and t.answering is not None:
+        record["answer_latency_ms"] = round((t.answering - t.first_ring) * 1000)
+    playback_end = t.recording if t.recording is not None else t.hung_up
+    if t.playing is not None and playback_end is not None:
+        record["playback_ms"] = round((playback_end - t.playing) * 1000)
+    return record
+
+
+class CallLog:
+    """Escritor de registros de llamada thread-safe con volcado periódico."""
+
+    def __init__(self, path: str, fmt: str = "csv", max_bytes: int = 10 * 1024 * 1024,
+                 rotate_daily: bool = True, backups: int = 30,
+                 flush_interval: float = 1.0, flush_every: int = 100,
+                 buffer_size: int = 64 * 1024):
+        self.path = path
+        self.fmt = "jsonl" if fmt in ("json", "jsonl") else "csv"
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.backups = max(int(backups), 0)
+        self.flush_interval = flush_interval
+        self.flush_every = max(int(flush_every), 1)
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._day = None
+        self._size = 0
+        self._pending = 0
+        # Las filas CSV se arman en memoria para conocer su tamaño sin tell()
+        self._buf = io.StringIO()
+        self._csv = csv.writer(self._buf)
+
+    # -----------------------------
+    # Archivo
+    # -----------------------------
+    def _csv_line(self, row) -> str:
+        self._buf.seek(0)
+        self._buf.truncate()
+        self._csv.writerow(row)
+        return self._buf.getvalue()
+
+    def _header_line(self) -> str:
+        return self._csv_line(CALL_FIELDS)
+
+    def _compatible(self) -> bool:
+        """True si el archivo existente tiene el esquema actual (o está vacío)."""
+        try:
+            with open(self.path, newline="", encoding="utf-8", errors="replace") as f:
+                first = f.readline()
+        except FileNotFoundError:
+            return True
+        if not first:
+            return True
+        if self.fmt == "csv":
+            return first.replace("\r\n", "\n") == self._header_line().replace("\r\n", "\n")
+        try:
+            return set(json.loads(first)) == set(CALL_FIELDS)
+        except ValueError:
+            return False
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        if not self._compatible():
+            # Log con el formato anterior (sin encabezado): se archiva aparte
+            self._archive(suffix="legacy")
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, "a", newline="", encoding="utf-8",
+                          buffering=self.buffer_size)
+        self._size = os.path.getsize(self.path)
+        if new_file and self.fmt == "csv":
+            self._append(self._header_line())
+        self._day = datetime.now().date()
+
+    def _close(self):
+        if self._file:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def _sync(self):
+        if self._file and self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def _archive(self, suffix: str = None):
+        """Renombra el archivo actual y lo comprime en segundo plano."""
+        if not os.path.exists(self.path):
+            return
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        target = f"{self.path}.{stamp}" + (f".{suffix}" if suffix else "")
+        n = 1
+        while os.path.exists(target) or os.path.exists(f"{target}.gz"):
+            target = f"{self.path}.{stamp}-{n}" + (f".{suffix}" if suffix else "")
+            n += 1
+        os.replace(self.path, target)
+        threading.Thread(target=self._compress, args=(target,),
+                         name="call-log-gzip", daemon=True).start()
+
+    def _compress(self, path: str):
+        try:
+            with open(path, "rb") as src, gzip.open(f"{path}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+        except Exception as e:
+            print(f"⚠️ No se pudo comprimir {path}: {e}")
+        self._prune()
+
+    def _prune(self):
+        if not self.backups:
+            return
+        archives = sorted((p for p in glob.glob(f"{glob.escape(self.path)}.*.gz")
+                           if _ARCHIVE_RE.search(p)), key=_archive_order)
+        for old in archives[:-self.backups]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def _should_rotate(self) -> bool:
+        if self.rotate_daily and datetime.now().date() != self._day:
+            return True
+        return bool(self.max_bytes) and self._size >= self.max_bytes
+
+    def _append(self, text: str):
+        self._file.write(text)
+        # Bytes en disco (UTF-8), no caracteres: los nombres con acentos también cuentan
+        self._size += len(text) if text.isascii() else len(text.encode("utf-8"))
+
+    # -----------------------------
+    # API
+    # -----------------------------
+    def write(self, record: dict):
+        """Agrega un registro (solo memoria; el volcado a disco es periódico)."""
+        with self._lock:
+            if self._file is None:
+                self._open()
+            elif self._should_rotate():
+                self._close()
+                self._archive()
+                self._open()
+            if self.fmt == "csv":
+                self._append(self._csv_line([record.get(name, "") for name in CALL_FIELDS]))
+            else:
+                self._append(json.dumps({name: record.get(name) for name in CALL_FIELDS},
+                                        ensure_ascii=False) + "\n")
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._sync()
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="call-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(2)
+        with self._lock:
+            self._close()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ No se pudo volcar el log de llamadas: {e}")
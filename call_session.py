@@ -0,0 +1,192 @@
+"""Máquina de estados de una llamada entrante (una instancia por línea).
+
+    idle -> ringing -> answering -> playing [-> recording] -> hung_up -> idle
+
+`feed()` recibe las líneas del módem ya limpias (Caller ID, RING/R, BUSY,
+NO CARRIER) y devuelve la acción a tomar; `expire()` se llama periódicamente
+y descarta la llamada si el llamante cortó entre timbres (no hay resultado
+del módem para eso, solo deja de sonar). Cada transición guarda su instante en
+reloj monotónico, así que una transcripción grabada se puede reproducir con un
+reloj falso.
+"""
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from caller_id import CallerIdDecoder
+
+IDLE = "idle"
+RINGING = "ringing"
+ANSWERING = "answering"
+PLAYING = "playing"
+RECORDING = "recording"
+HUNG_UP = "hung_up"
+
+# Acciones que devuelve feed()
+ACTION_ANSWER = "answer"  # se alcanzó MAX_RINGS
+ACTION_BUSY = "busy"      # ocupado / corte durante el timbrado
+ACTION_CALLER_ID = "caller_id"  # se conoció (o cambió) el número del llamante
+
+# Cadencia típica: 1-2 s de timbre cada 4-6 s. Los RING que llegan más juntos
+# que RING_DEBOUNCE pertenecen al mismo ciclo (cadencias dobles, DLE R repetidos).
+RING_DEBOUNCE = 1.0
+# Sin timbre durante más de RING_GAP_TIMEOUT: el llamante cortó
+RING_GAP_TIMEOUT = 8.0
+# NMBR sin ningún RING posterior
+CALLER_ID_TIMEOUT = 10.0
+
+
+@dataclass
+class CallTimes:
+    """Instantes (time.monotonic) de cada transición; None si no ocurrió."""
+    caller_id: float = None
+    first_ring: float = None
+    last_ring: float = None
+    answering: float = None
+    playing: float = None
+    recording: float = None
+    hung_up: float = None
+
+
+@dataclass
+class CallSession:
+    """Estado de la llamada en curso de una línea."""
+    max_rings: int = 3
+    ring_debounce: float = RING_DEBOUNCE
+    ring_gap_timeout: float = RING_GAP_TIMEOUT
+    caller_id_timeout: float = CALLER_ID_TIMEOUT
+    clock: object = time.monotonic
+    state: str = IDLE
+    call_id: str = None
+    incoming_number: str = None
+    ring_count: int = 0
+    times: CallTimes = field(default_factory=CallTimes)
+    hangup_reason: str = None
+    recording_path: str = None
+    menu_option: str = None  # dígito de MENU elegido
+    route: str = None        # regla de ROUTES que eligió el prompt
+    caller: CallerIdDecoder = field(default_factory=CallerIdDecoder)
+
+    @property
+    def call_active(self) -> bool:
+        return self.state != IDLE or self.incoming_number is not None
+
+    def _now(self, now):
+        return self.clock() if now is None else now
+
+    def _ensure_id(self):
+        if self.call_id is None:
+            self.call_id = uuid.uuid4().hex[:12]
+
+    # -----------------------------
+    # Eventos del módem
+    # -----------------------------
+    def on_caller_id(self, number: str, now: float = None):
+        now = self._now(now)
+        self._ensure_id()
+        self.incoming_number = number
+        if self.times.caller_id is None:
+            self.times.caller_id = now
+
+    def on_ring(self, now: float = None) -> bool:
+        """Registra un timbre. Devuelve True cuando hay que contestar."""
+        now = self._now(now)
+        if self.state not in (IDLE, RINGING):
+            return False
+        last = self.times.last_ring
+        if last is not None and now - last < self.ring_debounce:
+            # Mismo ciclo de cadencia: no es un timbre nuevo
+            self.times.last_ring = now
+            return False
+        if self.state == IDLE:
+            self._ensure_id()
+            self.state = RINGING
+            self.times.first_ring = now
+            if not self.incoming_number:
+                self.incoming_number = "unknown"
+        self.times.last_ring = now
+        self.ring_count += 1
+        return self.ring_count >= self.max_rings
+
+    def feed(self, text: str, now: float = None, normalize=None):
+        """Procesa una línea del módem y devuelve ACTION_* o None."""
+        now = self._now(now)
+        if self.caller.feed(text):
+            # DATE/TIME/NAME/... o un trozo de mensaje crudo: se acumulan en
+            # self.caller.record; el número se toma apenas está completo.
+            raw = self.caller.record.caller
+            if not raw:
+                return None
+            number = normalize(raw) if normalize else raw
+            if number == self.incoming_number:
+                return None
+            self.on_caller_id(number, now)
+            return ACTION_CALLER_ID
+        if "RING" in text or text == "R":
+            return ACTION_ANSWER if self.on_ring(now) else None
+        if "BUSY" in text or "NO CARRIER" in text:
+            if self.incoming_number:
+                self.hang_up("busy", now)
+                return ACTION_BUSY
+        return None
+
+    # -----------------------------
+    # Transiciones de la respuesta
+    # -----------------------------
+    def answering(self, now: float = None):
+        self.state = ANSWERING
+        self.times.answering = self._now(now)
+
+    def playing(self, now: float = None):
+        self.state = PLAYING
+        self.times.playing = self._now(now)
+
+    def recording(self, path: str, now: float = None):
+        self.state = RECORDING
+        self.recording_path = path
+        self.times.recording = self._now(now)
+
+    def hang_up(self, reason: str = "", now: float = None):
+        self.state = HUNG_UP
+        self.hangup_reason = reason
+        self.times.hung_up = self._now(now)
+
+    def expire(self, now: float = None) -> bool:
+        """Descarta una llamada que dejó de sonar. Devuelve True si la descartó."""
+        now = self._now(now)
+        if self.state == RINGING:
+            if now - self.times.last_ring > self.ring_gap_timeout:
+                self.hang_up("ring_timeout", now)
+                return True
+        elif self.state == IDLE and self.times.caller_id is not None:
+            if now - self.times.caller_id > self.caller_id_timeout:
+                self.hang_up("caller_id_timeout", now)
+                return True
+        return False
+
+    def summary(self) -> dict:
+        """Duraciones (s) relativas al primer evento de la llamada."""
+        t = self.times
+        starts = [x for x in (t.caller_id, t.first_ring) if x is not None]
+        origin = min(starts) if starts else None
+        out = {"id": self.call_id, "state": self.state, "number": self.incoming_number,
+               "rings": self.ring_count, "reason": self.hangup_reason}
+        if origin is not None:
+            for name in ("caller_id", "first_ring", "answering", "playing", "recording", "hung_up"):
+                value = getattr(t, name)
+                if value is not None:
+                    out[name] = round(value - origin, 3)
+        return out
+
+    def reset(self):
+        """Vuelve a idle y descarta todo lo de la llamada anterior."""
+        self.state = IDLE
+        self.call_id = None
+        self.incoming_number = None
+        self.ring_count = 0
+        self.times = CallTimes()
+        self.hangup_reason = None
+        self.recording_path = None
+        self.menu_option = None
+        self.route = None
+        self.caller.reset()
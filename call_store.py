@@ -0,0 +1,146 @@
+"""Historial de llamadas en SQLite para detectar llamantes repetidos.
+
+Cada registro de CallLog también se inserta en una tabla `calls` (modo WAL,
+índice por número normalizado + instante), y los llamantes de la última
+`hot_window` quedan en memoria: la pregunta "¿este número llamó en la última
+hora?" se responde sin tocar disco, y ventanas más largas usan el índice.
+"""
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    call_id TEXT,
+    line TEXT,
+    local_number TEXT,
+    number TEXT,
+    event TEXT,
+    rings INTEGER,
+    answer_latency_ms INTEGER,
+    playback_ms INTEGER,
+    webhook TEXT
+);
+CREATE INDEX IF NOT EXISTS calls_number_ts ON calls (number, ts);
+CREATE INDEX IF NOT EXISTS calls_ts ON calls (ts);
+"""
+
+# Números que no identifican a nadie: nunca cuentan como repetidos
+ANONYMOUS = ("", "unknown", "private", "unavailable")
+# Eventos de llamadas salientes (devoluciones del dialer): no cuentan como "ya llamó"
+OUTBOUND_PREFIX = "callback_"
+# Cada cuántas inserciones se limpia la caché de llamantes recientes
+SWEEP_EVERY = 1000
+
+
+def _epoch(timestamp: str) -> float:
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def _int_or_none(value):
+    return value if isinstance(value, int) else None
+
+
+class CallStore:
+    """Tabla de llamadas con caché caliente de llamantes recientes."""
+
+    def __init__(self, path: str, hot_window: float = 3600.0):
+        self.path = path
+        self.hot_window = hot_window
+        self._lock = threading.Lock()
+        self._recent = {}  # número -> deque de instantes (epoch) dentro de hot_window
+        self._adds = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._load_recent()
+
+    def _load_recent(self):
+        since = time.time() - self.hot_window
+        rows = self._conn.execute(
+            "SELECT number, ts FROM calls WHERE ts >= ? AND event NOT LIKE ? ORDER BY ts",
+            (since, f"{OUTBOUND_PREFIX}%"))
+        for number, ts in rows:
+            if number not in ANONYMOUS:
+                self._recent.setdefault(number, deque()).append(ts)
+
+    def _trim(self, times: deque, now: float):
+        limit = now - self.hot_window
+        while times and times[0] < limit:
+            times.popleft()
+
+    def _sweep(self, now: float):
+        """Quita de la caché los números que no llamaron dentro de hot_window."""
+        for number in list(self._recent):
+            times = self._recent[number]
+            self._trim(times, now)
+            if not times:
+                del self._recent[number]
+
+    # -----------------------------
+    # API
+    # -----------------------------
+    def add(self, record: dict):
+        """Inserta un registro con el esquema de call_log.CALL_FIELDS."""
+        ts = _epoch(record.get("timestamp"))
+        number = record.get("number") or ""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO calls (ts, call_id, line, local_number, number, event, rings,"
+                " answer_latency_ms, playback_ms, webhook) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ts, record.get("call_id"), record.get("line"), record.get("local_number"),
+                 number, record.get("event"), _int_or_none(record.get("rings")),
+                 _int_or_none(record.get("answer_latency_ms")),
+                 _int_or_none(record.get("playback_ms")), record.get("webhook")),
+            )
+            inbound = not (record.get("event") or "").startswith(OUTBOUND_PREFIX)
+            if inbound and number not in ANONYMOUS:
+                times = self._recent.setdefault(number, deque())
+                times.append(ts)
+                self._trim(times, ts)
+            self._adds += 1
+            if self._adds % SWEEP_EVERY == 0:
+                self._sweep(ts)
+
+    def count_recent(self, number: str, window: float, now: float = None) -> int:
+        """Llamadas entrantes de `number` en los últimos `window` segundos."""
+        if not number or number in ANONYMOUS:
+            return 0
+        now = time.time() if now is None else now
+        since = now - window
+        with self._lock:
+            if window <= self.hot_window:
+                times = self._recent.get(number)
+                if not times:
+                    return 0
+                self._trim(times, now)
+                if not times:
+                    del self._recent[number]
+                    return 0
+                return sum(1 for ts in times if ts >= since)
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM calls WHERE number = ? AND ts >= ? AND event NOT LIKE ?",
+                (number, since, f"{OUTBOUND_PREFIX}%")).fetchone()
+        return row[0]
+
+    def last_call(self, number: str):
+        """Último registro de `number` como dict, o None."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT * FROM calls WHERE number = ? ORDER BY ts DESC LIMIT 1", (number,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
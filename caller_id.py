@@ -0,0 +1,243 @@
+"""Decodificación de Caller ID (Bellcore GR-30 / ETSI EN 300 659).
+
+Los módems entregan el Caller ID de dos formas:
+- formateado (AT+VCID=1): líneas DATE/TIME/NMBR/NAME/DDN_NMBR y MESG para
+  parámetros que el módem no interpreta;
+- sin formatear (AT+VCID=2): el mensaje SDMF/MDMF completo en hexadecimal,
+  a veces partido en varias líneas.
+
+CallerIdDecoder acepta ambas. El hexadecimal pasa por un FrameAssembler que
+trabaja byte a byte (no necesita que el mensaje llegue en una sola línea),
+se resincroniza solo ante basura y solo entrega mensajes con checksum válido.
+Todo se acumula en un CallerId por llamada.
+"""
+import re
+from dataclasses import dataclass
+
+SDMF_TYPE = 0x04
+MDMF_TYPE = 0x80
+MESSAGE_TYPES = (SDMF_TYPE, MDMF_TYPE)
+
+# Parámetros MDMF
+PARAM_DATETIME = 0x01
+PARAM_NUMBER = 0x02
+PARAM_DDN = 0x03
+PARAM_NO_NUMBER = 0x04  # 'O' no disponible, 'P' privado
+PARAM_NAME = 0x07
+PARAM_NO_NAME = 0x08
+
+_FIELD_RE = re.compile(r"^(DATE|TIME|NMBR|NAME|MESG|DDN_NMBR|DDN)\s*=\s*(.*)$")
+_HEX_RE = re.compile(r"^[0-9A-Fa-f\s]+$")
+
+
+@dataclass
+class CallerId:
+    """Datos de Caller ID de una llamada (lo que haya llegado)."""
+    date: str = ""         # MMDD
+    time: str = ""         # HHMM
+    number: str = ""
+    name: str = ""
+    ddn: str = ""          # número discable (DDN), si difiere de number
+    no_number: str = ""    # 'O' / 'P' cuando no hay número
+    no_name: str = ""
+    source: str = ""       # formatted, sdmf o mdmf
+
+    @property
+    def caller(self) -> str:
+        """Número a usar: NMBR, si no DDN, si no el motivo ('P'/'O')."""
+        return self.number or self.ddn or self.no_number
+
+    def merge(self, other: "CallerId"):
+        for name in ("date", "time", "number", "name", "ddn", "no_number", "no_name", "source"):
+            value = getattr(other, name)
+            if value:
+                setattr(self, name, value)
+
+
+def checksum_ok(message: bytes) -> bool:
+    """La suma de todos los bytes (incluido el checksum) es 0 módulo 256."""
+    return (sum(message) & 0xFF) == 0
+
+
+def _text(data: bytes) -> str:
+    return data.decode("ascii", errors="replace").strip()
+
+
+def _apply_param(record: CallerId, ptype: int, data: bytes):
+    if ptype == PARAM_DATETIME and len(data) >= 8:
+        value = _text(data)
+        record.date, record.time = value[:4], value[4:8]
+    elif ptype == PARAM_NUMBER:
+        record.number = _text(data)
+    elif ptype == PARAM_DDN:
+        record.ddn = _text(data)
+    elif ptype == PARAM_NO_NUMBER:
+        record.no_number = _text(data)
+    elif ptype == PARAM_NAME:
+        record.name = _text(data)
+    elif ptype == PARAM_NO_NAME:
+        record.no_name = _text(data)
+
+
+def parse_message(message: bytes) -> CallerId:
+    """Decodifica un mensaje SDMF/MDMF completo (tipo, largo, datos, checksum)."""
+    if len(message) < 3:
+        raise ValueError("mensaje de Caller ID demasiado corto")
+    mtype, length = message[0], message[1]
+    if len(message) != length + 3:
+        raise ValueError(f"largo {len(message)} no coincide con el declarado {length}")
+    if not checksum_ok(message):
+        raise ValueError("checksum inválido")
+    body = message[2:-1]
+    record = CallerId()
+    if mtype == SDMF_TYPE:
+        record.source = "sdmf"
+        record.date, record.time = _text(body[:4]), _text(body[4:8])
+        value = _text(body[8:])
+        if value in ("O", "P"):
+            record.no_number = value
+        else:
+            record.number = value
+    elif mtype == MDMF_TYPE:
+        record.source = "mdmf"
+        i = 0
+        while i + 2 <= len(body):
+            ptype, plen = body[i], body[i + 1]
+            _apply_param(record, ptype, body[i + 2:i + 2 + plen])
+            i += 2 + plen
+    else:
+        raise ValueError(f"tipo de mensaje desconocido 0x{mtype:02X}")
+    return record
+
+
+class FrameAssembler:
+    """Arma mensajes SDMF/MDMF a partir de bytes que llegan en cualquier corte."""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._buf)
+
+    def reset(self):
+        self._buf.clear()
+
+    def feed(self, data: bytes) -> list:
+        """Agrega bytes y devuelve los mensajes completos con checksum válido."""
+        buf = self._buf
+        buf.extend(data)
+        messages = []
+        while buf:
+            if buf[0] not in MESSAGE_TYPES:
+                # Resincronizar en el próximo byte que pueda iniciar un mensaje
+                starts = [i for i in (buf.find(SDMF_TYPE), buf.find(MDMF_TYPE)) if i > 0]
+                if not starts:
+                    buf.clear()
+                    break
+                del buf[:min(starts)]
+                continue
+            if len(buf) < 2:
+                break
+            total = buf[1] + 3
+            if len(buf) < total:
+                break
+            message = bytes(buf[:total])
+            if checksum_ok(message):
+                messages.append(message)
+                del buf[:total]
+            else:
+                del buf[:1]
+        return messages
+
+
+class CallerIdDecoder:
+    """Acumula el Caller ID de una llamada desde líneas formateadas o hex."""
+
+    def __init__(self):
+        self.record = CallerId()
+        self._frames = FrameAssembler()
+        self._nibble = ""
+
+    def reset(self):
+        self.record = CallerId()
+        self._frames.reset()
+        self._nibble = ""
+
+    def feed_bytes(self, data: bytes) -> bool:
+        """Bytes crudos del mensaje; True si se completó al menos uno."""
+        done = False
+        for message in self._frames.feed(data):
+            self.record.merge(parse_message(message))
+            done = True
+        return done
+
+    def feed_hex(self, text: str) -> bool:
+        """Texto hexadecimal en cualquier corte (incluso a mitad de byte)."""
+        digits = self._nibble + "".join(text.split())
+        if len(digits) % 2:
+            digits, self._nibble = digits[:-1], digits[-1]
+        else:
+            self._nibble = ""
+        if not digits:
+            return False
+        return self.feed_bytes(bytes.fromhex(digits))
+
+    def _is_raw_hex(self, text: str) -> bool:
+        if not _HEX_RE.match(text):
+            return False
+        compact = "".join(text.split())
+        if self._frames.pending or self._nibble:
+            return True
+        # Inicio de mensaje: tipo SDMF/MDMF y al menos tipo+largo
+        return len(compact) >= 6 and compact[:2] in ("04", "80")
+
+    def feed(self, text: str) -> bool:
+        """Procesa una línea del módem; True si era parte del Caller ID."""
+        match = _FIELD_RE.match(text)
+        if match:
+            key, value = match.group(1), match.group(2).strip()
+            record = self.record
+            record.source = record.source or "formatted"
+            if key == "DATE":
+                record.date = value
+            elif key == "TIME":
+                record.time = value
+            elif key == "NMBR":
+                if value in ("O", "P"):
+                    record.no_number = value
+                else:
+                    record.number = value
+            elif key == "NAME":
+                if value in ("O", "P"):
+                    record.no_name = value
+                else:
+                    record.name = value
+            elif key in ("DDN_NMBR", "DDN"):
+                record.ddn = value
+            elif key == "MESG":
+                self._feed_mesg(value)
+            return True
+        if self._is_raw_hex(text):
+            try:
+                self.feed_hex(text)
+            except ValueError:
+                self._frames.reset()
+                self._nibble = ""
+            return True
+        return False
+
+    def _feed_mesg(self, value: str):
+        """MESG: mensaje completo en hex o un parámetro MDMF no interpretado."""
+        compact = "".join(value.split())
+        if not _HEX_RE.match(compact or "x") or len(compact) % 2:
+            return
+        data = bytes.fromhex(compact)
+        if data and data[0] in MESSAGE_TYPES and len(data) == data[1] + 3 and checksum_ok(data):
+            self.record.merge(parse_message(data))
+            return
+        i = 0
+        while i + 2 <= len(data):
+            ptype, plen = data[i], data[i + 1]
+            _apply_param(self.record, ptype, data[i + 2:i + 2 + plen])
+            i += 2 + plen
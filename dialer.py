@@ -0,0 +1,208 @@
+"""Devolución de llamadas: cola de trabajos salientes repartida entre módems.
+
+Los trabajos llegan de las llamadas rescatadas (opción "callback" de MENU) o
+de la API local (POST /callbacks). No hay hilo propio: cada línea, cuando
+está ociosa, toma el próximo trabajo listo con `take()` y lo marca en su
+propio hilo, así se usan todos los módems libres sin pisar las entrantes.
+Los intentos fallidos (ocupado, no contesta, ...) se reprograman con backoff
+exponencial; los pendientes se guardan en disco para sobrevivir reinicios.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+
+from metrics import DIALER_PENDING, DIALS
+
+# Resultado de dial() que da el trabajo por terminado
+ANSWERED = "answered"
+
+
+@dataclass
+class CallbackJob:
+    number: str
+    audio_file: str = ""    # vacío: prompt por defecto del dialer
+    source: str = "api"     # api, menu, ...
+    attempts: int = 0
+    not_before: float = 0.0  # epoch del próximo intento
+    last_result: str = ""
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+
+
+class Dialer:
+    """Cola de devoluciones con reintentos; `dial(line, job)` devuelve el resultado."""
+
+    def __init__(self, dial, max_attempts: int = 3, backoff_base: float = 60.0,
+                 backoff_max: float = 900.0, max_pending: int = 1000,
+                 state_file: str = None, normalize=None, clock=time.time):
+        self.dial = dial
+        self.normalize = normalize  # p. ej. a E.164, para deduplicar y registrar igual que las entrantes
+        self.max_attempts = max(int(max_attempts), 1)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_pending = max(int(max_pending), 1)
+        self.state_file = state_file or None
+        self._clock = clock
+        self._heap = []       # (not_before, secuencia, job)
+        self._by_number = {}  # número -> job pendiente o en curso
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._load()
+        DIALER_PENDING.set_function(self.pending)
+
+    # -----------------------------
+    # Persistencia
+    # -----------------------------
+    def _load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file) as f:
+                jobs = [CallbackJob(**item) for item in json.load(f)]
+        except Exception as e:
+            print(f"⚠️ No se pudieron leer las devoluciones pendientes de {self.state_file}: {e}")
+            return
+        for job in jobs:
+            self._push(job)
+        if jobs:
+            print(f"📋 {len(jobs)} devolución(es) pendiente(s) recuperada(s)")
+
+    def _save(self):
+        if not self.state_file:
+            return
+        jobs = [asdict(job) for job in self._by_number.values()]
+        tmp = f"{self.state_file}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(jobs, f)
+            os.replace(tmp, self.state_file)
+        except Exception as e:
+            print(f"⚠️ No se pudieron guardar las devoluciones en {self.state_file}: {e}")
+
+    # -----------------------------
+    # Cola
+    # -----------------------------
+    def _push(self, job: CallbackJob):
+        self._seq += 1
+        heapq.heappush(self._heap, (job.not_before, self._seq, job))
+        self._by_number[job.number] = job
+
+    def submit(self, number: str, audio_file: str = "", source: str = "api"):
+        """Encola una devolución; si el número ya está pendiente devuelve ese trabajo."""
+        if number and self.normalize:
+            number = self.normalize(number)
+        if not number:
+            return None
+        with self._lock:
+            existing = self._by_number.get(number)
+            if existing is not None:
+                return existing
+            if len(self._by_number) >= self.max_pending:
+                print(f"❌ Cola de devoluciones llena; {number} descartado")
+                return None
+            job = CallbackJob(number, audio_file, source, not_before=self._clock())
+            self._push(job)
+            self._save()
+        print(f"📋 Devolución encolada para {number} ({source})")
+        return job
+
+    def take(self):
+        """Próximo trabajo listo (sin bloquear) o None."""
+        with self._lock:
+            if not self._heap or self._heap[0][0] > self._clock():
+                return None
+            return heapq.heappop(self._heap)[2]
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._by_number)
+
+    def jobs(self) -> list:
+        with self._lock:
+            return [asdict(job) for job in self._by_number.values()]
+
+    def run_job(self, line, job: CallbackJob) -> str:
+        """Marca en `line` y reprograma o cierra el trabajo según el resultado."""
+        try:
+            result = self.dial(line, job)
+        except Exception as e:
+            print(f"❌ Error en devolución a {job.number}: {e}")
+            result = "error"
+        DIALS.inc(result=result)
+        job.attempts += 1
+        job.last_result = result
+        with self._lock:
+            if result == ANSWERED or job.attempts >= self.max_attempts:
+                self._by_number.pop(job.number, None)
+                if result != ANSWERED:
+                    print(f"❌ Devolución a {job.number} abandonada tras {job.attempts} intento(s): {result}")
+            else:
+                delay = min(self.backoff_base * (2 ** (job.attempts - 1)), self.backoff_max)
+                job.not_before = self._clock() + delay
+                self._push(job)
+                print(f"🔁 Devolución a {job.number}: {result}; reintento en {delay:.0f} s")
+            self._save()
+        return result
+
+
+# -----------------------------
+# API local
+# -----------------------------
+def start_api(dialer: Dialer, port: int, addr: str = "127.0.0.1", prompts=()):
+    """POST /callbacks {"number": ..., "audio_file": ...} encola; GET /callbacks lista.
+
+    `audio_file` solo puede ser uno de `prompts` (los precompilados al arrancar):
+    cualquier otra ruta se rechaza con 400 en vez de leerse y transcodificarse
+    durante la llamada."""
+    # Solo hace falta con DIALER_API_PORT
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    allowed = {os.path.normpath(p) for p in prompts if p}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/callbacks":
+                self.send_error(404)
+                return
+            self._reply(200, dialer.jobs())
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0] != "/callbacks":
+                self.send_error(404)
+                return
+            try:
+                length = int(self.headers.get("Content-Length", "0"))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                number = str(request["number"]).strip()
+            except Exception:
+                self._reply(400, {"error": "se espera JSON con 'number'"})
+                return
+            audio_file = str(request.get("audio_file") or "")
+            if audio_file and os.path.normpath(audio_file) not in allowed:
+                self._reply(400, {"error": "audio_file debe ser un prompt configurado",
+                                  "prompts": sorted(allowed)})
+                return
+            job = dialer.submit(number, audio_file, "api")
+            if job is None:
+                self._reply(503, {"error": "cola llena o número vacío"})
+                return
+            self._reply(202, asdict(job))
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="dialer-api", daemon=True).start()
+    return server
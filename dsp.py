@@ -0,0 +1,273 @@
+"""Pipeline DSP de reproducción sin audioop (compatible con Python 3.13+).
+
+Convierte bloques de un WAV (cualquier ancho/canales/tasa) a muestras mono
+a la tasa del módem: ancho a 16-bit, mezcla a mono y remuestreo polifásico,
+con estado entre bloques para poder leer el archivo por partes. Luego
+master() analiza el prompt completo (DC, nivel integrado, pico real) y aplica
+una única ganancia más un limitador con look-ahead antes de codificar
+(voice_codecs). Todo vectorizado con NumPy.
+"""
+from dataclasses import dataclass
+from math import gcd, log10
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import voice_codecs
+
+INT16_MAX = 32767.0
+INT16_MIN = -32768.0
+
+
+def to_float(data: bytes, sampwidth: int, pcm8_signed: bool = False) -> np.ndarray:
+    """Bytes PCM little-endian -> float32 en escala int16."""
+    if sampwidth == 1:
+        # WAV PCM 8-bit suele ser unsigned. Si no marcamos PCM8_SIGNED, convertimos a signed.
+        raw = np.frombuffer(data, dtype=np.int8 if pcm8_signed else np.uint8).astype(np.float32)
+        if not pcm8_signed:
+            raw -= 128.0
+        return raw * 256.0
+    if sampwidth == 2:
+        return np.frombuffer(data, dtype="<i2", count=len(data) // 2).astype(np.float32)
+    if sampwidth == 3:
+        b = np.frombuffer(data, dtype=np.uint8, count=len(data) - len(data) % 3).reshape(-1, 3)
+        value = (b[:, 0].astype(np.int32) | (b[:, 1].astype(np.int32) << 8)
+                 | (b[:, 2].astype(np.int8).astype(np.int32) << 16))
+        return (value >> 8).astype(np.float32)
+    if sampwidth == 4:
+        return (np.frombuffer(data, dtype="<i4", count=len(data) // 4) >> 16).astype(np.float32)
+    raise ValueError(f"Ancho de muestra no soportado: {sampwidth}")
+
+
+def to_int16_bytes(samples: np.ndarray) -> bytes:
+    """float32 en escala int16 -> bytes PCM16 little-endian (con saturación)."""
+    return np.clip(np.rint(samples), INT16_MIN, INT16_MAX).astype("<i2").tobytes()
+
+
+def downmix(samples: np.ndarray, channels: int) -> np.ndarray:
+    if channels <= 1:
+        return samples
+    usable = len(samples) - len(samples) % channels
+    # Sumar vistas con stride es bastante más rápido que reshape().mean(axis=1)
+    mono = samples[0:usable:channels].copy()
+    for ch in range(1, channels):
+        mono += samples[ch:usable:channels]
+    mono *= 1.0 / channels
+    return mono
+
+
+def design_lowpass(up: int, down: int, taps_per_phase: int = 24) -> np.ndarray:
+    """FIR pasa-bajos (sinc con ventana Kaiser) para un resampler up/down."""
+    ntaps = taps_per_phase * up
+    # Corte en la menor de las dos Nyquist, expresado a la tasa sobremuestreada
+    cutoff = 0.5 / max(up, down) * 0.92
+    n = np.arange(ntaps) - (ntaps - 1) / 2.0
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(ntaps, 8.0)
+    return (h * up / h.sum()).astype(np.float32)
+
+
+class PolyphaseResampler:
+    """Remuestreo racional in_rate -> out_rate por bloques, con estado."""
+
+    def __init__(self, in_rate: int, out_rate: int, taps: int = 24):
+        g = gcd(int(in_rate), int(out_rate))
+        self.up = int(out_rate) // g
+        self.down = int(in_rate) // g
+        self.passthrough = self.up == self.down
+        if self.passthrough:
+            return
+        # `taps` se cuenta a la tasa menor; al decimar el filtro se alarga en proporción
+        taps_per_phase = taps * -(-self.down // self.up)
+        h = design_lowpass(self.up, self.down, taps_per_phase)
+        self.taps = taps_per_phase
+        # Fase p usa h[p], h[p+up], h[p+2up], ...; invertida para producto con
+        # una ventana ascendente x[n-K+1..n]
+        self.phases = h.reshape(taps_per_phase, self.up).T[:, ::-1].copy()
+        self._history = np.zeros(taps_per_phase - 1, dtype=np.float32)
+        self._pos = 0  # posición de la próxima salida, en 1/up de muestra de entrada
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.passthrough or len(samples) == 0:
+            return samples
+        up, down = self.up, self.down
+        ext = np.concatenate((self._history, samples.astype(np.float32, copy=False)))
+        limit = len(samples) * up
+        count = max(0, -(-(limit - self._pos) // down))
+        out = np.empty(count, dtype=np.float32)
+        # windows[i] = ext[i:i+K] es una vista sin copia. Las salidas j, j+up,
+        # j+2up... comparten fase y avanzan `down` muestras de entrada, así que
+        # cada grupo es un producto matriz-vector sobre filas con stride.
+        windows = sliding_window_view(ext, self.taps)
+        for j in range(min(up, count)):
+            pos = self._pos + down * j
+            start = pos // up
+            n_out = (count - 1 - j) // up + 1
+            if down == 1:
+                # Ventanas consecutivas: es una correlación directa, sin copias
+                segment = ext[start:start + n_out + self.taps - 1]
+                out[j::up] = np.correlate(segment, self.phases[pos % up], "valid")
+                continue
+            rows = windows[start:start + down * (n_out - 1) + 1:down]
+            # Copiar a memoria contigua permite que el producto use BLAS
+            out[j::up] = np.ascontiguousarray(rows) @ self.phases[pos % up]
+        self._pos = int(self._pos + down * count - limit)
+        self._history = ext[len(ext) - (self.taps - 1):]
+        return out
+
+    def flush(self) -> np.ndarray:
+        """Vacía la cola del filtro (media longitud de filtro en ceros)."""
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+        return self.process(np.zeros(self.taps // 2, dtype=np.float32))
+
+
+def sliding_min(values: np.ndarray, width: int) -> np.ndarray:
+    """out[i] = min(values[i:i+width]) en O(n) (van Herk/Gil-Werman)."""
+    width = max(int(width), 1)
+    n = len(values)
+    if width == 1 or n == 0:
+        return values.copy()
+    blocks = -(-(n + width - 1) // width)
+    padded = np.full(blocks * width, np.inf, dtype=values.dtype)
+    padded[:n] = values
+    rows = padded.reshape(blocks, width)
+    prefix = np.minimum.accumulate(rows, axis=1).ravel()
+    suffix = np.minimum.accumulate(rows[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.minimum(suffix[:n], prefix[width - 1:width - 1 + n])
+
+
+def moving_average(values: np.ndarray, width: int) -> np.ndarray:
+    """out[i] = media de values[i-width+1..i] (los primeros usan la ventana disponible)."""
+    width = max(int(width), 1)
+    csum = np.cumsum(values, dtype=np.float64)
+    out = csum.copy()
+    out[width:] = csum[width:] - csum[:-width]
+    counts = np.minimum(np.arange(1, len(values) + 1), width)
+    return (out / counts).astype(np.float32)
+
+
+def gated_rms(samples: np.ndarray, rate: int, block_ms: int = 400, hop_ms: int = 100,
+              relative_gate_db: float = -10.0, absolute_gate_db: float = -70.0) -> float:
+    """Nivel integrado (RMS con compuerta, al estilo EBU R128 sin ponderación K).
+
+    Bloques de 400 ms con 75% de solapamiento; se descartan los bloques bajo
+    -70 dBFS y luego los que quedan 10 dB por debajo de la media, así los
+    silencios del prompt no bajan el nivel medido.
+    """
+    n = len(samples)
+    if n == 0:
+        return 0.0
+    block = max(rate * block_ms // 1000, 1)
+    hop = max(rate * hop_ms // 1000, 1)
+    if n < block:
+        return float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+    csum = np.concatenate(([0.0], np.cumsum(np.square(samples, dtype=np.float64))))
+    starts = np.arange(0, n - block + 1, hop)
+    power = (csum[starts + block] - csum[starts]) / block
+    floor = (INT16_MAX ** 2) * 10 ** (absolute_gate_db / 10)
+    gated = power[power > floor]
+    if len(gated) == 0:
+        return 0.0
+    gated = gated[gated > gated.mean() * 10 ** (relative_gate_db / 10)]
+    return float(np.sqrt(gated.mean()))
+
+
+def true_peak(samples: np.ndarray, rate: int, oversample: int = 4) -> float:
+    """Pico entre muestras estimado sobremuestreando x4."""
+    if len(samples) == 0:
+        return 0.0
+    resampler = PolyphaseResampler(rate, rate * oversample)
+    up = np.concatenate((resampler.process(samples), resampler.flush()))
+    return float(max(np.abs(up).max(), np.abs(samples).max()))
+
+
+def limit(samples: np.ndarray, rate: int, ceiling: float,
+          lookahead_ms: float = 5.0, release_ms: float = 50.0) -> np.ndarray:
+    """Limitador con look-ahead: ninguna muestra supera `ceiling`.
+
+    La ganancia necesaria por muestra se mantiene (hold) durante el release
+    y se adelanta `lookahead` muestras con una rampa lineal, de modo que la
+    reducción ya está aplicada cuando llega el pico y no hay recorte duro.
+    """
+    peak = np.abs(samples)
+    if len(samples) == 0 or peak.max() <= ceiling:
+        return samples
+    lookahead = max(int(rate * lookahead_ms / 1000), 1)
+    release = max(int(rate * release_ms / 1000), 0)
+    with np.errstate(divide="ignore"):
+        needed = np.minimum(1.0, ceiling / np.maximum(peak, 1e-9)).astype(np.float32)
+    # g1[i] = min(needed[i-release .. i+lookahead]); la media móvil de largo
+    # lookahead+1 nunca supera needed[p] en el pico p.
+    padded = np.concatenate((np.ones(release, dtype=np.float32), needed,
+                             np.ones(lookahead, dtype=np.float32)))
+    held = sliding_min(padded, release + lookahead + 1)[:len(samples) + lookahead]
+    gain = moving_average(held, lookahead + 1)[lookahead:]
+    return np.clip(samples * gain, -ceiling, ceiling)
+
+
+@dataclass
+class MasterStats:
+    """Medición del prompt completo y la ganancia aplicada."""
+    dc: float = 0.0
+    level: float = 0.0  # RMS con compuerta antes de la ganancia
+    true_peak: float = 0.0  # pico real después de limitar
+    gain: float = 1.0
+
+    @staticmethod
+    def dbfs(value: float) -> float:
+        return 20 * log10(value / INT16_MAX) if value > 0 else float("-inf")
+
+
+def master(samples: np.ndarray, rate: int, remove_dc: bool = True,
+           normalize: bool = True, target_rms: float = 5000,
+           ceiling_db: float = -1.0, max_gain: float = 10.0):
+    """Procesa el prompt completo de una vez: DC global, ganancia única hacia
+    target_rms (nivel integrado) y limitador con look-ahead bajo ceiling_db.
+    Devuelve (muestras, MasterStats).
+    """
+    stats = MasterStats()
+    samples = samples.astype(np.float32, copy=True)
+    if len(samples) == 0:
+        return samples, stats
+    if remove_dc:
+        stats.dc = float(samples.mean(dtype=np.float64))
+        samples -= stats.dc
+    stats.level = gated_rms(samples, rate)
+    if normalize and target_rms > 0 and stats.level > 0:
+        stats.gain = min(max_gain, target_rms / stats.level)
+        samples *= stats.gain
+    ceiling = INT16_MAX * 10 ** (ceiling_db / 20)
+    limited = limit(samples, rate, ceiling)
+    stats.true_peak = true_peak(limited, rate)
+    if stats.true_peak > ceiling:
+        # Los picos entre muestras superan el techo: un pase más con margen
+        limited = limit(samples, rate, ceiling * ceiling / stats.true_peak)
+        stats.true_peak = true_peak(limited, rate)
+    return limited, stats
+
+
+def encode_samples(samples: np.ndarray, codec: int, pcm8_signed: bool = False) -> bytes:
+    return voice_codecs.encode(to_int16_bytes(samples), codec, pcm8_signed)
+
+
+class PlaybackPipeline:
+    """Bloques WAV -> muestras float mono a la tasa del módem.
+
+    El resultado se junta completo y pasa por master() antes de codificar,
+    para que la ganancia y el limitador vean el prompt entero.
+    """
+
+    def __init__(self, in_rate: int, channels: int, sampwidth: int, out_rate: int,
+                 pcm8_signed: bool = False):
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.pcm8_signed = pcm8_signed
+        self.resampler = PolyphaseResampler(in_rate, out_rate)
+
+    def process(self, data: bytes) -> np.ndarray:
+        samples = to_float(data, self.sampwidth, self.pcm8_signed)
+        samples = downmix(samples, self.channels)
+        return self.resampler.process(samples)
+
+    def flush(self) -> np.ndarray:
+        return self.resampler.flush()
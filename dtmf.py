@@ -0,0 +1,241 @@
+"""Detección de DTMF y menú de opciones tipo IVR.
+
+Dos fuentes de dígitos:
+- eventos DLE del módem (<DLE>0..9, *, #, A..D), que llegan por el
+  SerialReader también durante VTX: DigitCollector los junta y puede cortar
+  el prompt en el frame siguiente;
+- audio recibido (AT+VRX) para módems que no informan DTMF: GoertzelDetector
+  evalúa solo las 8 frecuencias DTMF por bloque (vectorizado con NumPy si
+  está instalado) en vez de una FFT completa.
+
+MENU define qué hace cada dígito: "1=callback:voices/callback.wav;2=voicemail".
+"""
+import math
+import queue
+import threading
+from array import array
+from dataclasses import dataclass
+
+from serial_reader import HANGUP_EVENTS
+from voice_codecs import (ALAW_DECODE, CODEC_ALAW, CODEC_PCM8, CODEC_PCM16, CODEC_ULAW,
+                          ULAW_DECODE, numpy_or_none)
+
+ROWS = (697, 770, 852, 941)
+COLS = (1209, 1336, 1477, 1633)
+KEYS = ("123A", "456B", "789C", "*0#D")
+DIGITS = frozenset("0123456789*#ABCD")
+
+# Bloque clásico de 205 muestras a 8 kHz (~25.6 ms, resolución ~39 Hz)
+BLOCK_MS = 25.6
+# Fracción mínima de la energía del bloque que deben sumar los dos tonos
+TONE_RATIO = 0.6
+# Twist máximo entre fila y columna (8 dB) y margen sobre el segundo tono del grupo (6 dB)
+MAX_TWIST = 10 ** (8 / 10)
+MIN_MARGIN = 10 ** (6 / 10)
+# Nivel RMS mínimo (escala PCM 16-bit) para considerar un bloque
+MIN_RMS = 200.0
+
+
+# -----------------------------
+# Menú
+# -----------------------------
+@dataclass(frozen=True)
+class MenuOption:
+    digit: str
+    action: str           # voicemail (graba tras el prompt) o una etiqueta para el webhook
+    audio_file: str = ""  # prompt de la opción (vacío: ninguno)
+
+
+def parse_menu(spec: str) -> dict:
+    """Interpreta MENU: 'dígito=acción[:audio]' separados por ';'."""
+    menu = {}
+    for entry in (spec or "").split(";"):
+        entry = entry.strip()
+        if not entry or "=" not in entry:
+            continue
+        digit, rest = (part.strip() for part in entry.split("=", 1))
+        action, _, audio_file = (part.strip() for part in rest.partition(":"))
+        if len(digit) != 1 or digit.upper() not in DIGITS or not action:
+            print(f"⚠️ Opción de MENU inválida: {entry!r}")
+            continue
+        menu[digit.upper()] = MenuOption(digit.upper(), action, audio_file)
+    return menu
+
+
+# -----------------------------
+# Dígitos por eventos DLE
+# -----------------------------
+class DigitCollector:
+    """Junta los dígitos DTMF informados por el módem (<DLE>dígito).
+
+    `ready` se activa con el primer dígito de `accept` (todos si es None), así
+    el escritor de frames puede cortar el prompt con `stop=ready.is_set`.
+    """
+
+    def __init__(self, accept=None):
+        self.accept = frozenset(accept) if accept is not None else DIGITS
+        self.digits = queue.Queue()
+        self.ready = threading.Event()
+        self._reader = None
+
+    def attach(self, reader):
+        self._reader = reader
+        reader.add_listener(self.on_event)
+        return self
+
+    def detach(self):
+        if self._reader is not None:
+            self._reader.remove_listener(self.on_event)
+            self._reader = None
+
+    def on_event(self, code: str, now: float = None):
+        if code in DIGITS:
+            self.digits.put(code)
+            if code in self.accept:
+                self.ready.set()
+
+    def take(self, timeout: float = 0.0):
+        """Primer dígito aceptado (descarta los demás) o None."""
+        while True:
+            try:
+                digit = self.digits.get(timeout=timeout) if timeout else self.digits.get_nowait()
+            except queue.Empty:
+                return None
+            if digit in self.accept:
+                return digit
+
+
+# -----------------------------
+# Goertzel sobre el audio recibido
+# -----------------------------
+def _linear_table(codec: int, pcm8_signed: bool):
+    if codec == CODEC_ULAW:
+        return ULAW_DECODE
+    if codec == CODEC_ALAW:
+        return ALAW_DECODE
+    if codec == CODEC_PCM8:
+        offset = 0 if pcm8_signed else 128
+        return tuple((((b - offset + 128) & 0xFF) - 128) << 8 for b in range(256))
+    return None  # PCM16: ya es lineal
+
+
+class GoertzelDetector:
+    """Detector DTMF por bloques con antirrebote (un dígito por pulsación)."""
+
+    def __init__(self, codec: int, rate: int = 8000, pcm8_signed: bool = False,
+                 block_ms: float = BLOCK_MS):
+        self.rate = rate
+        self.block = max(int(rate * block_ms / 1000), 32)
+        self.sample_bytes = 2 if codec == CODEC_PCM16 else 1
+        self._table = _linear_table(codec, pcm8_signed)
+        self.freqs = ROWS + COLS
+        self._coeffs = [2.0 * math.cos(2.0 * math.pi * f / rate) for f in self.freqs]
+        self._np = np = numpy_or_none()
+        if np is not None:
+            n = np.arange(self.block)
+            angles = 2.0 * np.pi * np.outer(self.freqs, n) / rate
+            self._cos = np.cos(angles)
+            self._sin = np.sin(angles)
+            if self._table is not None:
+                self._np_table = np.array(self._table, dtype=np.float64)
+        self._pending = b""
+        self._last = None  # dígito del bloque anterior
+        self._held = None  # dígito ya informado, hasta que se suelte
+
+    def _samples(self, data: bytes):
+        np = self._np
+        if np is not None:
+            if self._table is not None:
+                return self._np_table[np.frombuffer(data, dtype=np.uint8)]
+            return np.frombuffer(data, dtype="<i2").astype(np.float64)
+        if self._table is not None:
+            return list(map(self._table.__getitem__, data))
+        return array("h", data)
+
+    def _powers(self, samples) -> list:
+        if self._np is not None:
+            re = self._cos @ samples
+            im = self._sin @ samples
+            return list(re * re + im * im)
+        powers = []
+        for coeff in self._coeffs:
+            s1 = s2 = 0.0
+            for x in samples:
+                s1, s2 = x + coeff * s1 - s2, s1
+            powers.append(s1 * s1 + s2 * s2 - coeff * s1 * s2)
+        return powers
+
+    def detect_block(self, samples):
+        """Dígito presente en un bloque de `self.block` muestras, o None."""
+        if self._np is not None:
+            energy = float(self._np.dot(samples, samples))
+        else:
+            energy = float(sum(x * x for x in samples))
+        n = len(samples)
+        if energy < MIN_RMS * MIN_RMS * n:
+            return None
+        powers = self._powers(samples)
+        rows, cols = powers[:4], powers[4:]
+        r = max(range(4), key=rows.__getitem__)
+        c = max(range(4), key=cols.__getitem__)
+        row_p, col_p = rows[r], cols[c]
+        # Un tono puro de energía E da |X|² ≈ E·n/2
+        if row_p + col_p < TONE_RATIO * energy * n / 2:
+            return None
+        if row_p > col_p * MAX_TWIST or col_p > row_p * MAX_TWIST:
+            return None
+        if any(p * MIN_MARGIN > row_p for i, p in enumerate(rows) if i != r):
+            return None
+        if any(p * MIN_MARGIN > col_p for i, p in enumerate(cols) if i != c):
+            return None
+        return KEYS[r][c]
+
+    def feed(self, data: bytes) -> list:
+        """Agrega audio y devuelve los dígitos nuevos (cada uno una vez)."""
+        block_bytes = self.block * self.sample_bytes
+        buf = self._pending + data if self._pending else data
+        end = len(buf) - len(buf) % block_bytes
+        found = []
+        for i in range(0, end, block_bytes):
+            digit = self.detect_block(self._samples(buf[i:i + block_bytes]))
+            # Dos bloques seguidos con el mismo dígito (~50 ms, mínimo de ITU-T Q.24)
+            if digit is not None and digit == self._last and digit != self._held:
+                self._held = digit
+                found.append(digit)
+            elif digit is None and self._last is None:
+                self._held = None
+            self._last = digit
+        self._pending = bytes(buf[end:])
+        return found
+
+
+def listen_for_digit(at, reader, collector: DigitCollector, codec: int, rate: int,
+                     timeout: float, pcm8_signed: bool = False):
+    """Escucha con AT+VRX hasta un dígito aceptado, un corte o `timeout`.
+
+    Usa los <DLE>dígito del módem y, en paralelo, Goertzel sobre el audio
+    recibido. Devuelve el dígito o None.
+    """
+    detector = GoertzelDetector(codec, rate, pcm8_signed)
+
+    def on_audio(data: bytes):
+        for digit in detector.feed(data):
+            collector.on_event(digit)
+
+    def on_event(code: str, now: float):
+        if code in HANGUP_EVENTS:
+            collector.ready.set()
+
+    reader.add_listener(on_event)
+    reader.start_capture(on_audio)
+    try:
+        vrx = at.send("AT+VRX", timeout=3, final=("CONNECT", "ERROR"))
+        if vrx.ok:
+            collector.ready.wait(timeout)
+            at.write_raw(b"\x10!")
+            reader.capture_done.wait(2)
+            at.wait("VRX", timeout=2)
+    finally:
+        reader.stop_capture()
+        reader.remove_listener(on_event)
+    return collector.take()
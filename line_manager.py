@@ -0,0 +1,339 @@
+"""Manejo de varias líneas (un módem por puerto serie) en un mismo proceso.
+
+Cada línea tiene su propia configuración (puerto, número, MAX_RINGS, prompt),
+su propia CallSession, un SerialReader que lee su puerto sin pausa y un hilo
+que procesa las líneas. La cola de webhooks,
+el log y la caché de prompts se comparten entre todas.
+
+Cada hilo de línea vigila su puerto: un error de E/S, el lector muerto o un
+módem que no contesta a `AT` estando ocioso disparan la reconexión, que
+reabre el dispositivo por su ruta estable (/dev/serial/by-id), repite la
+inicialización con el perfil de voz ya conocido y vuelve a escuchar, con
+backoff acotado entre intentos.
+"""
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import serial
+
+from call_session import CallSession
+from metrics import MODEM_DOWNTIME, MODEM_RECONNECTS, MODEM_UP
+from modem_at import ATEngine
+from modem_profile import load_or_probe
+from serial_reader import SerialReader
+
+# Secuencia de inicialización: (comando, timeout en s; None = por defecto)
+INIT_COMMANDS = (
+    ("AT&F", 3),           # Cargar configuración de fábrica
+    ("ATE0", None),        # desactivar eco
+    ("ATQ0", None),        # habilitar códigos de resultado (no silenciar)
+    ("ATV1", None),        # habilitar códigos de palabra completa
+    ("ATX4", None),        # habilitar códigos extendidos
+    ("ATS0=0", None),      # no contestar automáticamente
+    ("AT+FCLASS=8", None), # permanecer en clase voz para VCID/RING
+)
+
+
+@dataclass
+class LineConfig:
+    """Configuración de una línea/módem."""
+    port: str
+    number: str = None
+    max_rings: int = 3
+    audio_file: str = "voices/busy_lines.wav"
+    baud: int = 115200
+    country_code: str = "598"  # plan de numeración para normalizar el Caller ID
+    caller_id_mode: int = 1    # AT+VCID: 1 formateado, 2 mensaje SDMF/MDMF crudo en hex
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.port) or self.port
+
+
+@dataclass
+class WatchdogConfig:
+    """Vigilancia del puerto de cada línea."""
+    probe_interval: float = 30.0  # AT de prueba tras este silencio del módem, ocioso (0: sin sondeo)
+    probe_timeout: float = 2.0
+    max_failures: int = 2         # sondeos fallidos seguidos para dar el módem por colgado
+    retry_min: float = 0.5        # backoff entre intentos de reconexión
+    retry_max: float = 5.0
+
+
+def stable_device(port: str) -> str:
+    """Ruta en /dev/serial/by-id que apunta a `port` (sobrevive a que ttyACM0
+    pase a ttyACM1 al re-enumerarse el USB); `port` si no hay ninguna."""
+    if port.startswith("/dev/serial/"):
+        return port
+    target = os.path.realpath(port)
+    for link in sorted(glob.glob("/dev/serial/by-id/*")):
+        if os.path.realpath(link) == target:
+            return link
+    return port
+
+
+def parse_lines(spec: str, default: LineConfig) -> list:
+    """Interpreta LINES: entradas separadas por ';' con 'puerto,número,max_rings,audio,país'.
+
+    Los campos faltantes o vacíos toman el valor de `default` (PORT, NUMBER,
+    MAX_RINGS, AUDIO_FILE, COUNTRY_CODE). Sin LINES se usa solo `default`.
+    """
+    if not spec or not spec.strip():
+        return [default]
+    lines = []
+    for entry in spec.split(";"):
+        fields = [f.strip() for f in entry.split(",")]
+        if not fields or not fields[0]:
+            continue
+        fields += [""] * (5 - len(fields))
+        port, number, max_rings, audio_file, country_code = fields[:5]
+        lines.append(LineConfig(
+            port=port,
+            number=number or default.number,
+            max_rings=int(max_rings) if max_rings else default.max_rings,
+            audio_file=audio_file or default.audio_file,
+            baud=default.baud,
+            country_code=country_code or default.country_code,
+            caller_id_mode=default.caller_id_mode,
+        ))
+    return lines
+
+
+class Line:
+    """Un módem: puerto, motor AT, perfil de capacidades y estado propio."""
+
+    def __init__(self, config: LineConfig, handler, profile_file: str = None, idle=None,
+                 watchdog: WatchdogConfig = None, on_lost=None, on_missed=None):
+        self.config = config
+        self.name = config.name
+        self.handler = handler
+        self.idle = idle  # callable(line) cuando no hay llamada en curso (p. ej. marcar salientes)
+        self.watchdog = watchdog or WatchdogConfig()
+        self.on_lost = on_lost  # callable(line) si el puerto se cae con una llamada en curso
+        self.on_missed = on_missed  # callable(line) si dejó de sonar antes de contestar
+        self.device = None      # ruta estable del puerto, resuelta en el primer open()
+        self.profile_file = profile_file
+        self.session = CallSession(max_rings=config.max_rings)
+        self.ser = None
+        self.reader = None
+        self.at = None
+        self.profile = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def open(self):
+        """Abre el puerto, inicializa el módem y carga su perfil de voz."""
+        if self.device is None:
+            self.device = stable_device(self.config.port)
+        # write_timeout: un write trabado (CTS bajo para siempre) también es un puerto caído
+        self.ser = serial.Serial(self.device, self.config.baud, timeout=1,
+                                 rtscts=True, xonxoff=False, write_timeout=5)
+        # El puerto lo lee siempre el hilo del SerialReader (también durante VTX)
+        self.reader = SerialReader(self.ser, self.name).start()
+        self.at = ATEngine(self.ser, reader=self.reader)
+        self._init_modem()
+        if self.profile is None:
+            # Capacidades de voz: se sondean una vez por sesión (o se leen del perfil persistido)
+            self.profile = load_or_probe(self.at, self.profile_file)
+        print(f"⏱️ [{self.name}] Latencia AT (última/peor): {self.at.latency_report()}")
+        MODEM_UP.set(1, line=self.name)
+
+    def _init_modem(self):
+        if not self.at.send("AT", timeout=self.watchdog.probe_timeout).ok:
+            raise serial.SerialException("el módem no responde a AT")
+        for command, timeout in INIT_COMMANDS:
+            self.at.send(command, timeout=timeout)
+        mode = self.config.caller_id_mode
+        cid = self.at.send(f"AT+VCID={mode}")  # habilitar Caller ID (estándar +VCID)
+        if not cid.ok and mode != 1:
+            # Sin modo crudo: el formateado también lo entiende CallerIdDecoder
+            cid = self.at.send("AT+VCID=1")
+        if not cid.ok:
+            # Fallback para módems que usan #CID
+            self.at.send(f"AT#CID={mode}")
+
+    def close(self):
+        if self.reader:
+            self.reader.stop()
+        try:
+            if self.ser:
+                self.ser.close()
+        except Exception:
+            pass
+
+    def port_alive(self) -> bool:
+        """False si el lector del puerto terminó por un error de E/S."""
+        return bool(self.reader and self.reader.is_alive() and self.reader.error is None)
+
+    # -----------------------------
+    # Watchdog y reconexión
+    # -----------------------------
+    def _probe(self) -> bool:
+        """AT de prueba con la línea ociosa; False si el módem no contestó OK."""
+        try:
+            return self.at.send("AT", timeout=self.watchdog.probe_timeout).ok
+        except Exception:
+            return False
+
+    def _reconnect(self, reason: str):
+        """Reabre el puerto hasta lograrlo (o hasta stop()); registra el tiempo caído."""
+        down_since = time.monotonic()
+        MODEM_UP.set(0, line=self.name)
+        MODEM_RECONNECTS.inc(line=self.name, reason=reason)
+        print(f"🔌 [{self.name}] Puerto caído ({reason}); reconectando...")
+        if self.session.call_active:
+            if self.on_lost:
+                try:
+                    self.on_lost(self)
+                except Exception as e:
+                    print(f"❌ [{self.name}] Error registrando la llamada perdida: {e}")
+            self.session.reset()
+        self.close()
+        delay = self.watchdog.retry_min
+        attempts = 0
+        while not self._stop.is_set():
+            attempts += 1
+            # El USB puede volver con otro ttyACM: se re-resuelve la ruta estable
+            if not self.device.startswith("/dev/serial/"):
+                self.device = stable_device(self.config.port)
+            try:
+                self.open()
+            except Exception as e:
+                self.close()
+                if attempts == 1 or attempts % 10 == 0:
+                    print(f"⚠️ [{self.name}] Reconexión fallida (intento {attempts}): {e}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.watchdog.retry_max)
+                continue
+            downtime = time.monotonic() - down_since
+            MODEM_DOWNTIME.observe(downtime, line=self.name)
+            self.session.reset()
+            print(f"🔌 [{self.name}] Reconectado en {downtime:.1f} s ({attempts} intento(s)). "
+                  "Esperando llamadas...")
+            return
+
+    def _run(self):
+        last_data = time.monotonic()
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                text = self.at.readline()
+            except Exception as e:
+                print(f"❌ [{self.name}] Error leyendo el puerto: {e}")
+                self._reconnect("io_error")
+                last_data, failures = time.monotonic(), 0
+                continue
+            if not text:
+                # Sin datos del módem: revisar si la llamada dejó de sonar
+                if self.session.expire():
+                    print(f"⌛ [{self.name}] Llamada descartada: {self.session.summary()}")
+                    if self.on_missed:
+                        try:
+                            self.on_missed(self)
+                        except Exception as e:
+                            print(f"❌ [{self.name}] Error registrando la llamada no atendida: {e}")
+                    self.session.reset()
+                elif self.idle and not self.session.call_active:
+                    try:
+                        self.idle(self)
+                    except Exception as e:
+                        print(f"❌ [{self.name}] Error en tarea ociosa: {e}")
+                        self.session.reset()
+                probe = self.watchdog.probe_interval
+                if (probe and not self.session.call_active
+                        and time.monotonic() - last_data > probe):
+                    if self._probe():
+                        failures = 0
+                    else:
+                        failures += 1
+                        print(f"⚠️ [{self.name}] El módem no respondió al AT de prueba "
+                              f"({failures}/{self.watchdog.max_failures})")
+                    last_data = time.monotonic()
+                    if failures >= self.watchdog.max_failures or not self.port_alive():
+                        self._reconnect("no_response" if self.port_alive() else "io_error")
+                        last_data, failures = time.monotonic(), 0
+                continue
+            last_data, failures = time.monotonic(), 0
+            try:
+                self.handler(self, text)
+            except Exception as e:
+                print(f"❌ [{self.name}] Error procesando '{text}': {e}")
+                if not self.port_alive():
+                    self._reconnect("io_error")
+                    last_data = time.monotonic()
+                    continue
+                self.session.reset()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"line-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout: float = None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+
+class LineManager:
+    """Arranca y supervisa un hilo por línea."""
+
+    def __init__(self, configs: list, handler, profile_file: str = None, idle=None,
+                 watchdog: WatchdogConfig = None, on_lost=None, on_missed=None):
+        self.lines = [Line(c, handler, profile_file, idle, watchdog, on_lost, on_missed)
+                      for c in configs]
+
+    def open_all(self, start: bool = False, on_ready=None) -> list:
+        """Inicializa todos los módems en paralelo; devuelve las líneas listas.
+
+        Con `start` cada línea empieza a atender apenas su módem queda listo,
+        sin esperar a los demás (un RING en ese intervalo no se pierde).
+        `on_ready(line)` se llama con el perfil ya cargado, antes de atender.
+        """
+        def _open(line):
+            try:
+                line.open()
+                if on_ready:
+                    on_ready(line)
+                if start:
+                    line.start()
+                    print(f"📡 Línea configurada en {line.config.number} ({line.config.port}). "
+                          "Esperando llamadas...")
+                return line
+            except Exception as e:
+                print(f"❌ No se pudo abrir el puerto {line.config.port}: {e}")
+                line.close()
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(len(self.lines), 1)) as pool:
+            ready = [line for line in pool.map(_open, self.lines) if line]
+        self.lines = ready
+        return ready
+
+    def run(self):
+        """Bloquea hasta Ctrl+C o hasta que terminen todos los hilos."""
+        for line in self.lines:
+            if not line.is_alive():
+                line.start()
+        try:
+            while any(line.is_alive() for line in self.lines):
+                for line in self.lines:
+                    line.join(0.5)
+        finally:
+            self.stop()
+
+    def stop(self):
+        for line in self.lines:
+            line.stop()
+        for line in self.lines:
+            line.join(2)
+            line.close()
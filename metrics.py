@@ -0,0 +1,312 @@
+"""Métricas en proceso con exposición en formato Prometheus.
+
+Contadores, gauges e histogramas de buckets fijos, sin dependencias. Cada
+operación es un lock y una suma (el histograma agrega un bisect), así que se
+pueden usar desde el loop de frames; para ráfagas están `observe_many` y
+`observe_buckets` (conteos ya agregados por el llamador).
+Las métricas se leen en proceso con `REGISTRY.snapshot()` o por HTTP con
+`start_http_server()` (/metrics en texto Prometheus, /metrics.json).
+"""
+import bisect
+import json
+import math
+import threading
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, key, (), value) for key, value in items]
+
+    def snapshot(self):
+        with self._lock:
+            return {",".join(k) if k else "": v for k, v in self._values.items()}
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        """Valor calculado al leer (p. ej. profundidad de una cola)."""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def remove(self, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+            self._functions.pop(key, None)
+
+    def _read(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                values[key] = float(fn())
+            except Exception:
+                values[key] = math.nan
+        return values
+
+    def samples(self):
+        return [(self.name, key, (), value) for key, value in self._read().items()]
+
+    def snapshot(self):
+        return {",".join(k) if k else "": v for k, v in self._read().items()}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=(0.005, 0.01, 0.025, 0.05, 0.1,
+                                                       0.25, 0.5, 1.0, 2.5, 5.0, 10.0)):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # clave -> [conteos por bucket (+Inf al final), suma, cantidad]
+
+    def _get(self, key):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        return series
+
+    def observe(self, value: float, **labels):
+        index = bisect.bisect_left(self.buckets, value)
+        key = self._key(labels)
+        with self._lock:
+            series = self._get(key)
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def observe_many(self, values, **labels):
+        """Agrega muchas observaciones tomando el lock una sola vez."""
+        buckets = self.buckets
+        key = self._key(labels)
+        with self._lock:
+            series = self._get(key)
+            counts = series[0]
+            for value in values:
+                counts[bisect.bisect_left(buckets, value)] += 1
+                series[1] += value
+                series[2] += 1
+
+    def observe_buckets(self, counts, total: float, **labels):
+        """Suma conteos por bucket ya agregados (mismos `buckets`, +Inf al final) y su suma."""
+        key = self._key(labels)
+        with self._lock:
+            series = self._get(key)
+            for index, n in enumerate(counts):
+                series[0][index] += n
+            series[1] += total
+            series[2] += sum(counts)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(s[0]), s[1], s[2]) for key, s in self._series.items()]
+        out = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                out.append((f"{self.name}_bucket", key, (("le", _format_value(bound)),), cumulative))
+            out.append((f"{self.name}_sum", key, (), total))
+            out.append((f"{self.name}_count", key, (), count))
+        return out
+
+    def snapshot(self):
+        with self._lock:
+            items = [(key, s[1], s[2]) for key, s in self._series.items()]
+        return {",".join(k) if k else "": {"count": c, "sum": t, "mean": t / c if c else 0.0}
+                for k, t, c in items}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=None) -> Histogram:
+        if buckets is None:
+            return self._add(Histogram(name, help, labels))
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Texto en formato de exposición de Prometheus (0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} "
+                             f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+
+REGISTRY = Registry()
+
+# -----------------------------
+# Métricas del proceso
+# -----------------------------
+RINGS = REGISTRY.counter("callrescue_rings_total", "Timbres recibidos", ("line",))
+CALLS = REGISTRY.counter("callrescue_calls_total", "Llamadas registradas por evento",
+                         ("line", "event"))
+WEBHOOKS = REGISTRY.counter("callrescue_webhooks_total",
+                            "Lotes de webhook por resultado (ok, drop, failed)", ("result",))
+ANSWER_LATENCY = REGISTRY.histogram(
+    "callrescue_answer_seconds", "Del RING que completa MAX_RINGS al inicio del audio (o al colgar)",
+    ("line",), buckets=(0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 13.0))
+AT_LATENCY = REGISTRY.histogram(
+    "callrescue_at_command_seconds", "Latencia de respuesta de comandos AT", ("command",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0))
+WEBHOOK_LATENCY = REGISTRY.histogram(
+    "callrescue_webhook_seconds", "Duración de cada POST de webhook",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+FRAME_LATENESS = REGISTRY.histogram(
+    "callrescue_frame_lateness_seconds",
+    "Atraso de cada frame VTX respecto del momento en que el módem lo necesitaba",
+    buckets=(0.0, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1))
+DIALS = REGISTRY.counter("callrescue_dials_total",
+                        "Devoluciones de llamada por resultado (answered, busy, no_answer, ...)",
+                        ("result",))
+DIALER_PENDING = REGISTRY.gauge("callrescue_dialer_pending", "Devoluciones pendientes o en curso")
+TX_UNDERRUNS = REGISTRY.counter("callrescue_tx_underruns_total",
+                               "Veces que el buffer VTX estimado del módem se vació")
+WEBHOOK_QUEUE_DEPTH = REGISTRY.gauge("callrescue_webhook_queue_depth",
+                                     "Eventos de webhook en memoria")
+SERIAL_BACKLOG = REGISTRY.gauge("callrescue_serial_backlog_bytes",
+                                "Bytes pendientes de leer en el puerto serie", ("line",))
+MODEM_UP = REGISTRY.gauge("callrescue_modem_up", "1 si el puerto del módem está abierto y responde",
+                          ("line",))
+MODEM_RECONNECTS = REGISTRY.counter("callrescue_modem_reconnects_total",
+                                    "Caídas del puerto que dispararon una reconexión",
+                                    ("line", "reason"))
+MODEM_DOWNTIME = REGISTRY.histogram(
+    "callrescue_modem_downtime_seconds", "Tiempo desde la caída del puerto hasta volver a escuchar",
+    ("line",), buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0))
+STARTUP_SECONDS = REGISTRY.gauge("callrescue_startup_seconds",
+                                 "Duración de cada fase del arranque", ("phase",))
+
+
+# -----------------------------
+# Endpoint HTTP
+# -----------------------------
+def start_http_server(port: int, addr: str = "127.0.0.1", registry: Registry = REGISTRY):
+    """Sirve /metrics y /metrics.json en un hilo daemon; devuelve el servidor."""
+    # Import diferido: sin METRICS_PORT no se carga http.server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body = registry.render().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                body = json.dumps(registry.snapshot(), default=str).encode()
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,203 @@
+"""Capa de comandos AT guiada por respuestas.
+
+Cada comando termina en cuanto el módem devuelve su código final
+(OK/ERROR/CONNECT/VCON/...) en vez de esperar un time.sleep fijo. Las líneas
+no solicitadas (RING, NMBR, DATE, ...) que llegan mientras se espera una
+respuesta se guardan para que el loop principal no las pierda, y la latencia
+de cada comando queda registrada para poder ajustar timeouts.
+
+Con un SerialReader las líneas llegan desde su hilo lector (el puerto se lee
+siempre, aunque nadie esté esperando una respuesta); sin él se lee el puerto
+directamente con readline().
+"""
+import logging
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from metrics import AT_LATENCY
+from modem_log import log
+
+# Códigos finales reconocidos -> estado normalizado
+FINAL_RESULTS = (
+    ("OK", "OK"),
+    ("CONNECT", "CONNECT"),
+    ("VCON", "CONNECT"),
+    ("ERROR", "ERROR"),
+    ("NO CARRIER", "NO CARRIER"),
+    ("BUSY", "BUSY"),
+    ("NO ANSWER", "NO ANSWER"),
+    ("NO DIALTONE", "NO DIALTONE"),
+    ("NO DIAL TONE", "NO DIALTONE"),
+)
+
+# Prefijos de eventos no solicitados (timbre y Caller ID)
+UNSOLICITED_PREFIXES = ("RING", "NMBR", "DATE", "TIME", "NAME", "MESG", "DDN_NMBR")
+
+DEFAULT_TIMEOUT = 2.0
+
+# Nombre del comando sin argumentos, para etiquetar métricas (AT+VSM=130,8000 -> AT+VSM)
+_COMMAND_RE = re.compile(r"^AT[&+#]?[A-Z]+", re.IGNORECASE)
+
+
+def command_name(command: str) -> str:
+    match = _COMMAND_RE.match(command)
+    return match.group(0).upper() if match else (command[:8] or "AT")
+
+
+def classify_final(line: str):
+    """Devuelve el estado normalizado si la línea es un código final, o None."""
+    for prefix, status in FINAL_RESULTS:
+        if line == prefix or line.startswith(prefix + " "):
+            return status
+    return None
+
+
+_UNPRINTABLE = re.compile(r"[^\x20-\x7E]")
+
+
+def clean_line(text: str) -> str:
+    """Quita caracteres no imprimibles; el caso común (ASCII limpio) no usa regex."""
+    if text.isascii() and text.isprintable():
+        return text
+    return _UNPRINTABLE.sub("", text)
+
+
+def is_unsolicited(line: str) -> bool:
+    return line == "R" or line.startswith(UNSOLICITED_PREFIXES)
+
+
+@dataclass
+class ATResult:
+    """Resultado de un comando AT."""
+    command: str
+    status: str  # OK, CONNECT, ERROR, BUSY, ..., TIMEOUT
+    final: str = ""
+    lines: list = field(default_factory=list)  # respuestas intermedias
+    latency: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("OK", "CONNECT")
+
+
+@dataclass
+class LatencyStat:
+    count: int = 0
+    total: float = 0.0
+    last: float = 0.0
+    worst: float = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.last = value
+        self.worst = max(self.worst, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class ATEngine:
+    """Envía comandos AT y espera su respuesta final con timeout por comando."""
+
+    def __init__(self, ser, default_timeout: float = DEFAULT_TIMEOUT,
+                 poll_interval: float = 0.1, debug: bool = True,
+                 on_unsolicited=None, reader=None):
+        self.ser = ser
+        self.reader = reader
+        self.poll_interval = poll_interval
+        self.default_timeout = default_timeout
+        self.debug = debug
+        self.on_unsolicited = on_unsolicited
+        self.unsolicited = deque()
+        self.latency = {}
+        # Timeout corto de lectura: readline() vuelve apenas llega una línea
+        # y el deadline de cada comando se controla aquí.
+        if reader is None:
+            self.ser.timeout = poll_interval
+
+    # -----------------------------
+    # Lectura
+    # -----------------------------
+    def _read_port_line(self) -> str:
+        if self.reader is not None:
+            return self.reader.readline(self.poll_interval)
+        raw = self.ser.readline()
+        if not raw:
+            return ""
+        return raw.decode(errors="ignore").strip()
+
+    def _stash(self, line: str):
+        self.unsolicited.append(line)
+        if self.on_unsolicited:
+            self.on_unsolicited(line)
+
+    def readline(self) -> str:
+        """Siguiente línea para el loop principal: primero los eventos guardados."""
+        if self.unsolicited:
+            return self.unsolicited.popleft()
+        return self._read_port_line()
+
+    def _drain(self):
+        """Descarta respuestas viejas antes de un comando, preservando eventos."""
+        while self.reader.pending() if self.reader is not None else self.ser.in_waiting:
+            line = self._read_port_line()
+            if line and is_unsolicited(line):
+                self._stash(line)
+
+    # -----------------------------
+    # Escritura y comandos
+    # -----------------------------
+    def write_raw(self, data: bytes):
+        self.ser.write(data)
+
+    def wait(self, command: str = "", timeout: float = None, final=None) -> ATResult:
+        """Espera un código final sin enviar nada (p. ej. tras DLE ETX).
+
+        `final` restringe los estados que terminan la espera (p. ej. solo
+        ("CONNECT",) para ATA); el resto se agrega a las líneas intermedias.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        lines = []
+        while time.monotonic() < deadline:
+            line = self._read_port_line()
+            if not line or line == command:  # vacío o eco del comando
+                continue
+            if self.debug and log.isEnabledFor(logging.DEBUG):
+                log.debug("DEBUG(%s): %s", command or "AT", line)
+            status = classify_final(line)
+            if status and (final is None or status in final):
+                return self._record(ATResult(command, status, line, lines,
+                                             time.monotonic() - start))
+            if status is None and is_unsolicited(line):
+                self._stash(line)
+                continue
+            lines.append(line)
+        return self._record(ATResult(command, "TIMEOUT", "", lines, time.monotonic() - start))
+
+    def send(self, command: str, timeout: float = None, final=None) -> ATResult:
+        """Envía un comando y vuelve apenas el módem responde (o al timeout)."""
+        self._drain()
+        self.ser.write(f"{command}\r".encode())
+        return self.wait(command, timeout, final)
+
+    def _record(self, result: ATResult) -> ATResult:
+        if result.command:
+            self.latency.setdefault(result.command, LatencyStat()).add(result.latency)
+            AT_LATENCY.observe(result.latency, command=command_name(result.command))
+        # Sin comando es un sondeo (p. ej. esperar la atención tras ATD): el timeout es normal
+        if result.status == "TIMEOUT" and self.debug and result.command:
+            log.warning("⚠️ %s: sin respuesta en %.2f s", result.command, result.latency)
+        return result
+
+    def latency_report(self) -> str:
+        """Resumen 'comando=última/peor ms' para ajustar timeouts."""
+        return ", ".join(
+            f"{cmd}={stat.last * 1000:.0f}/{stat.worst * 1000:.0f}ms"
+            for cmd, stat in self.latency.items()
+        )
@@ -0,0 +1,56 @@
+"""Logging nivelado y con límite de tasa para el tráfico del módem.
+
+Las líneas crudas del módem (MODEM< ..., respuestas de cada comando AT) van
+al logger "modem" en nivel DEBUG: con LOG_LEVEL=INFO no se formatean ni se
+escriben. En DEBUG un token bucket limita cuántas se escriben por segundo y
+la siguiente línea que pasa informa cuántas se suprimieron.
+"""
+import logging
+import sys
+import threading
+import time
+
+log = logging.getLogger("modem")
+
+
+class RateLimitFilter(logging.Filter):
+    """Deja pasar hasta `rate` registros/s con ráfagas de hasta `burst`."""
+
+    def __init__(self, rate: float = 20.0, burst: int = 50, clock=time.monotonic):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._last = clock()
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1.0:
+                self._suppressed += 1
+                return False
+            self._tokens -= 1.0
+            suppressed, self._suppressed = self._suppressed, 0
+        if suppressed:
+            record.msg = f"[{suppressed} líneas suprimidas] {record.msg}"
+        return True
+
+
+def setup_logging(level: str = "INFO", rate: float = 20.0, burst: int = 50):
+    """Configura el logger "modem" hacia stdout con el mismo formato que los print."""
+    log.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    log.propagate = False
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler.addFilter(RateLimitFilter(rate, burst))
+    log.addHandler(handler)
+    return log
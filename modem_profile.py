@@ -0,0 +1,184 @@
+"""Perfil de capacidades de voz del módem.
+
+Se sondea una sola vez al arrancar (AT+VSM=?, soporte de VGT/VRA/VRN/IFC) y
+se guarda en memoria; opcionalmente se persiste en un JSON indexado por la
+identidad del módem (salida de ATI) para que los próximos arranques tampoco
+tengan que sondear. Las llamadas van directo a configurar VSM y a VTX.
+"""
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass, field
+
+PREFERRED_CODECS = (130, 129, 128, 132)  # μ-law, A-law, PCM 8-bit, PCM 16-bit
+PROFILE_VERSION = 1
+
+# Varias líneas pueden aprender/guardar su perfil a la vez sobre el mismo archivo
+_SAVE_LOCK = threading.Lock()
+
+_GROUP_RE = re.compile(r"\(([^)]*)\)")
+_SPLIT_RE = re.compile(r"[, ]+")
+
+
+def _parse_int_list(text: str) -> list:
+    """'128-130, 132' -> [128, 129, 130, 132] (ignora tokens no numéricos)."""
+    values = []
+    for token in _SPLIT_RE.split(text.strip()):
+        if not token:
+            continue
+        try:
+            if "-" in token:
+                lo, hi = (int(x) for x in token.split("-", 1))
+                values.extend(range(lo, hi + 1))
+            else:
+                values.append(int(token))
+        except ValueError:
+            continue
+    return values
+
+
+def parse_vsm_capabilities(lines: list):
+    """Interpreta la respuesta de AT+VSM=? y devuelve (codecs, rates).
+
+    Soporta el formato compacto '+VSM: (128-130),(8000)' y el de varias
+    líneas '130,"ULAW",(8000)' que usan muchos chipsets Rockwell/Conexant.
+    """
+    codecs = []
+    rates = []
+    for line in lines:
+        body = line.split(":", 1)[1] if line.startswith("+VSM") else line
+        body = body.strip()
+        if not body:
+            continue
+        if body[0].isdigit():
+            # Una línea por códec: <codec>,"<nombre>",(<tasas>)...
+            head = _SPLIT_RE.split(body, 1)[0]
+            try:
+                codecs.append(int(head))
+            except ValueError:
+                continue
+            groups = _GROUP_RE.findall(body)
+            if groups:
+                rates.extend(_parse_int_list(groups[0]))
+        elif body.startswith("("):
+            groups = _GROUP_RE.findall(body)
+            if groups:
+                codecs.extend(_parse_int_list(groups[0]))
+            if len(groups) > 1:
+                rates.extend(_parse_int_list(groups[1]))
+    return sorted(set(codecs)), sorted(set(rates))
+
+
+@dataclass
+class ModemProfile:
+    """Capacidades de voz conocidas de un módem."""
+    identity: str = ""
+    codecs: list = field(default_factory=list)
+    rates: list = field(default_factory=list)
+    supports_vgt: bool = True
+    supports_vra: bool = True
+    supports_vrn: bool = True
+    supports_ifc: bool = True
+    # "ATA": contesta en clase 8; "VLS": hace falta AT+VLS=1; "" = desconocido
+    answer_mode: str = ""
+
+    def select_vsm(self, codec: int, rate: int, auto: bool):
+        """Elige (codec, rate) según las capacidades conocidas.
+
+        Se respeta `codec` si el módem lo soporta. Si no:
+        - auto: el mejor códec soportado según PREFERRED_CODECS;
+        - forzado: lo mismo, avisando que VSM_CODEC no se pudo usar.
+        En ambos casos se prefiere 8000 Hz si está disponible.
+        """
+        effective_codec = codec
+        effective_rate = rate
+        if self.codecs and codec not in self.codecs:
+            for preferred in PREFERRED_CODECS:
+                if preferred in self.codecs:
+                    if not auto:
+                        print(f"⚠️ VSM_CODEC forzado {codec} no soportado. Usando {preferred}.")
+                    effective_codec = preferred
+                    break
+            else:
+                print("⚠️ Lista de códecs no interpretable; se mantiene configuración actual")
+        if self.rates:
+            effective_rate = 8000 if 8000 in self.rates else self.rates[0]
+        return effective_codec, effective_rate
+
+
+def probe_identity(at) -> str:
+    result = at.send("ATI", timeout=2)
+    return " / ".join(result.lines).strip()
+
+
+def probe_profile(at, identity: str = None) -> ModemProfile:
+    """Sondea el módem (debe estar en AT+FCLASS=8) y arma su perfil."""
+    if identity is None:
+        identity = probe_identity(at)
+    profile = ModemProfile(identity=identity)
+    result = at.send("AT+VSM=?", timeout=1.5)
+    profile.codecs, profile.rates = parse_vsm_capabilities(result.lines)
+    profile.supports_vgt = at.send("AT+VGT=?").ok
+    profile.supports_vra = at.send("AT+VRA=?").ok
+    profile.supports_vrn = at.send("AT+VRN=?").ok
+    profile.supports_ifc = at.send("AT+IFC=?").ok
+    return profile
+
+
+def load_profile(path: str, identity: str):
+    """Devuelve el perfil persistido para `identity`, o None."""
+    if not path or not identity:
+        return None
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        entry = data.get("profiles", {}).get(identity)
+        if data.get("version") == PROFILE_VERSION and entry:
+            return ModemProfile(**entry)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ No se pudo leer el perfil de módem {path}: {e}")
+    return None
+
+
+def save_profile(path: str, profile: ModemProfile):
+    if not path or not profile.identity:
+        return
+    try:
+        with _SAVE_LOCK:
+            _save_locked(path, profile)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar el perfil de módem {path}: {e}")
+
+
+def _save_locked(path: str, profile: ModemProfile):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != PROFILE_VERSION:
+            data = {}
+    except (FileNotFoundError, ValueError):
+        data = {}
+    data["version"] = PROFILE_VERSION
+    data.setdefault("profiles", {})[profile.identity] = asdict(profile)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_or_probe(at, path: str = None) -> ModemProfile:
+    """Perfil del módem conectado: del archivo si existe, si no lo sondea."""
+    identity = probe_identity(at)
+    profile = load_profile(path, identity)
+    if profile:
+        print(f"ℹ️ Perfil de módem en caché: codecs={profile.codecs}, rates={profile.rates}")
+        return profile
+    profile = probe_profile(at, identity)
+    print(f"ℹ️ Perfil de módem sondeado: codecs={profile.codecs}, rates={profile.rates}, "
+          f"VGT={profile.supports_vgt}, VRA={profile.supports_vra}, "
+          f"VRN={profile.supports_vrn}, IFC={profile.supports_ifc}")
+    save_profile(path, profile)
+    return profile
@@ -0,0 +1,321 @@
+"""Módem de voz simulado sobre un pseudo-terminal (solo Linux/macOS).
+
+`SimModem` abre un par pty y expone el lado esclavo en `.port`, que se puede
+pasar como PORT a run.py o abrir con serial.Serial como si fuera el módem.
+Responde a los comandos AT que usa el proyecto (ATI, AT+VSM=?, ATA, AT+VLS,
+AT+VTX, ATH, ...) con un retardo configurable, genera RING/NMBR a pedido y en
+modo VTX consume el audio hasta DLE ETX guardando cuándo llegó cada bloque,
+para medir latencias y jitter de frames sin hardware.
+"""
+import os
+import pty
+import select
+import threading
+import time
+import tty
+from dataclasses import dataclass, field
+
+DLE = 0x10
+ETX = 0x03
+CAN = 0x18
+
+
+@dataclass
+class VtxCapture:
+    """Audio recibido durante un AT+VTX (ya sin escapes DLE)."""
+    started: float
+    chunks: list = field(default_factory=list)  # (instante, bytes de audio)
+    ended: float = None
+    data: bytearray = field(default_factory=bytearray)
+
+    @property
+    def first_byte(self) -> float:
+        return self.chunks[0][0] if self.chunks else None
+
+    def timing(self, bytes_per_second: float, frame_ms: float = 20.0) -> dict:
+        """Atraso de cada bloque respecto del ritmo de reproducción `bytes_per_second`.
+
+        Un bloque que llega más de `frame_ms` después de que el módem lo
+        necesitaba cuenta como atrasado (se habría quedado sin audio).
+        """
+        if not self.chunks:
+            return {"bytes": 0}
+        # El módem empieza a reproducir con el primer byte; cada bloque hace
+        # falta cuando se termina lo recibido antes. Llegar antes no cuesta nada.
+        t0 = self.chunks[0][0]
+        received = 0
+        lateness = []
+        for t, size in self.chunks:
+            needed = t0 + received / bytes_per_second
+            lateness.append(max(t - needed, 0.0))
+            received += size
+        lateness.sort()
+        return {
+            "bytes": received,
+            "audio_s": received / bytes_per_second,
+            "wall_s": self.chunks[-1][0] - t0,
+            "max_late_ms": lateness[-1] * 1000.0,
+            "p99_late_ms": lateness[int(0.99 * (len(lateness) - 1))] * 1000.0,
+            "late_chunks": sum(1 for d in lateness if d * 1000.0 > frame_ms),
+            "chunks": len(lateness),
+        }
+
+
+class SimModem:
+    """Módem V.253 mínimo con guion de respuestas y captura de VTX."""
+
+    def __init__(self, codecs=(128, 129, 130, 132), rates=(8000,),
+                 identity="SIM-VOICE-MODEM 1.0", response_delay: float = 0.0,
+                 answer_result: str = "VCON", dial_result: str = "VCON", unsupported=(),
+                 clock=time.monotonic):
+        self.codecs = tuple(codecs)
+        self.rates = tuple(rates)
+        self.identity = identity
+        self.response_delay = response_delay
+        self.answer_result = answer_result
+        self.dial_result = dial_result  # respuesta a ATD (VCON, BUSY, NO ANSWER, ...)
+        self.unsupported = tuple(c.upper() for c in unsupported)
+        self._clock = clock
+        self.events = []  # (instante, tipo, detalle)
+        self.captures = []
+        self._vtx = None
+        self._dle = False
+        # Audio que "dice" el llamante en AT+VRX (códec del módem); después, silencio μ-law
+        self.vrx_audio = b""
+        self.vrx_silence = b"\xff"
+        self._vrx_stop = None
+        self._cmd = bytearray()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+
+    # -----------------------------
+    # Ciclo de vida
+    # -----------------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sim-modem", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(1)
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -----------------------------
+    # Eventos
+    # -----------------------------
+    def _event(self, kind: str, detail: str = ""):
+        with self._lock:
+            self.events.append((self._clock(), kind, detail))
+
+    def find(self, kind: str, detail: str = None, after: float = None):
+        """Primer evento `kind` (con `detail`, si se da) posterior a `after`."""
+        with self._lock:
+            for t, k, d in self.events:
+                if k == kind and (detail is None or d == detail) and (after is None or t >= after):
+                    return t
+        return None
+
+    def wait_for(self, kind: str, detail: str = None, after: float = None,
+                 timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            t = self.find(kind, detail, after)
+            if t is not None:
+                return t
+            time.sleep(0.01)
+        return None
+
+    # -----------------------------
+    # Salida hacia el host
+    # -----------------------------
+    def send_line(self, text: str):
+        os.write(self._master, f"\r\n{text}\r\n".encode())
+
+    def send_dle(self, code: str):
+        """Evento DLE de V.253 (p. ej. 'b' ocupado cuando el llamante corta)."""
+        os.write(self._master, bytes([DLE]) + code.encode())
+        self._event("dle", code)
+
+    def _respond(self, lines, final: str):
+        if self.response_delay:
+            time.sleep(self.response_delay)
+        for text in lines:
+            self.send_line(text)
+        self.send_line(final)
+
+    def ring(self, rings: int = 3, number: str = None, interval: float = 5.0,
+             stop_on_answer: bool = True):
+        """Hace sonar la línea; NMBR llega entre el primer y el segundo RING.
+
+        Corta antes si el host contesta (ATA / AT+VLS=1). Devuelve el instante
+        del último RING enviado.
+        """
+        last = None
+        start = self._clock()
+        for i in range(rings):
+            if stop_on_answer and self._answered(start):
+                break
+            self.send_line("RING")
+            last = self._clock()
+            self._event("ring", str(i + 1))
+            if i == 0 and number:
+                time.sleep(min(0.5, interval / 2))
+                self.send_line(f"DATE = {time.strftime('%m%d')}")
+                self.send_line(f"TIME = {time.strftime('%H%M')}")
+                self.send_line(f"NMBR = {number}")
+                self._event("nmbr", number)
+                time.sleep(max(interval - min(0.5, interval / 2), 0))
+            elif i < rings - 1:
+                time.sleep(interval)
+        return last
+
+    def _answered(self, after: float) -> bool:
+        return (self.find("cmd", "ATA", after) is not None
+                or self.find("cmd", "AT+VLS=1", after) is not None)
+
+    # -----------------------------
+    # Entrada desde el host
+    # -----------------------------
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._master], [], [], 0.05)
+                if not ready:
+                    continue
+                data = os.read(self._master, 4096)
+            except OSError:
+                break
+            if data:
+                self._feed(data, self._clock())
+
+    def _feed(self, data: bytes, now: float):
+        i = 0
+        while i < len(data):
+            if self._vrx_stop is not None:
+                i = self._feed_vrx(data, i)
+                continue
+            if self._vtx is not None:
+                i = self._feed_vtx(data, i, now)
+                continue
+            byte = data[i]
+            i += 1
+            if byte == 0x0D:
+                command = self._cmd.decode(errors="ignore").strip()
+                self._cmd.clear()
+                if command:
+                    self._command(command, now)
+            elif byte != 0x0A:
+                self._cmd.append(byte)
+
+    def _feed_vtx(self, data: bytes, i: int, now: float) -> int:
+        capture = self._vtx
+        start = len(capture.data)
+        while i < len(data):
+            byte = data[i]
+            i += 1
+            if self._dle:
+                self._dle = False
+                if byte == ETX:
+                    self._finish_vtx(start, now)
+                    return i
+                if byte == DLE:
+                    capture.data.append(DLE)
+                elif byte == CAN:
+                    self._event("vtx_cancel", str(len(capture.data)))
+                # Otros códigos DLE se ignoran
+            elif byte == DLE:
+                self._dle = True
+            else:
+                capture.data.append(byte)
+        if len(capture.data) > start:
+            capture.chunks.append((now, len(capture.data) - start))
+        return i
+
+    def _feed_vrx(self, data: bytes, i: int) -> int:
+        """Durante VRX el host solo manda <DLE>! para terminar."""
+        while i < len(data):
+            byte = data[i]
+            i += 1
+            if self._dle:
+                self._dle = False
+                if byte == ord("!"):
+                    self._vrx_stop.set()
+                    self._vrx_stop = None
+                    return i
+            elif byte == DLE:
+                self._dle = True
+        return i
+
+    def _stream_vrx(self, stop: threading.Event, rate: int = 8000):
+        frame = rate // 50
+        audio = self.vrx_audio
+        sent = 0
+        next_deadline = time.monotonic()
+        while not stop.is_set() and not self._stop.is_set():
+            chunk = audio[sent:sent + frame]
+            sent += len(chunk)
+            chunk += self.vrx_silence * (frame - len(chunk))
+            try:
+                os.write(self._master, chunk.replace(bytes([DLE]), bytes([DLE, DLE])))
+            except OSError:
+                return
+            next_deadline += 0.02
+            time.sleep(max(next_deadline - time.monotonic(), 0))
+        self._event("vrx_end", str(sent))
+        os.write(self._master, bytes([DLE, ETX]))
+        self._respond([], "OK")
+
+    def _finish_vtx(self, start: int, now: float):
+        capture = self._vtx
+        if len(capture.data) > start:
+            capture.chunks.append((now, len(capture.data) - start))
+        capture.ended = now
+        self._vtx = None
+        self._event("vtx_end", str(len(capture.data)))
+        self._respond([], "OK")
+
+    def _command(self, command: str, now: float):
+        with self._lock:
+            self.events.append((now, "cmd", command))
+        upper = command.upper()
+        if self.unsupported and upper.startswith(self.unsupported):
+            self._respond([], "ERROR")
+        elif upper == "ATI":
+            self._respond([self.identity], "OK")
+        elif upper == "AT+VSM=?":
+            codecs = ",".join(str(c) for c in self.codecs)
+            rates = ",".join(str(r) for r in self.rates)
+            self._respond([f"+VSM: ({codecs}),({rates})"], "OK")
+        elif upper == "ATA":
+            self._respond([], self.answer_result)
+        elif upper.startswith("ATD"):
+            self._respond([], self.dial_result)
+        elif upper == "AT+VTX":
+            self._vtx = VtxCapture(started=now)
+            self._dle = False
+            self.captures.append(self._vtx)
+            self._respond([], "CONNECT")
+        elif upper == "AT+VRX":
+            self._dle = False
+            self._vrx_stop = threading.Event()
+            self._respond([], "CONNECT")
+            threading.Thread(target=self._stream_vrx, args=(self._vrx_stop,),
+                             name="sim-vrx", daemon=True).start()
+        else:
+            self._respond([], "OK")
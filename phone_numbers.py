@@ -0,0 +1,161 @@
+"""Normalización de números entrantes a E.164 con reglas por plan de numeración.
+
+Cada plan (código de país) define prefijo troncal, prefijo internacional,
+largos válidos del número nacional y prefijos de móviles. Las reglas son
+comparaciones de prefijo y largo (la única regex, precompilada, quita los
+separadores) y el resultado se memoiza en un LRU acotado: los llamantes
+repetidos no vuelven a pasar por las reglas.
+
+Los Caller ID bloqueados ("P", "PRIVATE", ...) o no disponibles ("O",
+"OUT OF AREA", ...) se devuelven como PRIVATE / UNAVAILABLE en vez de
+convertirse en un número.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import NamedTuple
+
+PRIVATE = "private"
+UNAVAILABLE = "unavailable"
+
+# Valores de NMBR que no son un número (códigos de Bellcore/ETSI y variantes de módems)
+_SPECIAL_IDS = {
+    "P": PRIVATE,
+    "PRIVATE": PRIVATE,
+    "ANONYMOUS": PRIVATE,
+    "WITHHELD": PRIVATE,
+    "BLOCKED": PRIVATE,
+    "O": UNAVAILABLE,
+    "OUT OF AREA": UNAVAILABLE,
+    "OUT-OF-AREA": UNAVAILABLE,
+    "UNAVAILABLE": UNAVAILABLE,
+    "UNKNOWN": UNAVAILABLE,
+}
+
+_NON_DIGITS = re.compile(r"[^0-9+]")
+
+
+@dataclass(frozen=True)
+class NumberingPlan:
+    """Reglas de marcación de un país."""
+    country_code: str
+    trunk_prefix: str = "0"
+    international_prefix: str = "00"
+    national_lengths: tuple = ()  # largos del número nacional (sin troncal); vacío: no se valida
+    mobile_prefixes: tuple = ()   # primeros dígitos del número nacional de un móvil
+
+
+PLANS = {
+    "598": NumberingPlan("598", "0", "00", (8,), ("9",)),         # Uruguay
+    "54": NumberingPlan("54", "0", "00", (10, 11), ("9",)),       # Argentina (móvil: 9 + área)
+    "56": NumberingPlan("56", "", "00", (9,), ("9",)),            # Chile
+    "34": NumberingPlan("34", "", "00", (9,), ("6", "7")),        # España
+    "44": NumberingPlan("44", "0", "00", (9, 10), ("7",)),        # Reino Unido
+    "1": NumberingPlan("1", "1", "011", (10,)),                   # NANP
+}
+
+
+def plan_for(country_code: str, trunk_prefix: str = None) -> NumberingPlan:
+    """Plan del país; los desconocidos usan solo código de país y troncal."""
+    plan = PLANS.get(country_code) or NumberingPlan(country_code or "")
+    if trunk_prefix is not None and trunk_prefix != plan.trunk_prefix:
+        plan = NumberingPlan(plan.country_code, trunk_prefix, plan.international_prefix,
+                             plan.national_lengths, plan.mobile_prefixes)
+    return plan
+
+
+class NumberInfo(NamedTuple):
+    number: str           # E.164, PRIVATE, UNAVAILABLE o '' si no hay número
+    kind: str = ""        # mobile, landline, international, private, unavailable, invalid
+    valid: bool = True
+
+
+class PhoneNormalizer:
+    """Normalizador con memo LRU para un plan de numeración."""
+
+    def __init__(self, plan: NumberingPlan, cache_size: int = 4096):
+        self.plan = plan
+        self._cc = plan.country_code
+        self._trunk = plan.trunk_prefix
+        self._intl = plan.international_prefix
+        self._lengths = frozenset(plan.national_lengths)
+        self._prefix = f"+{plan.country_code}"
+        self.info = lru_cache(maxsize=cache_size)(self._info)
+
+    def normalize(self, raw_number: str) -> str:
+        """Número en E.164 (o PRIVATE/UNAVAILABLE); vacío o None se devuelve tal cual."""
+        if not raw_number:
+            return raw_number
+        return self.info(raw_number).number
+
+    def dialable(self, number: str) -> str:
+        """Número para ATD desde este país: nacional con troncal o con prefijo internacional."""
+        if not number or not number.startswith("+"):
+            return number
+        digits = number[1:]
+        if self._cc and digits.startswith(self._cc):
+            return self._trunk + digits[len(self._cc):]
+        return self._intl + digits
+
+    def cache_info(self):
+        return self.info.cache_info()
+
+    def _national(self, digits: str) -> NumberInfo:
+        lengths = self._lengths
+        if lengths and len(digits) not in lengths:
+            return NumberInfo(self._prefix + digits, "invalid", False)
+        mobile = self.plan.mobile_prefixes
+        kind = "mobile" if mobile and digits.startswith(mobile) else "landline"
+        return NumberInfo(self._prefix + digits, kind, True)
+
+    def _fits(self, digits: str) -> bool:
+        return not self._lengths or len(digits) in self._lengths
+
+    def _info(self, raw_number: str) -> NumberInfo:
+        text = raw_number.strip()
+        if not text[:1].isdigit() and text[:1] != "+":
+            special = _SPECIAL_IDS.get(text.upper())
+            if special:
+                return NumberInfo(special, special, True)
+        value = text if text.isdigit() else _NON_DIGITS.sub("", text)
+        if not value:
+            return NumberInfo("", "invalid", False)
+        if value[0] == "+":
+            return self._international(value[1:].replace("+", ""))
+        intl, trunk, cc = self._intl, self._trunk, self._cc
+        if intl and value.startswith(intl):
+            return self._international(value[len(intl):])
+        # Número nacional con troncal (ej. 099123456)
+        if trunk and value.startswith(trunk) and self._fits(value[len(trunk):]):
+            return self._national(value[len(trunk):])
+        # Ya trae el código de país sin '+' (ej. 59899123456)
+        if cc and value.startswith(cc) and self._lengths and len(value) - len(cc) in self._lengths:
+            return self._national(value[len(cc):])
+        if self._lengths and len(value) in self._lengths:
+            return self._national(value)
+        # Sin reglas que apliquen: mismo criterio que antes (troncal fuera, país delante)
+        if trunk and value.startswith(trunk):
+            value = value[len(trunk):]
+        if cc and not value.startswith(cc):
+            return self._national(value)
+        return NumberInfo(f"+{value}", "invalid" if self._lengths else "landline", not self._lengths)
+
+    def _international(self, digits: str) -> NumberInfo:
+        cc = self.plan.country_code
+        if cc and digits.startswith(cc):
+            return self._national(digits[len(cc):])
+        return NumberInfo(f"+{digits}", "international", True)
+
+
+_normalizers = {}
+
+
+def normalizer_for(country_code: str, trunk_prefix: str = None,
+                   cache_size: int = 4096) -> PhoneNormalizer:
+    """Normalizador compartido por (país, troncal); se crea al primer uso."""
+    key = (country_code, trunk_prefix)
+    normalizer = _normalizers.get(key)
+    if normalizer is None:
+        normalizer = _normalizers.setdefault(
+            key, PhoneNormalizer(plan_for(country_code, trunk_prefix), cache_size))
+    return normalizer
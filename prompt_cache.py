@@ -0,0 +1,262 @@
+"""Caché de prompts precompilados para reproducción VTX.
+
+Transcodifica un archivo de audio una sola vez (mono, tasa del módem,
+post-procesado y códec de salida), lo corta en frames de 20 ms ya escapados
+con DLE y lo guarda en memoria (LRU acotado) y opcionalmente en disco, de modo
+que la reproducción por llamada sea solo un bucle de escritura temporizado.
+
+NumPy y el pipeline DSP se importan recién al compilar un prompt: importar
+este módulo (frames, escape DLE, caché) no los carga.
+"""
+import hashlib
+import os
+import pickle
+import threading
+import wave
+from collections import OrderedDict
+from dataclasses import dataclass
+from math import log10
+
+from voice_codecs import bytes_per_sample
+
+FRAME_MS = 20
+CACHE_FORMAT_VERSION = 4
+
+
+@dataclass(frozen=True)
+class PromptSettings:
+    """Parámetros de post-procesado que afectan el resultado compilado."""
+    remove_dc: bool = True
+    normalize_rms: bool = True
+    target_rms: int = 5000
+    pcm8_signed: bool = False
+    limiter_ceiling_db: float = -1.0
+
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """Prompt listo para VTX: frames de 20 ms ya escapados con DLE."""
+    path: str
+    codec: int
+    rate: int
+    frames: tuple
+
+    @property
+    def duration(self) -> float:
+        return len(self.frames) * FRAME_MS / 1000.0
+
+
+def escape_dle(payload: bytes) -> bytes:
+    """Duplica los bytes DLE (0x10) según protocolo V.253 para VTX."""
+    if not payload:
+        return payload
+    return payload.replace(b'\x10', b'\x10\x10')
+
+
+def transcode_wav(audio_file: str, codec: int, rate: int, settings: PromptSettings) -> bytes:
+    """Lee un WAV completo y lo devuelve en el códec/tasa del módem (sin escapar)."""
+    import numpy as np
+
+    from dsp import PlaybackPipeline, encode_samples, master
+
+    with wave.open(audio_file, 'rb') as w:
+        channels = w.getnchannels()
+        framerate = w.getframerate()
+        sampwidth = w.getsampwidth()
+        print(f"ℹ️ WAV: canales={channels}, hz={framerate}, sampwidth={sampwidth}")
+        if channels != 1 or framerate != rate or sampwidth not in (1, 2, 3, 4):
+            print("⚠️ Ajustando audio a mono, 8kHz y formato esperado del módem...")
+
+        pipeline = PlaybackPipeline(framerate, channels, sampwidth, rate,
+                                    pcm8_signed=settings.pcm8_signed)
+        # Bloques de ~1 s: el pipeline es vectorizado y rinde mejor con bloques grandes
+        block_frames = max(framerate, 1024)
+        chunks = []
+        while True:
+            data = w.readframes(block_frames)
+            if not data:
+                break
+            chunks.append(pipeline.process(data))
+        chunks.append(pipeline.flush())
+
+    # Análisis y ganancia sobre el prompt completo (una sola vez, queda en caché)
+    samples, stats = master(
+        np.concatenate(chunks), rate,
+        remove_dc=settings.remove_dc,
+        normalize=settings.normalize_rms,
+        target_rms=settings.target_rms,
+        ceiling_db=settings.limiter_ceiling_db,
+    )
+    print(f"ℹ️ Nivel {stats.dbfs(stats.level):.1f} dBFS, ganancia {20 * log10(stats.gain):+.1f} dB, "
+          f"pico real {stats.dbfs(stats.true_peak):.1f} dBFS")
+    return encode_samples(samples, codec, settings.pcm8_signed)
+
+
+def frame_payload(payload: bytes, rate: int, sample_bytes: int = 1) -> tuple:
+    """Corta el payload en frames de 20 ms y aplica escape DLE a cada uno."""
+    frame_bytes = max(int(rate * FRAME_MS / 1000), 1) * sample_bytes
+    return tuple(
+        escape_dle(payload[i:i + frame_bytes])
+        for i in range(0, len(payload), frame_bytes)
+    )
+
+
+def compile_prompt(audio_file: str, codec: int, rate: int, settings: PromptSettings) -> CompiledPrompt:
+    """Transcodifica y enmarca un prompt completo.
+
+    - Si la extensión es .wav, se convierte con el pipeline PCM16.
+    - Caso contrario (o si el WAV no se puede leer), se envía como RAW
+      asumiendo que ya está en el códec del módem.
+    """
+    payload = None
+    if audio_file.lower().endswith('.wav'):
+        try:
+            payload = transcode_wav(audio_file, codec, rate, settings)
+        except Exception as e:
+            print(f"❌ Error leyendo/convirtiendo WAV: {e}. Intentando como RAW...")
+    if payload is None:
+        with open(audio_file, 'rb') as f:
+            payload = f.read()
+    frames = frame_payload(payload, rate, bytes_per_sample(codec))
+    return CompiledPrompt(audio_file, codec, rate, frames)
+
+
+class _Compiling:
+    """Compilación en curso de una clave; los demás `get` esperan su resultado."""
+
+    __slots__ = ("done", "prompt", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.prompt = None
+        self.error = None
+
+    def result(self) -> CompiledPrompt:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.prompt
+
+
+class PromptCache:
+    """LRU acotado de prompts compilados, con persistencia opcional en disco.
+
+    La clave incluye ruta, mtime y tamaño del archivo, códec, tasa y ajustes
+    de post-procesado; cualquier cambio invalida la entrada automáticamente, y
+    la versión anterior del mismo prompt se descarta (y hereda el pin) al pedir
+    la nueva.
+    Los prompts pedidos con `pin=True` (los que se precompilan al arrancar)
+    quedan residentes y no cuentan para `max_entries`. Un `get` de un prompt
+    que otro hilo ya está compilando espera ese resultado en vez de compilarlo
+    de nuevo (p. ej. una llamada durante la precompilación del arranque).
+    """
+
+    def __init__(self, max_entries: int = 8, cache_dir: str = None,
+                 settings: PromptSettings = PromptSettings()):
+        self.max_entries = max(int(max_entries), 1)
+        self.cache_dir = cache_dir or None
+        self.settings = settings
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._compiling = {}  # clave -> _Compiling del hilo que la está compilando
+        self._lock = threading.Lock()
+
+    def _key(self, audio_file: str, codec: int, rate: int) -> tuple:
+        st = os.stat(audio_file)
+        return (os.path.abspath(audio_file), st.st_mtime_ns, st.st_size,
+                int(codec), int(rate), self.settings)
+
+    def _disk_path(self, key: tuple) -> str:
+        digest = hashlib.sha256(repr((CACHE_FORMAT_VERSION, key)).encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{digest}.prompt")
+
+    def _load_from_disk(self, key: tuple):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                version, stored_key, prompt = pickle.load(f)
+            if version == CACHE_FORMAT_VERSION and stored_key == key:
+                return prompt
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Caché de prompt en disco ilegible, se recompila: {e}")
+        return None
+
+    def _store_to_disk(self, key: tuple, prompt: CompiledPrompt):
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._disk_path(key)
+            tmp = f"{path}.tmp"
+            with open(tmp, 'wb') as f:
+                pickle.dump((CACHE_FORMAT_VERSION, key, prompt), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar el prompt en disco: {e}")
+
+    def get(self, audio_file: str, codec: int, rate: int, pin: bool = False) -> CompiledPrompt:
+        """Devuelve el prompt compilado, compilándolo solo si no está en caché."""
+        key = self._key(audio_file, codec, rate)
+        with self._lock:
+            if self._drop_stale(key) or pin:
+                self._pinned.add(key)
+            prompt = self._entries.get(key)
+            if prompt is not None:
+                self._entries.move_to_end(key)
+                return prompt
+            compiling = self._compiling.get(key)
+            owner = compiling is None
+            if owner:
+                compiling = self._compiling[key] = _Compiling()
+        if not owner:
+            return compiling.result()
+
+        try:
+            prompt = self._load_from_disk(key)
+            if prompt is None:
+                print(f"🛠️ Compilando prompt {audio_file} (codec={codec}, rate={rate})...")
+                prompt = compile_prompt(audio_file, codec, rate, self.settings)
+                self._store_to_disk(key, prompt)
+        except BaseException as e:
+            compiling.error = e
+            raise
+        finally:
+            with self._lock:
+                if compiling.error is None:
+                    self._entries[key] = prompt
+                    self._entries.move_to_end(key)
+                    self._evict()
+                    compiling.prompt = prompt
+                del self._compiling[key]
+            compiling.done.set()
+        return prompt
+
+    def _drop_stale(self, key: tuple) -> bool:
+        """Quita las versiones viejas (otro mtime/tamaño) del mismo prompt, códec,
+        tasa y ajustes. Devuelve True si alguna estaba fijada."""
+        path, _, _, *rest = key
+        stale = [k for k in self._pinned | self._entries.keys()
+                 if k != key and k[0] == path and list(k[3:]) == rest]
+        pinned = False
+        for k in stale:
+            if k in self._pinned:
+                self._pinned.discard(k)
+                pinned = True
+            self._entries.pop(k, None)
+        return pinned
+
+    def _evict(self):
+        """Descarta los menos usados entre los no fijados hasta respetar max_entries."""
+        excess = len(self._entries) - len(self._pinned & self._entries.keys()) - self.max_entries
+        if excess <= 0:
+            return
+        for key in [k for k in self._entries if k not in self._pinned][:excess]:
+            del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
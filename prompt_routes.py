@@ -0,0 +1,290 @@
+"""Selección del prompt por llamada con reglas de horario, calendario, línea y número.
+
+ROUTES es una lista de reglas separadas por ';', cada una 'condiciones -> acción':
+
+    days=mon-fri time=09:00-18:00 -> voices/oficina.wav;
+    holiday=1 -> voices/feriado.wav;
+    prefix=+59899,+59898 line=ttyACM1 -> hangup;
+    -> voices/fuera_de_hora.wav
+
+Condiciones (todas opcionales; sin condiciones la regla vale siempre):
+- days: lun..dom o mon..sun, listas y rangos ('mon-fri,sun');
+- time: rangos HH:MM-HH:MM, desde inclusive y hasta exclusive; pueden
+  cruzar la medianoche ('22:00-06:00');
+- holiday: 1 solo en feriados (HOLIDAYS), 0 solo fuera de feriados;
+- line: nombre del puerto (ttyACM0), puerto completo o número local;
+- prefix: prefijos del número entrante ya normalizado (E.164).
+
+Acción: la ruta de un WAV o 'hangup' (contestar, webhook y colgar sin audio).
+Gana la primera regla que coincide; si ninguna coincide queda el
+comportamiento sin reglas (PLAY_AUDIO y el audio de la línea).
+
+Las reglas se compilan al arrancar en un índice por línea con una entrada por
+minuto de la semana (x feriado/no feriado) que apunta a una tabla de prefijos
+ya resuelta: al sonar el teléfono la decisión es una indexación en un array y
+a lo sumo un lookup por largo de prefijo, sin recorrer las reglas.
+"""
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+
+# Acción que contesta y cuelga sin reproducir audio
+HANGUP = "hangup"
+
+DAY_NAMES = {
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+    "lun": 0, "mar": 1, "mie": 2, "mié": 2, "jue": 3, "vie": 4, "sab": 5, "sáb": 5, "dom": 6,
+}
+ALL_DAYS = frozenset(range(7))
+DAY_MINUTES = 24 * 60
+# Slots del índice: (feriado, día de la semana, minuto del día)
+SLOTS = 2 * 7 * DAY_MINUTES
+
+
+@dataclass(frozen=True)
+class Route:
+    """Decisión para una llamada."""
+    action: str           # HANGUP o "audio"
+    audio_file: str = ""
+    rule: str = ""        # texto de la regla que la eligió (para log y webhook)
+
+    @property
+    def play(self) -> bool:
+        return self.action != HANGUP
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    route: Route
+    days: frozenset = ALL_DAYS
+    minutes: tuple = ()      # ((desde, hasta), ...) en minutos del día; vacío: todo el día
+    holiday: bool = None     # None: feriado o no
+    lines: frozenset = frozenset()
+    prefixes: tuple = ("",)  # "" coincide con cualquier número
+
+    def matches_line(self, config) -> bool:
+        return not self.lines or bool(self.lines & {config.name, config.port, config.number})
+
+    def matches_time(self, holiday: bool, weekday: int, minute: int) -> bool:
+        if self.holiday is not None and self.holiday != holiday:
+            return False
+        if weekday not in self.days:
+            return False
+        if not self.minutes:
+            return True
+        for start, end in self.minutes:
+            if start <= end:
+                if start <= minute < end:
+                    return True
+            elif minute >= start or minute < end:
+                return True
+        return False
+
+
+# -----------------------------
+# Parseo
+# -----------------------------
+def _parse_days(value: str) -> frozenset:
+    days = set()
+    for part in value.lower().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = (p.strip() for p in part.partition("-"))
+        start = DAY_NAMES[first]
+        end = DAY_NAMES[last] if last else start
+        day = start
+        while True:
+            days.add(day)
+            if day == end:
+                break
+            day = (day + 1) % 7
+    return frozenset(days)
+
+
+def _parse_clock(value: str) -> int:
+    hours, _, minutes = value.strip().partition(":")
+    hours, minutes = int(hours), int(minutes or 0)
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > DAY_MINUTES:
+        raise ValueError(value)
+    return hours * 60 + minutes
+
+
+def _parse_times(value: str) -> tuple:
+    ranges = []
+    for part in value.split(","):
+        if part.strip():
+            start, end = part.split("-", 1)
+            ranges.append((_parse_clock(start), _parse_clock(end)))
+    return tuple(ranges)
+
+
+def parse_routes(spec: str) -> list:
+    """Interpreta ROUTES; las reglas inválidas se informan y se ignoran."""
+    rules = []
+    for entry in (spec or "").split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if "->" not in entry:
+            print(f"⚠️ Regla de ROUTES sin '->': {entry!r}")
+            continue
+        conditions, action = (part.strip() for part in entry.rsplit("->", 1))
+        if not action:
+            print(f"⚠️ Regla de ROUTES sin acción: {entry!r}")
+            continue
+        if action.lower() == HANGUP:
+            route = Route(HANGUP, rule=entry)
+        else:
+            route = Route("audio", action, rule=entry)
+        fields = {}
+        try:
+            for condition in conditions.split():
+                key, value = condition.split("=", 1)
+                key = key.strip().lower()
+                if key == "days":
+                    fields["days"] = _parse_days(value)
+                elif key == "time":
+                    fields["minutes"] = _parse_times(value)
+                elif key == "holiday":
+                    fields["holiday"] = value.strip() in ("1", "true", "yes")
+                elif key == "line":
+                    fields["lines"] = frozenset(v.strip() for v in value.split(",") if v.strip())
+                elif key == "prefix":
+                    fields["prefixes"] = tuple(v.strip() for v in value.split(",") if v.strip()) or ("",)
+                else:
+                    raise KeyError(key)
+        except (KeyError, ValueError) as e:
+            print(f"⚠️ Regla de ROUTES inválida ({e}): {entry!r}")
+            continue
+        rules.append(RouteRule(route, **fields))
+    return rules
+
+
+def parse_holidays(spec: str = "", path: str = "") -> frozenset:
+    """Feriados de HOLIDAYS ('AAAA-MM-DD' o 'MM-DD' anual, separados por ',')
+    y de HOLIDAYS_FILE (uno por línea, '#' comenta)."""
+    entries = [part for part in (spec or "").split(",")]
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries.extend(line.split("#", 1)[0] for line in f)
+        except OSError as e:
+            print(f"⚠️ No se pudo leer {path}: {e}")
+    days = set()
+    for entry in entries:
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            parts = tuple(int(p) for p in entry.split("-"))
+        except ValueError:
+            parts = ()
+        if len(parts) not in (2, 3):
+            print(f"⚠️ Feriado inválido: {entry!r}")
+            continue
+        days.add(parts)
+    return frozenset(days)
+
+
+# -----------------------------
+# Índice
+# -----------------------------
+class _PrefixTable:
+    """Primera regla (en orden de ROUTES) que coincide, por prefijo del número."""
+
+    __slots__ = ("best", "max_len")
+
+    def __init__(self, rules, candidates):
+        self.best = {}
+        for index in candidates:
+            for prefix in rules[index].prefixes:
+                self.best.setdefault(prefix, index)
+        # Cada prefijo hereda la regla más prioritaria de sus prefijos más cortos,
+        # así alcanza con encontrar el prefijo más largo presente en el número
+        for prefix in sorted(self.best, key=len):
+            for n in range(len(prefix)):
+                shorter = self.best.get(prefix[:n])
+                if shorter is not None and shorter < self.best[prefix]:
+                    self.best[prefix] = shorter
+        self.max_len = max(map(len, self.best), default=0)
+
+    def lookup(self, number: str):
+        best = self.best
+        for n in range(min(len(number), self.max_len), -1, -1):
+            index = best.get(number[:n])
+            if index is not None:
+                return index
+        return None
+
+
+class PromptRouter:
+    """Reglas de ROUTES compiladas por línea para decidir en O(1) al sonar."""
+
+    def __init__(self, rules: list, holidays=frozenset(), clock=time.time):
+        self.rules = list(rules)
+        self.holidays = frozenset(holidays)
+        self._clock = clock
+        self._tables = [None]      # índice 0: ninguna regla posible en ese minuto
+        self._table_ids = {(): 0}  # candidatos -> índice en _tables (compartidas entre líneas)
+        self._lines = {}           # nombre de línea -> array de índices de tabla por slot
+        self._lock = threading.Lock()
+
+    def audio_files(self) -> set:
+        """Prompts referenciados por las reglas (para precompilarlos al arrancar)."""
+        return {rule.route.audio_file for rule in self.rules if rule.route.audio_file}
+
+    def _table_id(self, candidates: tuple) -> int:
+        table_id = self._table_ids.get(candidates)
+        if table_id is None:
+            table_id = len(self._tables)
+            self._tables.append(_PrefixTable(self.rules, candidates))
+            self._table_ids[candidates] = table_id
+        return table_id
+
+    def compile(self, config):
+        """Arma el índice de una línea; devuelve el array de slots."""
+        rules = [(i, rule) for i, rule in enumerate(self.rules) if rule.matches_line(config)]
+        # Los candidatos solo cambian en los bordes de los rangos horarios
+        bounds = {0}
+        for _, rule in rules:
+            for start, end in rule.minutes:
+                bounds.update((start % DAY_MINUTES, end % DAY_MINUTES))
+        bounds = sorted(bounds) + [DAY_MINUTES]
+        slots = array("H", bytes(2 * SLOTS))
+        for holiday in (False, True):
+            for weekday in range(7):
+                base = (holiday * 7 + weekday) * DAY_MINUTES
+                for start, end in zip(bounds, bounds[1:]):
+                    candidates = tuple(i for i, rule in rules
+                                       if rule.matches_time(holiday, weekday, start))
+                    table_id = self._table_id(candidates)
+                    if table_id:
+                        slots[base + start:base + end] = array("H", [table_id]) * (end - start)
+        with self._lock:
+            self._lines[config.name] = slots
+        return slots
+
+    def compile_all(self, configs):
+        for config in configs:
+            self.compile(config)
+        print(f"🧭 {len(self.rules)} regla(s) de ROUTES compiladas para {len(configs)} línea(s) "
+              f"({len(self._tables) - 1} tabla(s) de prefijos)")
+
+    def is_holiday(self, tm) -> bool:
+        return ((tm.tm_year, tm.tm_mon, tm.tm_mday) in self.holidays
+                or (tm.tm_mon, tm.tm_mday) in self.holidays)
+
+    def route(self, config, number: str, now: float = None):
+        """Route de la primera regla que coincide, o None (comportamiento sin reglas)."""
+        slots = self._lines.get(config.name)
+        if slots is None:
+            slots = self.compile(config)
+        tm = time.localtime(self._clock() if now is None else now)
+        slot = (self.is_holiday(tm) * 7 + tm.tm_wday) * DAY_MINUTES + tm.tm_hour * 60 + tm.tm_min
+        table_id = slots[slot]
+        if not table_id:
+            return None
+        index = self._tables[table_id].lookup(number or "")
+        return None if index is None else self.rules[index].route
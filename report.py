@@ -0,0 +1,472 @@
+"""Reporte de volumen y latencias sobre el log de llamadas (LOG_FILE).
+
+Uso: python report.py [LOG_FILE] [--full] [--top N] [--days N] [--json]
+
+Lee el log activo y los archivos rotados (.gz incluidos, y el CSV sin
+encabezado de versiones viejas) por bloques, sin cargarlos en memoria, y
+guarda en LOG_FILE.report.json los agregados más la posición alcanzada en
+cada archivo: la próxima corrida procesa solo las filas nuevas. Cada archivo
+se identifica por su primera fila (con timestamp en microsegundos), así un
+log que rota a .gz sigue contando desde donde había quedado.
+
+Memoria acotada: conteos por hora y línea, latencias en buckets
+logarítmicos (~1 % de error) y los llamantes más frecuentes con Space-Saving
+(exacto mientras haya menos números distintos que --capacity).
+"""
+import argparse
+import csv
+import glob
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import re
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from call_store import ANONYMOUS
+
+STATE_VERSION = 1
+
+# Clases de evento (índices en los contadores por hora/línea)
+ANSWERED, BUSY, LOST, OUTBOUND, OTHER = range(5)
+CLASS_NAMES = ("answered", "busy", "lost", "outbound", "other")
+EVENT_CLASSES = {
+    "answered_with_audio": ANSWERED,
+    "hangup_after_webhook": ANSWERED,
+    "busy": BUSY,
+    "modem_lost": LOST,
+    "missed": LOST,  # dejó de sonar antes de MAX_RINGS
+}
+# Log original (sin encabezado): timestamp, local_number, number, event
+LEGACY_FIELDS = ("timestamp", "local_number", "number", "event")
+CHECKPOINT_EVERY = 200000  # filas entre guardados del estado durante una corrida larga
+
+
+# -----------------------------
+# Agregados
+# -----------------------------
+def latency_bucket(ms: int) -> int:
+    """Centro del bucket de 7 bits significativos (<1 % de error relativo)."""
+    if ms < 128:
+        return ms
+    shift = ms.bit_length() - 7
+    return ((ms >> shift) << shift) | (1 << (shift - 1))
+
+
+def percentile(histogram: dict, q: float):
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen > rank:
+            return value
+    return max(histogram)
+
+
+class TopCallers:
+    """Space-Saving: los `capacity` números más frecuentes con memoria fija.
+
+    Al llegar un número nuevo con la tabla llena reemplaza al de menor conteo
+    y hereda ese conteo como error máximo (`errors`).
+    """
+
+    def __init__(self, capacity: int = 10000, counts=None, errors=None):
+        self.capacity = max(int(capacity), 1)
+        self.counts = dict(counts or {})
+        self.errors = dict(errors or {})
+        self._heap = [(c, n) for n, c in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, number: str):
+        counts = self.counts
+        count = counts.get(number)
+        if count is not None:
+            counts[number] = count + 1  # el heap queda desactualizado; se corrige al desalojar
+            return
+        heap = self._heap
+        if len(counts) < self.capacity:
+            counts[number] = 1
+            heapq.heappush(heap, (1, number))
+            return
+        while True:
+            count, victim = heapq.heappop(heap)
+            actual = counts[victim]
+            if actual == count:
+                break
+            heapq.heappush(heap, (actual, victim))
+        del counts[victim]
+        self.errors.pop(victim, None)
+        counts[number] = count + 1
+        self.errors[number] = count
+        heapq.heappush(heap, (count + 1, number))
+
+    def top(self, n: int) -> list:
+        """[(número, llamadas, error máximo)] de mayor a menor."""
+        best = heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+        return [(number, count, self.errors.get(number, 0)) for number, count in best]
+
+
+class Report:
+    """Agregados del log; se serializan al estado entre corridas."""
+
+    def __init__(self, capacity: int = 10000):
+        self.hourly = {}   # (AAAA-MM-DDTHH, línea) -> [conteo por clase]
+        self.answer_ms = {}
+        self.playback_ms = {}
+        self.callers = TopCallers(capacity)
+        self.rows = 0
+        self.skipped = 0   # filas ilegibles
+
+    # Estado persistido
+    def to_dict(self) -> dict:
+        return {
+            "hourly": [[hour, line, counts] for (hour, line), counts in self.hourly.items()],
+            "answer_ms": list(self.answer_ms.items()),
+            "playback_ms": list(self.playback_ms.items()),
+            "callers": {"capacity": self.callers.capacity, "counts": self.callers.counts,
+                        "errors": self.callers.errors},
+            "rows": self.rows,
+            "skipped": self.skipped,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, capacity: int) -> "Report":
+        report = cls(capacity)
+        report.hourly = {(hour, line): counts for hour, line, counts in data["hourly"]}
+        report.answer_ms = {int(v): c for v, c in data["answer_ms"]}
+        report.playback_ms = {int(v): c for v, c in data["playback_ms"]}
+        callers = data["callers"]
+        report.callers = TopCallers(max(capacity, callers["capacity"]),
+                                    callers["counts"], callers["errors"])
+        report.rows = data["rows"]
+        report.skipped = data["skipped"]
+        return report
+
+    # Consumo de filas
+    def consume(self, rows, fields: dict):
+        """Agrega filas (listas) con las columnas en `fields` (nombre -> índice)."""
+        i_ts = fields["timestamp"]
+        i_line = fields.get("line", fields.get("local_number"))
+        i_number = fields["number"]
+        i_event = fields["event"]
+        i_answer = fields.get("answer_latency_ms")
+        i_playback = fields.get("playback_ms")
+        needed = max(i for i in (i_ts, i_line, i_number, i_event, i_answer, i_playback)
+                     if i is not None)
+        hourly = self.hourly
+        answer_ms = self.answer_ms
+        playback_ms = self.playback_ms
+        add_caller = self.callers.add
+        classes = EVENT_CLASSES
+        consumed = 0
+        for row in rows:
+            if len(row) <= needed:
+                self.skipped += 1
+                continue
+            event = row[i_event]
+            cls = classes.get(event)
+            if cls is None:
+                cls = OUTBOUND if event.startswith("callback_") else OTHER
+            # 'AAAA-MM-DDTHH' del timestamp ISO, sin parsear fechas
+            key = (row[i_ts][:13], row[i_line] if i_line is not None else "")
+            counts = hourly.get(key)
+            if counts is None:
+                counts = hourly[key] = [0] * len(CLASS_NAMES)
+            counts[cls] += 1
+            consumed += 1
+            if cls == OUTBOUND:
+                continue
+            number = row[i_number]
+            if number and number not in ANONYMOUS:
+                add_caller(number)
+            if cls == ANSWERED:
+                try:
+                    if i_answer is not None and row[i_answer]:
+                        ms = latency_bucket(int(row[i_answer]))
+                        answer_ms[ms] = answer_ms.get(ms, 0) + 1
+                    if i_playback is not None and row[i_playback]:
+                        ms = latency_bucket(int(row[i_playback]))
+                        playback_ms[ms] = playback_ms.get(ms, 0) + 1
+                except ValueError:
+                    pass  # latencia ilegible: la llamada cuenta igual en los volúmenes
+        self.rows += consumed
+
+
+# -----------------------------
+# Lectura incremental
+# -----------------------------
+def log_files(path: str) -> list:
+    """Archivos rotados (del más viejo al más nuevo) y el log activo al final."""
+    archive = re.compile(re.escape(os.path.basename(path))
+                         + r"\.\d{8}-\d{6}(-\d+)?(\.legacy)?(\.gz)?$")
+    archives = sorted(p for p in glob.glob(f"{glob.escape(path)}.*")
+                      if archive.match(os.path.basename(p)))
+    return archives + ([path] if os.path.exists(path) else [])
+
+
+def _open(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def fingerprint(path: str):
+    """Hash hasta la primera fila de datos inclusive, o None si todavía no hay ninguna."""
+    digest = hashlib.sha1()
+    with _open(path) as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                return None  # fila a medio escribir
+            digest.update(raw)
+            if not raw.startswith(b"timestamp,"):
+                return digest.hexdigest()
+    return None
+
+
+def _blocks(f, size: int = 1 << 20):
+    """Bloques de filas completas (bytes); una fila a medio escribir queda para la próxima corrida."""
+    pending = b""
+    while True:
+        data = f.read(size)
+        if not data:
+            return
+        data = pending + data
+        cut = data.rfind(b"\n") + 1
+        pending = data[cut:]
+        if cut:
+            yield data[:cut]
+
+
+def _json_rows(lines, columns, report: Report):
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            report.skipped += 1
+            continue
+        yield [str(record.get(c, "") or "") for c in columns]
+
+
+def read_new_rows(path: str, offset: int, report: Report, on_block) -> int:
+    """Agrega las filas completas desde `offset` (bytes sin comprimir).
+
+    Llama a `on_block(offset, filas)` después de cada bloque agregado, así el
+    offset guardado nunca queda adelante ni atrás de los agregados.
+    """
+    with _open(path) as f:
+        header = f.readline()
+        if header.startswith(b"{"):
+            fields = None
+        elif header.startswith(b"timestamp,"):
+            fields = {name: i for i, name in enumerate(next(csv.reader([header.decode()])))}
+        else:
+            fields = {name: i for i, name in enumerate(LEGACY_FIELDS)}
+        # La primera corrida arranca después del encabezado (o desde el principio si no tiene)
+        offset = offset or (len(header) if header.startswith(b"timestamp,") else 0)
+        f.seek(offset)
+        columns = ("timestamp", "line", "number", "event", "answer_latency_ms", "playback_ms")
+        for block in _blocks(f):
+            # Sin NUL (cortes de luz en medio de un write) csv.reader no falla
+            lines = block.replace(b"\0", b"").decode("utf-8", "replace").splitlines()
+            if fields is not None:
+                report.consume(csv.reader(lines), fields)
+            else:
+                report.consume(_json_rows(lines, columns, report),
+                               {c: i for i, c in enumerate(columns)})
+            offset += len(block)
+            on_block(offset, len(lines))
+    return offset
+
+
+def load_state(path: str, capacity: int):
+    """(Report, offsets por huella, huellas de archivos rotados ya leídos completos)."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") == STATE_VERSION:
+            return Report.from_dict(data["report"], capacity), data["files"], set(data["done"])
+        print(f"⚠️ Estado {path} de otra versión; se recalcula todo")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Estado {path} ilegible ({e}); se recalcula todo")
+    return Report(capacity), {}, set()
+
+
+def save_state(path: str, report: Report, files: dict, done: set):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": STATE_VERSION, "files": files, "done": sorted(done),
+                   "report": report.to_dict()}, f)
+    os.replace(tmp, path)
+
+
+def update(log_path: str, state_path: str = None, capacity: int = 10000) -> Report:
+    """Procesa lo nuevo del log (y archivos rotados) y actualiza el estado."""
+    if state_path:
+        report, files, done = load_state(state_path, capacity)
+    else:
+        report, files, done = Report(capacity), {}, set()
+    current = set()
+    pending = 0
+
+    for path in log_files(log_path):
+        try:
+            fp = fingerprint(path)
+        except (OSError, EOFError) as e:
+            print(f"⚠️ No se pudo leer {path}: {e}")
+            continue
+        if fp is None:
+            continue
+        current.add(fp)
+        if fp in done:
+            continue  # rotado y ya leído: evita descomprimir el .gz de nuevo
+
+        def on_block(offset, rows):
+            nonlocal pending
+            files[fp] = offset
+            pending += rows
+            if state_path and pending >= CHECKPOINT_EVERY:
+                save_state(state_path, report, files, done)
+                pending = 0
+
+        try:
+            read_new_rows(path, files.get(fp, 0), report, on_block)
+        except (EOFError, gzip.BadGzipFile) as e:
+            # .gz a medio escribir por la rotación: se retoma en la próxima corrida
+            print(f"⚠️ {path} incompleto: {e}")
+            continue
+        except (OSError, csv.Error) as e:
+            print(f"⚠️ Error leyendo {path}: {e}")
+            continue
+        if path != log_path:
+            done.add(fp)  # los archivos rotados ya no cambian
+    if state_path:
+        # Los archivos borrados por la rotación ya no vuelven
+        save_state(state_path, report, {fp: off for fp, off in files.items() if fp in current},
+                   done & current)
+    return report
+
+
+# -----------------------------
+# Salida
+# -----------------------------
+def summarize(report: Report, top: int = 10, days: int = 14) -> dict:
+    totals = [0] * len(CLASS_NAMES)
+    by_line = {}
+    by_hour = [[0] * len(CLASS_NAMES) for _ in range(24)]
+    by_day = {}
+    for (hour, line), counts in report.hourly.items():
+        line_counts = by_line.setdefault(os.path.basename(line) or line, [0] * len(CLASS_NAMES))
+        day_counts = by_day.setdefault(hour[:10], [0] * len(CLASS_NAMES))
+        try:
+            hour_counts = by_hour[int(hour[11:13])]
+        except ValueError:
+            hour_counts = None
+        for i, n in enumerate(counts):
+            totals[i] += n
+            line_counts[i] += n
+            day_counts[i] += n
+            if hour_counts is not None:
+                hour_counts[i] += n
+
+    def named(counts):
+        result = dict(zip(CLASS_NAMES, counts))
+        incoming = counts[ANSWERED] + counts[BUSY] + counts[LOST]
+        result["answer_ratio"] = round(counts[ANSWERED] / incoming, 4) if incoming else None
+        return result
+
+    def percentiles(histogram):
+        if not histogram:
+            return None
+        return {name: percentile(histogram, q)
+                for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))} | {"max": max(histogram)}
+
+    return {
+        "rows": report.rows,
+        "skipped": report.skipped,
+        "totals": named(totals),
+        "by_line": {line: named(c) for line, c in sorted(by_line.items())},
+        "by_hour_of_day": {f"{h:02d}": named(c) for h, c in enumerate(by_hour) if any(c)},
+        "by_day": {day: named(by_day[day]) for day in sorted(by_day)[-days:]} if days else {},
+        "answer_latency_ms": percentiles(report.answer_ms),
+        "playback_ms": percentiles(report.playback_ms),
+        "top_callers": [{"number": n, "calls": c, "max_error": e}
+                        for n, c, e in report.callers.top(top) if c > 1],
+    }
+
+
+def _row(label: str, counts: dict) -> str:
+    ratio = counts["answer_ratio"]
+    ratio = f"{ratio * 100:5.1f}%" if ratio is not None else "    -"
+    return (f"  {label:<16}{counts['answered']:>10}{counts['busy']:>9}{counts['lost']:>7}"
+            f"{counts['outbound']:>11}   {ratio}")
+
+
+def print_text(summary: dict):
+    header = f"  {'':<16}{'atendidas':>10}{'ocupado':>9}{'caída':>7}{'salientes':>11}   atención"
+    print(f"📊 {summary['rows']} llamadas registradas"
+          + (f" ({summary['skipped']} filas ilegibles)" if summary["skipped"] else ""))
+    print(header)
+    print(_row("total", summary["totals"]))
+    print("\n📡 Por línea")
+    print(header)
+    for line, counts in summary["by_line"].items():
+        print(_row(line, counts))
+    print("\n🕐 Por hora del día")
+    print(header)
+    for hour, counts in summary["by_hour_of_day"].items():
+        print(_row(f"{hour}:00", counts))
+    if summary["by_day"]:
+        print("\n📅 Por día")
+        print(header)
+        for day, counts in summary["by_day"].items():
+            print(_row(day, counts))
+    for title, key in (("⏱️ Latencia de respuesta (ms)", "answer_latency_ms"),
+                       ("🔊 Duración del audio (ms)", "playback_ms")):
+        values = summary[key]
+        if values:
+            print(f"\n{title}: " + "  ".join(f"{k}={v}" for k, v in values.items()))
+    if summary["top_callers"]:
+        print("\n🔁 Llamantes repetidos")
+        for caller in summary["top_callers"]:
+            error = f" (±{caller['max_error']})" if caller["max_error"] else ""
+            print(f"  {caller['number']:<18}{caller['calls']:>6}{error}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Reporte del log de llamadas")
+    parser.add_argument("log", nargs="?", default=os.getenv("LOG_FILE", "calls_log.csv"))
+    parser.add_argument("--state", help="estado incremental (por defecto LOG.report.json)")
+    parser.add_argument("--full", action="store_true", help="ignora el estado y recalcula todo")
+    parser.add_argument("--no-state", action="store_true", help="no lee ni guarda estado")
+    parser.add_argument("--top", type=int, default=10, help="llamantes repetidos a mostrar")
+    parser.add_argument("--days", type=int, default=14, help="días a mostrar en el detalle diario")
+    parser.add_argument("--capacity", type=int, default=10000,
+                        help="números distintos seguidos para el ranking de repetidos")
+    parser.add_argument("--json", action="store_true", help="salida JSON")
+    args = parser.parse_args()
+
+    state = None if args.no_state else (args.state or f"{args.log}.report.json")
+    if state and args.full and os.path.exists(state):
+        os.remove(state)
+    start = time.monotonic()
+    report = update(args.log, state, args.capacity)
+    summary = summarize(report, args.top, args.days)
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        print_text(summary)
+        print(f"\n(procesado en {time.monotonic() - start:.1f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
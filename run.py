@@ -1,15 +1,29 @@
-import serial
+from startup import StartupProfile  # primero: origen del perfil de arranque
+import itertools
+import queue
+import sys
+import threading
 import time
-import re
 import os
-import requests
-import csv
-import wave
 import warnings
-warnings.filterwarnings("ignore", category=DeprecationWarning)
-import audioop
-from datetime import datetime
 from dotenv import load_dotenv
+from prompt_cache import PromptCache, PromptSettings, frame_payload
+from webhook_queue import WebhookQueue
+from call_log import CallLog, session_record
+from call_store import ANONYMOUS, CallStore
+from call_session import ACTION_ANSWER, ACTION_BUSY, ACTION_CALLER_ID, HUNG_UP, RINGING
+import metrics
+from modem_log import log, setup_logging
+from line_manager import LineConfig, LineManager, WatchdogConfig, parse_lines
+from modem_at import clean_line
+from phone_numbers import normalizer_for
+from modem_profile import save_profile
+from tx_writer import FrameWriter
+from voicemail import record_voicemail, voicemail_path
+from dtmf import DigitCollector, listen_for_digit, parse_menu
+from dialer import ANSWERED, Dialer, start_api
+from prompt_routes import PromptRouter, parse_holidays, parse_routes
+import voice_codecs
 
 # -----------------------------
 # Configuración
@@ -23,438 +37,339 @@ PORT = os.getenv("PORT", "/dev/ttyACM0")
 BAUD = int(os.getenv("BAUD", "115200"))
 MAX_RINGS = int(os.getenv("MAX_RINGS", "3"))
 LOG_FILE = os.getenv("LOG_FILE", "calls_log.csv")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "csv")  # csv | jsonl
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # 0: sin rotación por tamaño
+LOG_ROTATE_DAILY = os.getenv("LOG_ROTATE_DAILY", "1") in ("1", "true", "TRUE", "yes", "YES")
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "30"))  # archivos .gz a conservar (0: todos)
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))  # segundos entre volcados a disco
+CALL_STORE_FILE = os.getenv("CALL_STORE_FILE", "calls.db")  # historial SQLite; vacío: desactivado
+REPEAT_WINDOW_S = float(os.getenv("REPEAT_WINDOW_S", "3600"))  # ventana para considerar "repetido"
+REPEAT_MIN_CALLS = int(os.getenv("REPEAT_MIN_CALLS", "1"))  # llamadas previas en la ventana
+REPEAT_AUDIO_FILE = os.getenv("REPEAT_AUDIO_FILE", "")  # prompt para repetidos (vacío: el de la línea)
+REPEAT_SKIP_WEBHOOK = os.getenv("REPEAT_SKIP_WEBHOOK", "0") in ("1", "true", "TRUE", "yes", "YES")
 AUDIO_FILE = os.getenv("AUDIO_FILE", "voices/busy_lines.wav")
 COUNTRY_CODE = os.getenv("COUNTRY_CODE", "598")
-TRUNK_PREFIX = os.getenv("TRUNK_PREFIX", "0")
+CALLER_ID_MODE = int(os.getenv("CALLER_ID_MODE", "1"))  # 1 formateado, 2 SDMF/MDMF crudo
+# Vacío: el troncal del plan del país (phone_numbers.PLANS); si se define, solo vale para COUNTRY_CODE
+TRUNK_PREFIX = os.getenv("TRUNK_PREFIX") or None
 HANGUP_DELAY_MS = int(os.getenv("HANGUP_DELAY_MS", "1200"))
 PLAY_AUDIO = os.getenv("PLAY_AUDIO", "1") in ("1", "true", "TRUE", "yes", "YES")
-VSM_CODEC = int(os.getenv("VSM_CODEC", "130"))  # 130: μ-law, 129: A-law, 128: 8-bit PCM
+VSM_CODEC = int(os.getenv("VSM_CODEC", "130"))  # 130: μ-law, 129: A-law, 128: 8-bit PCM, 132: PCM 16-bit
 SAMPLE_RATE = int(os.getenv("SAMPLE_RATE", "8000"))
 AUTO_VSM = os.getenv("AUTO_VSM", "1") in ("1", "true", "TRUE", "yes", "YES")
 TX_GAIN = os.getenv("TX_GAIN")
 PCM8_SIGNED = os.getenv("PCM8_SIGNED", "0") in ("1", "true", "TRUE", "yes", "YES")
 NORMALIZE_RMS = os.getenv("NORMALIZE_RMS", "1") in ("1", "true", "TRUE", "yes", "YES")
-TARGET_RMS = int(os.getenv("TARGET_RMS", "5000"))  # objetivo RMS en PCM 16-bit
+TARGET_RMS = int(os.getenv("TARGET_RMS", "5000"))  # nivel objetivo (RMS integrado) en PCM 16-bit
+LIMITER_CEILING_DB = float(os.getenv("LIMITER_CEILING_DB", "-1.0"))  # techo del limitador (dBFS)
 REMOVE_DC = os.getenv("REMOVE_DC", "1") in ("1", "true", "TRUE", "yes", "YES")
 PRE_SILENCE_MS = int(os.getenv("PRE_SILENCE_MS", "100"))
+# Colchón de audio adelantado en el buffer del módem durante VTX
+TX_LEAD_MS = int(os.getenv("TX_LEAD_MS", "100"))
+TX_BURST_MS = int(os.getenv("TX_BURST_MS", "200"))  # ráfaga inicial
+TX_MAX_LEAD_MS = int(os.getenv("TX_MAX_LEAD_MS", "400"))  # tope al crecer por underruns
 PLAY_ONLY = os.getenv("PLAY_ONLY", "0") in ("1", "true", "TRUE", "yes", "YES")
+# Devolución de llamadas (dialer saliente; usa las líneas cuando están ociosas)
+DIALER = os.getenv("DIALER", "0") in ("1", "true", "TRUE", "yes", "YES")
+DIALER_AUDIO_FILE = os.getenv("DIALER_AUDIO_FILE", "") or AUDIO_FILE
+DIALER_MAX_ATTEMPTS = int(os.getenv("DIALER_MAX_ATTEMPTS", "3"))
+DIALER_BACKOFF_S = float(os.getenv("DIALER_BACKOFF_S", "60"))  # 60, 120, 240... hasta DIALER_BACKOFF_MAX_S
+DIALER_BACKOFF_MAX_S = float(os.getenv("DIALER_BACKOFF_MAX_S", "900"))
+DIALER_JOBS_FILE = os.getenv("DIALER_JOBS_FILE", "callbacks.json")  # vacío: sin persistencia
+DIALER_API_PORT = int(os.getenv("DIALER_API_PORT", "0"))  # POST /callbacks (0: sin API)
+DIALER_API_ADDR = os.getenv("DIALER_API_ADDR", "127.0.0.1")
+DIAL_PREFIX = os.getenv("DIAL_PREFIX", "")  # p. ej. "9," para salir de una central
+DIAL_TIMEOUT_S = float(os.getenv("DIAL_TIMEOUT_S", "60"))
+# Módems que no reportan VCON ni <DLE>r: OK de ATD + DIAL_QUIET_S sin señales cuenta como atendida
+DIAL_ASSUME_ANSWER_ON_OK = os.getenv("DIAL_ASSUME_ANSWER_ON_OK", "0") in ("1", "true", "TRUE", "yes", "YES")
+DIAL_QUIET_S = float(os.getenv("DIAL_QUIET_S", "15"))
+# Menú DTMF: "dígito=acción[:audio];..." (acción voicemail graba; otras van al webhook)
+MENU = parse_menu(os.getenv("MENU", ""))
+MENU_TIMEOUT_S = float(os.getenv("MENU_TIMEOUT_S", "5"))  # espera de un dígito tras el prompt
+VOICEMAIL = os.getenv("VOICEMAIL", "0") in ("1", "true", "TRUE", "yes", "YES")  # grabar tras el audio
+VOICEMAIL_DIR = os.getenv("VOICEMAIL_DIR", "voicemail")
+VOICEMAIL_MAX_S = float(os.getenv("VOICEMAIL_MAX_S", "120"))  # duración máxima del mensaje
+VOICEMAIL_SILENCE_S = float(os.getenv("VOICEMAIL_SILENCE_S", "5"))  # silencio que termina el mensaje
+VOICEMAIL_LEVEL = int(os.getenv("VOICEMAIL_LEVEL", "500"))  # nivel medio (PCM 16-bit) que cuenta como voz
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "8"))  # prompts compilados en memoria (LRU)
+PROMPT_CACHE_DIR = os.getenv("PROMPT_CACHE_DIR", "")  # vacío: sin persistencia en disco
+MODEM_PROFILE_FILE = os.getenv("MODEM_PROFILE_FILE", "modem_profiles.json")  # vacío: sin persistencia
+# Reglas de prompt por horario/feriado/línea/prefijo (ver prompt_routes.py; vacío: sin reglas)
+ROUTES = parse_routes(os.getenv("ROUTES", ""))
+HOLIDAYS = parse_holidays(os.getenv("HOLIDAYS", ""), os.getenv("HOLIDAYS_FILE", ""))
+# Varias líneas: "puerto,número,max_rings,audio,país;puerto2,..." (vacío: solo PORT/NUMBER/...)
+LINES = os.getenv("LINES", "")
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG: muestra cada línea del módem
+MODEM_LOG_RATE = float(os.getenv("MODEM_LOG_RATE", "20"))  # líneas DEBUG/s como máximo (0: sin límite)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # /metrics en este puerto (0: desactivado)
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+# Watchdog del puerto: AT de prueba con la línea ociosa y reconexión con backoff
+WATCHDOG_PROBE_S = float(os.getenv("WATCHDOG_PROBE_S", "30"))  # 0: sin sondeo (solo errores de E/S)
+WATCHDOG_TIMEOUT_S = float(os.getenv("WATCHDOG_TIMEOUT_S", "2"))
+WATCHDOG_FAILURES = int(os.getenv("WATCHDOG_FAILURES", "2"))
+RECONNECT_MAX_S = float(os.getenv("RECONNECT_MAX_S", "5"))  # tope de espera entre reintentos
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "5000"))  # aviso si el arranque tarda más (0: sin aviso)
+
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "1"))  # >1: POST con lista de eventos
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", "5"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "5"))
+WEBHOOK_SPOOL_DIR = os.getenv("WEBHOOK_SPOOL_DIR", "webhook_spool")  # vacío: sin spool en disco
+
+# Servicios compartidos: los crea main() (importar run.py no abre archivos, puertos ni hilos)
+PROMPT_CACHE = None
+CALL_LOG = None
+CALL_STORE = None
+WEBHOOK_QUEUE = None
+CALLBACKS = None
+ROUTER = None
 
 # -----------------------------
 # Funciones
 # -----------------------------
-def log_call(number: str, local_number: str, event: str):
-    """Guardar en CSV"""
-    timestamp = datetime.now().isoformat()
-    with open(LOG_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([timestamp, local_number, number, event])
-    print(f"📝 Log: {timestamp} {event} {number} -> {local_number}")
-
-def call_rescue_web_hook(number: str, local_number: str, event: str):
-    """Enviar webhook"""
-    if not WEBHOOK_URL:
-        return
+def log_call(line, event: str, webhook: str = ""):
+    """Registrar la llamada de `line` en CALL_LOG (búfer; se vuelca en segundo plano)"""
+    record = session_record(line.session, line.config.port, line.config.number, event, webhook)
+    CALL_LOG.write(record)
+    metrics.CALLS.inc(line=line.name, event=event)
+    if CALL_STORE:
+        try:
+            CALL_STORE.add(record)
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar la llamada en {CALL_STORE_FILE}: {e}")
+    print(f"📝 Log: {record['timestamp']} {event} {record['number']} -> {record['local_number']}")
+
+def is_repeat_caller(number: str) -> bool:
+    """True si `number` ya llamó REPEAT_MIN_CALLS veces en los últimos REPEAT_WINDOW_S."""
+    if not CALL_STORE or REPEAT_MIN_CALLS <= 0:
+        return False
+    return CALL_STORE.count_recent(number, REPEAT_WINDOW_S) >= REPEAT_MIN_CALLS
+
+def call_rescue_web_hook(number: str, local_number: str, event: str, repeat: bool = False,
+                         recording: str = None, option=None) -> str:
+    """Encolar webhook (se entrega en segundo plano, sin bloquear el loop del módem).
+    `recording`: ruta del mensaje de voz grabado (va como RecordingPath).
+    `option`: opción de MENU elegida (va como Digits y MenuOption).
+    Devuelve el resultado para el log: queued, spooled, dropped, skipped o disabled."""
+    if not WEBHOOK_QUEUE:
+        return "disabled"
+    if repeat and REPEAT_SKIP_WEBHOOK:
+        print(f"🔁 {number} ya llamó recientemente; webhook omitido")
+        return "skipped"
     payload = {"From": number, "To": local_number, "CallSid": event}
-    try:
-        response = requests.post(WEBHOOK_URL, json=payload, timeout=5)
-        print(f"Webhook {event}: {payload} -> {response.status_code}")
-    except Exception as e:
-        print(f"❌ Error enviando webhook: {e}")
-
-def normalize_phone_number(raw_number: str) -> str:
-    """Normaliza a E.164 usando COUNTRY_CODE y TRUNK_PREFIX.
-    - Si ya viene con '+', se respeta.
-    - Se remueve el prefijo troncal si corresponde.
-    - Se antepone +COUNTRY_CODE cuando falta.
+    if recording:
+        payload["RecordingPath"] = os.path.abspath(recording)
+    if option:
+        payload["Digits"] = option.digit
+        payload["MenuOption"] = option.action
+    if WEBHOOK_QUEUE.submit(payload):
+        return "queued"
+    return "spooled" if WEBHOOK_QUEUE.spool_dir else "dropped"
+
+def normalize_phone_number(raw_number: str, country_code: str = None) -> str:
+    """Normaliza a E.164 con el plan de numeración del país (COUNTRY_CODE por defecto).
+    - Si ya viene con '+' o con prefijo internacional (00), se respeta el país.
+    - Se remueve el prefijo troncal del plan (o TRUNK_PREFIX) y se antepone el código de país.
+    - Caller ID privado/no disponible ('P'/'O') -> 'private'/'unavailable'.
+    Ver phone_numbers: reglas por país y memo LRU para llamantes repetidos.
     """
-    if not raw_number:
-        return raw_number
-    value = re.sub(r"[^0-9+]", "", raw_number.strip())
-    if value.startswith("+"):
-        return value
-    # Quitar prefijo troncal (ej. '0')
-    if TRUNK_PREFIX and value.startswith(TRUNK_PREFIX):
-        value = value[len(TRUNK_PREFIX):]
-    # Agregar código de país si falta
-    if COUNTRY_CODE and not value.startswith(COUNTRY_CODE):
-        return f"+{COUNTRY_CODE}{value}"
-    # Si ya empieza con el código de país pero sin '+', agrégalo
-    return f"+{value}"
-
-def escape_dle(payload: bytes) -> bytes:
-    """Duplica los bytes DLE (0x10) según protocolo V.253 para VTX."""
-    if not payload:
-        return payload
-    return payload.replace(b'\x10', b'\x10\x10')
-
-def get_silence_byte(codec: int) -> int:
-    """Devuelve el byte de silencio para el códec dado.
-    μ-law: 0xFF, A-law: 0xD5, PCM8 unsigned: 0x80 (o 0x00 si signed).
-    """
-    if codec == 130:  # μ-law
-        return 0xFF
-    if codec == 129:  # A-law
-        return 0xD5
-    # 8-bit PCM
-    return 0x80 if not PCM8_SIGNED else 0x00
-
-def process_pcm16_block(data: bytes) -> bytes:
-    """Post-procesa un bloque PCM 16-bit mono: elimina DC y normaliza RMS si está habilitado.
-    Devuelve bytes PCM16 procesados.
-    """
-    try:
-        if not data:
-            return data
-        processed = data
-        # Eliminar componente DC
-        if REMOVE_DC:
-            avg = audioop.avg(processed, 2)
-            if avg:
-                processed = audioop.bias(processed, 2, -avg)
-        # Normalización RMS simple hacia TARGET_RMS
-        if NORMALIZE_RMS and TARGET_RMS > 0:
-            rms = audioop.rms(processed, 2)
-            if rms > 0:
-                # Limitar factor para evitar clipping duro
-                factor = min(3.0, max(0.3, TARGET_RMS / float(rms)))
-                processed = audioop.mul(processed, 2, factor)
-                # Soft-clip: limitar picos a evitar saturación (aprox)
-                max_amp = 32760
-                # audioop no tiene clip directo; convertimos a 16-bit y recortamos
-                # Pero mantenerlo simple: confiar en factor limitado
-        return processed
-    except Exception:
-        return data
-
-def play_audio(ser: serial.Serial, audio_file: str):
+    return number_plan(country_code).normalize(raw_number)
+
+def number_plan(country_code: str = None):
+    """Normalizador del país; TRUNK_PREFIX reemplaza el troncal solo en COUNTRY_CODE."""
+    country_code = country_code or COUNTRY_CODE
+    return normalizer_for(country_code, TRUNK_PREFIX if country_code == COUNTRY_CODE else None)
+
+def play_audio(line, audio_file: str):
     """Contesta la llamada y reproduce un archivo de audio en la línea telefónica.
 
-    - Si la extensión es .wav, lee frames con el módulo wave y envía PCM.
-    - Caso contrario, envía el archivo como RAW (u-Law/PCM según VSM).
-    Requiere que el módem soporte AT+VTX.
+    - El audio se toma de PROMPT_CACHE: se transcodifica una sola vez por
+      (archivo, códec, tasa, ajustes) y luego solo se escriben frames de 20 ms.
+    - Si no es .wav, se envía el archivo como RAW (u-Law/PCM según VSM).
+    - Con MENU, un dígito corta el prompt y reproduce el de la opción elegida.
+    Requiere que el módem soporte AT+VTX. Devuelve la ruta del mensaje grabado o None.
     """
+    at = line.at
+    profile = line.profile
+    recording = None
     try:
         # Preparar y contestar en modo voz
         print("🎙️ Preparando modo voz para contestar...")
-        ser.write(b'ATM0\r\n')  # silenciar speaker local
-        time.sleep(0.2)
-        ser.readline()
-        ser.write(b'AT+FCLASS=8\r\n')
-        time.sleep(0.4)
-
-        # Intentar ATA en clase 8
-        print("📞 Contestando (ATA) en modo voz...")
-        ser.write(b'ATA\r\n')
-        response = ""
-        timeout = time.time() + 8
-        while ("CONNECT" not in response and "VCON" not in response) and time.time() < timeout:
-            line = ser.readline().decode(errors="ignore").strip()
-            if line:
-                response = line
-                print(f"DEBUG(ATA): {line}")
+        at.send("ATM0")  # silenciar speaker local
+        at.send("AT+FCLASS=8")
+
+        # Intentar ATA en clase 8, salvo que el perfil ya sepa que no funciona
+        connected = False
+        ata_rejected = False
+        if profile.answer_mode != "VLS":
+            print("📞 Contestando (ATA) en modo voz...")
+            ata = at.send("ATA", timeout=8)
+            connected = ata.status == "CONNECT"
+            ata_rejected = ata.status == "ERROR"
+            if connected and not profile.answer_mode:
+                profile.answer_mode = "ATA"
+                save_profile(MODEM_PROFILE_FILE, profile)
 
         # Si no conecta, intentar seleccionar línea de voz
-        if ("CONNECT" not in response and "VCON" not in response):
-            print("⚠️ ATA no conectó, intentando AT+VLS=1...")
-            ser.write(b'AT+VLS=1\r\n')
-            time.sleep(0.8)
+        if not connected:
+            print("⚠️ ATA no conectó o no soportado, usando AT+VLS=1...")
             # Algunos módems solo responden OK aquí, pero la línea queda en voz
             # Continuamos de todas formas a configurar VSM/VTX
-            start = time.time()
-            while time.time() - start < 2:
-                line = ser.readline().decode(errors="ignore").strip()
-                if line:
-                    print(f"DEBUG(VLS): {line}")
+            vls = at.send("AT+VLS=1", timeout=2)
+            # Recordar VLS solo si el módem rechazó ATA (no si el llamante cortó)
+            if vls.ok and ata_rejected and not profile.answer_mode:
+                profile.answer_mode = "VLS"
+                save_profile(MODEM_PROFILE_FILE, profile)
 
         # Cambiar a modo voz y formato
         print("🎙️ Cambiando a modo voz para reproducir audio...")
-        # Nos aseguramos de clase 8
-        ser.write(b'AT+FCLASS=8\r\n')
-        time.sleep(0.3)
-        # Activar control de flujo por hardware (si el módem lo soporta)
-        try:
-            ser.write(b'AT+IFC=2,2\r\n')
-            time.sleep(0.2)
-        except Exception:
-            pass
+        effective_codec, effective_rate = configure_voice(line)
 
-        # Autodetección de códec y tasa si está habilitada
-        effective_codec = VSM_CODEC
-        effective_rate = SAMPLE_RATE
-        if AUTO_VSM:
-            try:
-                ser.write(b'AT+VSM=?\r\n')
-                time.sleep(0.25)
-                supported_line = ""
-                start = time.time()
-                while time.time() - start < 1.5:
-                    line = ser.readline().decode(errors="ignore").strip()
-                    if line:
-                        if "+VSM" in line or line.startswith("("):
-                            supported_line = line
-                            break
-                codecs = []
-                rates = []
-                groups = re.findall(r"\(([^)]*)\)", supported_line)
-                if groups:
-                    try:
-                        codecs = [int(x) for x in re.split(r"[, ]+", groups[0].strip()) if x]
-                    except Exception:
-                        codecs = []
-                    if len(groups) > 1:
-                        try:
-                            rates = [int(x) for x in re.split(r"[, ]+", groups[1].strip()) if x]
-                        except Exception:
-                            rates = []
-                for preferred in (130, 129, 128):
-                    if preferred in codecs:
-                        effective_codec = preferred
-                        break
-                if 8000 in rates:
-                    effective_rate = 8000
-                elif rates:
-                    effective_rate = rates[0]
-                print(f"ℹ️ VSM autodetectado: codec={effective_codec}, rate={effective_rate}")
-            except Exception:
-                print("⚠️ No se pudo autodetectar VSM; usando configuración por defecto")
-        else:
-            # Validación de códec/tasa contra capacidades reales del módem
-            try:
-                ser.write(b'AT+VSM=?\r\n')
-                time.sleep(0.25)
-                supported_line = ""
-                start = time.time()
-                while time.time() - start < 1.5:
-                    line = ser.readline().decode(errors="ignore").strip()
-                    if line:
-                        if "+VSM" in line or line.startswith("("):
-                            supported_line = line
-                            break
-                codecs = []
-                rates = []
-                groups = re.findall(r"\(([^)]*)\)", supported_line)
-                if groups:
-                    try:
-                        codecs = [int(x) for x in re.split(r"[, ]+", groups[0].strip()) if x]
-                    except Exception:
-                        codecs = []
-                    if len(groups) > 1:
-                        try:
-                            rates = [int(x) for x in re.split(r"[, ]+", groups[1].strip()) if x]
-                        except Exception:
-                            rates = []
-                # Si el códec forzado no está soportado, elegir el mejor disponible
-                if codecs and effective_codec not in codecs:
-                    for preferred in (130, 129, 128):
-                        if preferred in codecs:
-                            print(f"⚠️ VSM_CODEC forzado {VSM_CODEC} no soportado. Usando {preferred}.")
-                            effective_codec = preferred
-                            break
-                    else:
-                        print("⚠️ Lista de códecs vacía o no interpretable; se mantiene configuración actual")
-                # Elegir una tasa soportada (preferir 8000 Hz)
-                if rates:
-                    if 8000 in rates:
-                        effective_rate = 8000
-                    else:
-                        effective_rate = rates[0]
-                print(f"ℹ️ VSM validado: codec={effective_codec}, rate={effective_rate}")
-            except Exception:
-                print("⚠️ No se pudo validar VSM contra el módem; usando configuración por defecto")
-
-        ser.write(f"AT+VSM={effective_codec},{effective_rate}\r\n".encode())
-        time.sleep(0.4)
-
-        # Ganancia de transmisión si está configurada
-        if TX_GAIN is not None and TX_GAIN != "":
-            try:
-                ser.write(f"AT+VGT={TX_GAIN}\r\n".encode())
-                time.sleep(0.2)
-            except Exception:
-                pass
-
-        # Intento de desactivar AGC/ruido si existe
+        hangup = line.reader.hangup
+        # Con MENU, un <DLE>dígito durante el prompt lo corta en el frame siguiente
+        digits = DigitCollector(MENU).attach(line.reader) if MENU else None
         try:
-            ser.write(b'AT+VRA=0\r\n')  # AGC off (si soporta)
-            time.sleep(0.1)
-            ser.write(b'AT+VRN=0\r\n')  # Noise reduction off (si soporta)
-            time.sleep(0.1)
-        except Exception:
-            pass
-
-        # Entrar en transmisión de voz
-        print("➡️ Entrando en modo VTX...")
-        ser.write(b'AT+VTX\r\n')
-        # Algunos módems responden CONNECT o VCON al entrar a VTX
-        start = time.time()
-        while time.time() - start < 2:
-            line = ser.readline().decode(errors="ignore").strip()
-            if line:
-                print(f"DEBUG(VTX): {line}")
-                if ("CONNECT" in line) or ("VCON" in line) or ("OK" in line):
-                    break
-
-        # Enviar 100 ms de silencio inicial para estabilizar
-        silence_ms = max(PRE_SILENCE_MS, 0)
-        silence_samples = int(effective_rate * (silence_ms / 1000.0))
-        silence_byte = get_silence_byte(effective_codec)
-        if silence_samples > 0:
-            pre_silence = bytes([silence_byte]) * silence_samples
-            ser.write(escape_dle(pre_silence))
-            time.sleep(silence_ms / 1000.0)
-
-        # Reproducir audio
-        print("▶️ Reproduciendo audio...")
-        if audio_file.lower().endswith('.wav'):
-            try:
-                w = wave.open(audio_file, 'rb')
-                channels = getattr(w, 'getnchannels', lambda:1)()
-                framerate = getattr(w, 'getframerate', lambda:8000)()
-                sampwidth = getattr(w, 'getsampwidth', lambda:2)()
-
-                print(f"ℹ️ WAV: canales={channels}, hz={framerate}, sampwidth={sampwidth}")
-                if channels != 1 or framerate != SAMPLE_RATE or sampwidth not in (1, 2, 4):
-                    print("⚠️ Ajustando audio a mono, 8kHz y formato esperado del módem...")
-
-                # Conversión incremental por bloques
-                # Mantener estado para rate conversion
-                rate_state = None
-                bytes_per_sample_out = 1  # μ-law/A-law/8-bit PCM => 1 byte por muestra
-
-                # Framing de 20 ms
-                samples_per_frame = max(int(effective_rate * 0.02), 1)
-                frame_bytes = samples_per_frame  # μ-law/A-law/PCM8 = 1 byte por muestra
-                out_buffer = b''
-
-                # Temporización por reloj monotónico
-                next_deadline = time.monotonic()
-                while True:
-                    frames = w.readframes(1024)
-                    if not frames:
-                        break
-
-                    data = frames
-
-                    # Asegurar formato lineal 16-bit para las conversiones siguientes
-                    if sampwidth != 2:
-                        try:
-                            src_width = sampwidth
-                            src_data = data
-                            # WAV PCM 8-bit suele ser unsigned. Si no marcamos PCM8_SIGNED, convertimos a signed.
-                            if sampwidth == 1 and not PCM8_SIGNED:
-                                src_data = audioop.bias(src_data, 1, -128)
-                                src_width = 1
-                            data = audioop.lin2lin(src_data, src_width, 2)
-                        except Exception:
-                            # Si no se puede convertir, saltar bloque
-                            continue
-
-                    # Convertir a mono si hace falta
-                    if channels and channels != 1:
-                        data = audioop.tomono(data, 2, 0.5, 0.5)
-
-                    # Resamplear a la tasa efectiva si es necesario
-                    if framerate and framerate != effective_rate:
-                        data, rate_state = audioop.ratecv(data, 2, 1, framerate, effective_rate, rate_state)
-
-                    # Post-procesado PCM16: DC y RMS
-                    data = process_pcm16_block(data)
-
-                    # Convertir al códec elegido
-                    if effective_codec == 130:  # μ-law
-                        out = audioop.lin2ulaw(data, 2)
-                    elif effective_codec == 129:  # A-law
-                        out = audioop.lin2alaw(data, 2)
-                    elif effective_codec == 128:  # 8-bit PCM
-                        pcm8_signed = audioop.lin2lin(data, 2, 1)
-                        if PCM8_SIGNED:
-                            out = pcm8_signed
-                        else:
-                            # Convertir de signed [-128,127] a unsigned [0,255]
-                            out = bytes((b + 128) % 256 for b in pcm8_signed)
-                    else:
-                        # Por defecto μ-law
-                        out = audioop.lin2ulaw(data, 2)
-
-                    # Acumular y enviar en frames de 20 ms con escape DLE
-                    out_buffer += out
-                    while len(out_buffer) >= frame_bytes:
-                        chunk = out_buffer[:frame_bytes]
-                        out_buffer = out_buffer[frame_bytes:]
-                        ser.write(escape_dle(chunk))
-                        next_deadline += 0.02
-                        now = time.monotonic()
-                        delay = next_deadline - now
-                        if delay > 0:
-                            time.sleep(delay)
-
-                w.close()
-                # Enviar remanente
-                if out_buffer:
-                    ser.write(escape_dle(out_buffer))
-                    time.sleep(0.01)
-            except Exception as e:
-                print(f"❌ Error leyendo/convirtiendo WAV: {e}. Intentando como RAW...")
-                with open(audio_file, 'rb') as f:
-                    samples_per_frame = max(int(effective_rate * 0.02), 1)
-                    frame_bytes = samples_per_frame
-                    out_buffer = b''
-                    next_deadline = time.monotonic()
-                    while True:
-                        chunk = f.read(1024)
-                        if not chunk:
-                            break
-                        out_buffer += chunk
-                        while len(out_buffer) >= frame_bytes:
-                            frame = out_buffer[:frame_bytes]
-                            out_buffer = out_buffer[frame_bytes:]
-                            ser.write(escape_dle(frame))
-                            next_deadline += 0.02
-                            now = time.monotonic()
-                            delay = next_deadline - now
-                            if delay > 0:
-                                time.sleep(delay)
-                    if out_buffer:
-                        ser.write(escape_dle(out_buffer))
-                        time.sleep(0.01)
-        else:
-            with open(audio_file, 'rb') as f:
-                samples_per_frame = max(int(SAMPLE_RATE * 0.02), 1)
-                frame_bytes = samples_per_frame
-                out_buffer = b''
-                next_deadline = time.monotonic()
-                while True:
-                    chunk = f.read(1024)
-                    if not chunk:
-                        break
-                    out_buffer += chunk
-                    while len(out_buffer) >= frame_bytes:
-                        frame = out_buffer[:frame_bytes]
-                        out_buffer = out_buffer[frame_bytes:]
-                        ser.write(escape_dle(frame))
-                        next_deadline += 0.02
-                        now = time.monotonic()
-                        delay = next_deadline - now
-                        if delay > 0:
-                            time.sleep(delay)
-                if out_buffer:
-                    ser.write(escape_dle(out_buffer))
-                    time.sleep(0.01)
-
-        # Terminar transmisión
-        ser.write(b'\x10')  # DLE
-        ser.write(b'\x03')  # ETX
-        time.sleep(0.5)
+            stop = (lambda: hangup.is_set() or digits.ready.is_set()) if digits else hangup.is_set
+            line.session.playing()
+            send_prompt(line, audio_file, effective_codec, effective_rate, stop)
+
+            option = None
+            if digits and not hangup.is_set():
+                digit = digits.take()
+                if digit is None and MENU_TIMEOUT_S > 0:
+                    # Módems sin <DLE>dígito: escuchar el audio (Goertzel) un rato más
+                    digit = listen_for_digit(at, line.reader, digits, effective_codec,
+                                             effective_rate, MENU_TIMEOUT_S, PCM8_SIGNED)
+                option = MENU.get(digit)
+                if option:
+                    line.session.menu_option = option.digit
+                    print(f"🔢 [{line.name}] Opción {option.digit}: {option.action}")
+                    if option.audio_file and not hangup.is_set():
+                        send_prompt(line, option.audio_file, effective_codec, effective_rate,
+                                    hangup.is_set)
+        finally:
+            if digits:
+                digits.detach()
+
+        # Buzón de voz: grabar lo que diga el llamante después del anuncio
+        wants_voicemail = option.action == "voicemail" if option else VOICEMAIL
+        if wants_voicemail and not hangup.is_set():
+            recording = record_message(line, effective_codec, effective_rate)
 
         # Colgar
         print("📞 Colgando...")
-        ser.write(b'ATH\r\n')
+        at.send("ATH", timeout=3)
         print("✅ Audio reproducido y llamada terminada.")
 
     except Exception as e:
         print(f"❌ Error al reproducir audio: {e}")
+    return recording
+
+def configure_voice(line):
+    """Clase 8, control de flujo, códec/tasa del perfil y ajustes de ganancia; devuelve (códec, tasa)."""
+    at = line.at
+    profile = line.profile
+    # Nos aseguramos de clase 8
+    at.send("AT+FCLASS=8")
+    # Activar control de flujo por hardware (si el módem lo soporta)
+    if profile.supports_ifc:
+        at.send("AT+IFC=2,2")
+
+    # Códec y tasa según el perfil sondeado al arrancar (sin AT+VSM=? por llamada)
+    codec, rate = profile.select_vsm(VSM_CODEC, SAMPLE_RATE, AUTO_VSM)
+    print(f"ℹ️ VSM {'autodetectado' if AUTO_VSM else 'validado'}: codec={codec}, rate={rate}")
+    at.send(f"AT+VSM={codec},{rate}")
+
+    # Ganancia de transmisión si está configurada
+    if TX_GAIN is not None and TX_GAIN != "" and profile.supports_vgt:
+        at.send(f"AT+VGT={TX_GAIN}")
+
+    # Desactivar AGC/ruido si el módem lo soporta
+    if profile.supports_vra:
+        at.send("AT+VRA=0")  # AGC off
+    if profile.supports_vrn:
+        at.send("AT+VRN=0")  # Noise reduction off
+    return codec, rate
+
+def send_prompt(line, audio_file: str, codec: int, rate: int, stop) -> bool:
+    """Transmite un prompt con AT+VTX; `stop()` verdadero lo corta. True si se cortó."""
+    at = line.at
+    ser = at.ser
+    print("➡️ Entrando en modo VTX...")
+    # Algunos módems responden CONNECT o VCON al entrar a VTX, otros OK
+    at.send("AT+VTX", timeout=2)
+
+    # Silencio inicial para estabilizar: va como frames por el mismo scheduler
+    # (en vez de escribirlo y dormir) y llena el colchón antes del prompt
+    frames = ()
+    silence_samples = int(rate * (max(PRE_SILENCE_MS, 0) / 1000.0))
+    sample_bytes = voice_codecs.bytes_per_sample(codec)
+    if silence_samples > 0:
+        pre_silence = voice_codecs.silence(codec, silence_samples, PCM8_SIGNED)
+        frames = frame_payload(pre_silence, rate, sample_bytes)
+
+    # Reproducir audio (prompt precompilado: sin DSP por llamada)
+    try:
+        prompt = PROMPT_CACHE.get(audio_file, codec, rate)
+    except Exception as e:
+        print(f"❌ No se pudo preparar el audio {audio_file}: {e}")
+        prompt = None
+    if prompt is not None:
+        print(f"▶️ Reproduciendo audio ({prompt.duration:.1f} s)...")
+        frames = itertools.chain(frames, prompt.frames)
+    writer = FrameWriter(ser, lead=TX_LEAD_MS / 1000.0, burst=TX_BURST_MS / 1000.0,
+                         max_lead=TX_MAX_LEAD_MS / 1000.0,
+                         bytes_per_second=rate * sample_bytes)
+    # <DLE>u / <DLE>o del módem ajustan el colchón mientras dura el prompt
+    line.reader.add_listener(writer.on_modem_event)
+    try:
+        stats = writer.write_frames(frames, stop=stop)
+    finally:
+        line.reader.remove_listener(writer.on_modem_event)
+    if stats.underruns or stats.modem_underruns:
+        print(f"⚠️ {stats.underruns} underrun(s) ({stats.modem_underruns} informados por el módem), "
+              f"peor hueco {stats.max_late * 1000:.1f} ms; colchón final {stats.lead * 1000:.0f} ms")
+    if stats.flow_waits:
+        print(f"⏸️ {stats.flow_waits} espera(s) por control de flujo")
+
+    interrupted = stop()
+    if interrupted:
+        # Corte o dígito: DLE CAN descarta el audio que quedó en el buffer del módem
+        if line.reader.hangup.is_set():
+            print(f"📴 [{line.name}] El llamante cortó durante el audio; abortando VTX")
+        at.write_raw(b'\x10\x18\x10\x03')
+    else:
+        # Terminar transmisión: DLE ETX; el módem responde al vaciar su buffer
+        at.write_raw(b'\x10\x03')
+    at.wait("VTX", timeout=2)
+    return interrupted
+
+def record_message(line, codec: int, rate: int):
+    """Graba el mensaje del llamante en VOICEMAIL_DIR; devuelve la ruta o None si no habló."""
+    session = line.session
+    path = voicemail_path(VOICEMAIL_DIR, session.call_id, session.incoming_number)
+    session.recording(path)
+    print(f"⏺️ [{line.name}] Grabando mensaje en {path}...")
+    try:
+        result = record_voicemail(line.at, line.reader, path, codec, rate,
+                                  max_seconds=VOICEMAIL_MAX_S, silence_s=VOICEMAIL_SILENCE_S,
+                                  level=VOICEMAIL_LEVEL, pcm8_signed=PCM8_SIGNED)
+    except Exception as e:
+        print(f"❌ Error grabando el mensaje: {e}")
+        result = None
+    if result is None or not result.voice:
+        # Sin voz (o sin VRX): no se guarda un archivo vacío
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        session.recording_path = None
+        return None
+    print(f"✅ [{line.name}] Mensaje de {result.seconds:.1f} s ({result.reason})")
+    return path
         
-def answer_and_hangup(ser: serial.Serial):
+def answer_and_hangup(line):
     """Toma la línea en modo voz de forma silenciosa y cuelga con un pequeño delay.
 
     Estrategia para evitar 'beep' audible:
@@ -462,140 +377,420 @@ def answer_and_hangup(ser: serial.Serial):
     - Usar clase de voz (FCLASS=8) y tomar la línea (VLS=1).
     - Esperar unos milisegundos para estabilizar y luego colgar (ATH).
     """
+    at = line.at
     try:
         print("🎙️ Preparando para contestar y colgar (silencioso)...")
         # Silenciar el speaker del módem (local)
-        ser.write(b'ATM0\r\n')
-        time.sleep(0.2)
-        ser.readline()
+        at.send("ATM0")
 
         # Modo voz y tomar línea
-        ser.write(b'AT+FCLASS=8\r\n')
-        time.sleep(0.3)
-        ser.write(b'AT+VLS=1\r\n')
-        time.sleep(0.5)
+        at.send("AT+FCLASS=8")
+        at.send("AT+VLS=1")
 
         # Pequeño delay configurable antes de colgar
         time.sleep(max(HANGUP_DELAY_MS, 0) / 1000.0)
 
         # Colgar
         print("📞 Colgando...")
-        ser.write(b'ATH\r\n')
-        time.sleep(0.3)
+        at.send("ATH", timeout=3)
         print("✅ Llamada colgada.")
     except Exception as e:
         print(f"❌ Error en answer_and_hangup: {e}")
 
-# -----------------------------
-# Inicialización del módem
-# -----------------------------
-try:
-    ser = serial.Serial(PORT, BAUD, timeout=1, rtscts=True, xonxoff=False)
-except Exception as e:
-    print(f"No se pudo abrir el puerto {PORT}: {e}")
-    exit(1)
-
-ser.write(b'AT&F\r')        # Cargar configuración de fábrica
-time.sleep(0.5)
-ser.write(b'ATE0\r')        # desactivar eco
-time.sleep(0.2)
-ser.write(b'ATQ0\r')        # habilitar códigos de resultado (no silenciar)
-time.sleep(0.2)
-ser.write(b'ATV1\r')        # habilitar códigos de palabra completa
-time.sleep(0.2)
-ser.write(b'ATX4\r')        # habilitar códigos extendidos
-time.sleep(0.2)
-ser.write(b'ATS0=0\r')      # no contestar automáticamente
-time.sleep(0.2)
-ser.write(b'AT+FCLASS=8\r') # permanecer en clase voz para VCID/RING
-time.sleep(0.2)
-ser.write(b'AT+VCID=1\r')   # habilitar Caller ID (estándar +VCID)
-time.sleep(0.2)
-# Fallback para módems que usan #CID
-ser.write(b'AT#CID=1\r')
-time.sleep(0.2)
-
-print(f"📡 Línea configurada en {LOCAL_NUMBER}. Esperando llamadas...")
-
-# Modo prueba: solo reproducir audio y salir
-if PLAY_ONLY:
-    print("🎧 Modo solo reproducción activado (PLAY_ONLY=1). Reproduciendo y saliendo...")
+# Resultado de ATD -> resultado del intento
+DIAL_RESULTS = {
+    "CONNECT": ANSWERED,
+    "OK": "dialed",  # en clase 8 muchos módems responden OK al terminar de marcar: falta la atención
+    "BUSY": "busy",
+    "NO ANSWER": "no_answer",
+    "NO CARRIER": "no_carrier",
+    "NO DIALTONE": "no_dialtone",
+    "ERROR": "error",
+    "TIMEOUT": "timeout",
+}
+
+# Sin <DLE>r por más de un ciclo de ringback (~6 s en la mayoría de los países): atendieron
+RINGBACK_GAP_S = 6.5
+
+def wait_answer(line, deadline: float) -> str:
+    """Tras el OK de ATD espera la atención: VCON/CONNECT o el fin del ringback.
+
+    Sin señal antes de `deadline` el intento queda como no_answer (el dialer
+    lo reintenta con backoff), salvo con DIAL_ASSUME_ANSWER_ON_OK: entonces
+    DIAL_QUIET_S sin ringback ni resultado cuentan como atendida."""
+    at, reader = line.at, line.reader
+    start = time.monotonic()
+    while True:
+        if reader.hangup.is_set():
+            return "busy"  # <DLE>b: ocupado
+        now = time.monotonic()
+        ringback = [t for t, code in list(reader.events) if code == "r" and t >= start]
+        if ringback and now - ringback[-1] > RINGBACK_GAP_S:
+            return ANSWERED
+        if DIAL_ASSUME_ANSWER_ON_OK and not ringback and now - start > DIAL_QUIET_S:
+            return ANSWERED
+        if now >= deadline:
+            return "no_answer"
+        result = at.wait(timeout=min(0.25, deadline - now),
+                         final=("CONNECT", "BUSY", "NO ANSWER", "NO CARRIER"))
+        if result.status != "TIMEOUT":
+            return DIAL_RESULTS.get(result.status, "error")
+
+def dial_callback(line, job) -> str:
+    """Marca `job.number` en `line`, reproduce el prompt y cuelga; devuelve el resultado."""
+    at = line.at
+    session = line.session
+    session.call_id = job.id
+    session.incoming_number = job.number
+    number = DIAL_PREFIX + number_plan(line.config.country_code).dialable(job.number)
+    print(f"📤 [{line.name}] Devolviendo llamada a {job.number} (intento {job.attempts + 1})...")
+    result = "error"
     try:
-        play_audio(ser, AUDIO_FILE)
+        at.send("ATM0")
+        codec, rate = configure_voice(line)
+        hangup = line.reader.hangup
+        hangup.clear()
+        deadline = time.monotonic() + DIAL_TIMEOUT_S
+        dial = at.send(f"ATD{number}", timeout=DIAL_TIMEOUT_S,
+                       final=("CONNECT", "OK", "BUSY", "NO ANSWER", "NO CARRIER",
+                              "NO DIALTONE", "ERROR"))
+        result = DIAL_RESULTS.get(dial.status, "error")
+        if result == "dialed":
+            result = wait_answer(line, deadline)
+        if result == ANSWERED and hangup.is_set():
+            result = "busy"  # <DLE>b mientras marcaba
+        if result == ANSWERED:
+            session.answering()
+            session.playing()
+            send_prompt(line, job.audio_file or DIALER_AUDIO_FILE, codec, rate, hangup.is_set)
+            if hangup.is_set():
+                session.hang_up("caller_hangup")
     finally:
-        try:
-            ser.close()
-        except Exception:
-            pass
-    exit(0)
+        at.send("ATH", timeout=3)
+        if session.state != HUNG_UP:
+            session.hang_up(result)
+        log_call(line, f"callback_{result}")
+        session.reset()
+        line.at.unsolicited.clear()
+    return result
+
+def dial_next(line):
+    """Tarea ociosa de cada línea: tomar la próxima devolución pendiente."""
+    job = CALLBACKS.take()
+    if job is not None:
+        CALLBACKS.run_job(line, job)
+
+def handle_modem_line(line, text: str):
+    """Procesa una línea del módem con la CallSession propia de `line`."""
+    session = line.session
+    local_number = line.config.number
+
+    # Toda línea del módem queda en DEBUG (con límite de tasa) para diagnóstico de RING/VCID
+    log.debug("MODEM[%s]< %s", line.name, text)
+    text = clean_line(text)
+
+    if not text or text == "OK":
+        return
 
-# -----------------------------
-# Variables de estado
-# -----------------------------
-incoming_number = None
-ring_count = 0
-call_active = False
+    rings = session.ring_count
+    action = session.feed(text, normalize=lambda raw: normalize_phone_number(raw, line.config.country_code))
+    if session.ring_count > rings:
+        metrics.RINGS.inc(line=line.name)
+
+    if action == ACTION_CALLER_ID:
+        name = session.caller.record.name
+        print(f"📲 [{line.name}] Número entrante detectado: {session.incoming_number}"
+              + (f" ({name})" if name else ""))
+    elif session.state == RINGING and ("RING" in text or text == "R"):
+        print(f"📞 [{line.name}] Ring {session.ring_count} de {session.incoming_number}")
+
+    if action == ACTION_ANSWER:
+        number = session.incoming_number
+        session.answering()
+        # Desde acá un evento de corte (<DLE>b/d/l) es de esta llamada
+        line.reader.hangup.clear()
+        repeat = is_repeat_caller(number)
+        # Una regla de ROUTES decide el prompt; sin regla, PLAY_AUDIO y el audio de la línea
+        route = ROUTER.route(line.config, number) if ROUTER else None
+        if route is not None:
+            session.route = route.rule
+            print(f"🧭 [{line.name}] Regla: {route.rule}")
+        if route.play if route is not None else PLAY_AUDIO:
+            print("📢 Alcanzado MAX_RINGS. Enviando webhook y reproduciendo audio...")
+            event = "answered_with_audio"
+            webhook = call_rescue_web_hook(number, local_number, event, repeat)
+            if route is not None:
+                audio_file = route.audio_file
+            elif repeat and REPEAT_AUDIO_FILE:
+                audio_file = REPEAT_AUDIO_FILE
+            else:
+                audio_file = line.config.audio_file
+            recording = play_audio(line, audio_file)
+            option = MENU.get(session.menu_option) if session.menu_option else None
+            if option and option.action == "callback" and CALLBACKS and number not in ANONYMOUS:
+                CALLBACKS.submit(number, source="menu")
+            if recording or option:
+                # Segundo evento con el mensaje/opción: el primero ya avisó de la llamada
+                webhook = call_rescue_web_hook(number, local_number,
+                                               "voicemail" if recording else "menu",
+                                               repeat, recording, option)
+        else:
+            print("📢 Alcanzado MAX_RINGS. Enviando webhook y colgando...")
+            event = "hangup_after_webhook"
+            webhook = call_rescue_web_hook(number, local_number, event, repeat)
+            answer_and_hangup(line)
+        if not line.port_alive():
+            # El módem se cayó en medio de la llamada; el watchdog lo reconecta después
+            event = "modem_lost"
+            queue_recovery_callback(number)
+        session.hang_up("caller_hangup" if line.reader.hangup.is_set() else event)
+        t = session.times
+        answered = t.playing if t.playing is not None else t.hung_up
+        metrics.ANSWER_LATENCY.observe(answered - t.last_ring, line=line.name)
+        # Se registra al colgar para incluir latencia de respuesta y duración
+        log_call(line, event, webhook)
+        print(f"⏱️ [{line.name}] Llamada: {session.summary()}")
+        session.reset()
+        # Los RING/NMBR guardados mientras se atendía son de esta llamada
+        line.at.unsolicited.clear()
+
+    # Línea ocupada o corte inmediato
+    elif action == ACTION_BUSY:
+        print(f"📵 [{line.name}] Línea ocupada o llamada terminada rápido")
+        repeat = is_repeat_caller(session.incoming_number)
+        webhook = call_rescue_web_hook(session.incoming_number, local_number, "busy", repeat)
+        log_call(line, "busy", webhook)
+        print(f"⏱️ [{line.name}] Llamada: {session.summary()}")
+        session.reset()
+
+def queue_recovery_callback(number: str):
+    """Con DIALER, devolver la llamada que se perdió por la caída del módem."""
+    if CALLBACKS and number and number not in ANONYMOUS:
+        CALLBACKS.submit(number, source="recovery")
+
+def call_lost(line):
+    """El puerto se cayó con una llamada sonando o en curso: se registra y avisa igual."""
+    session = line.session
+    number = session.incoming_number
+    print(f"📵 [{line.name}] Llamada de {number or 'desconocido'} perdida por caída del módem")
+    session.hang_up("modem_lost")
+    webhook = "skipped"
+    if number:
+        webhook = call_rescue_web_hook(number, line.config.number, "modem_lost",
+                                       is_repeat_caller(number))
+    log_call(line, "modem_lost", webhook)
+    queue_recovery_callback(number)
+
+def call_missed(line):
+    """Dejó de sonar antes de MAX_RINGS (ring_timeout / caller_id_timeout): se registra
+    como `missed` y se avisa igual, para que el llamante no se pierda."""
+    session = line.session
+    number = session.incoming_number
+    print(f"📵 [{line.name}] Llamada no atendida de {number or 'desconocido'} "
+          f"({session.hangup_reason})")
+    webhook = "skipped"
+    if number:
+        webhook = call_rescue_web_hook(number, line.config.number, "missed",
+                                       is_repeat_caller(number))
+    log_call(line, "missed", webhook)
 
 # -----------------------------
-# Loop principal
+# Arranque
 # -----------------------------
-try:
+def build_services():
+    """Crea y arranca caché de prompts, log, historial, webhooks y dialer."""
+    global PROMPT_CACHE, CALL_LOG, CALL_STORE, WEBHOOK_QUEUE, CALLBACKS
+    PROMPT_CACHE = PromptCache(
+        max_entries=PROMPT_CACHE_SIZE,
+        cache_dir=PROMPT_CACHE_DIR,
+        settings=PromptSettings(
+            remove_dc=REMOVE_DC,
+            normalize_rms=NORMALIZE_RMS,
+            target_rms=TARGET_RMS,
+            pcm8_signed=PCM8_SIGNED,
+            limiter_ceiling_db=LIMITER_CEILING_DB,
+        ),
+    )
+
+    CALL_LOG = CallLog(
+        LOG_FILE,
+        fmt=LOG_FORMAT,
+        max_bytes=LOG_MAX_BYTES,
+        rotate_daily=LOG_ROTATE_DAILY,
+        backups=LOG_BACKUPS,
+        flush_interval=LOG_FLUSH_INTERVAL,
+    )
+
+    CALL_STORE = CallStore(CALL_STORE_FILE, hot_window=max(REPEAT_WINDOW_S, 3600.0)) \
+        if CALL_STORE_FILE else None
+
+    WEBHOOK_QUEUE = WebhookQueue(
+        WEBHOOK_URL,
+        max_queue=WEBHOOK_QUEUE_SIZE,
+        batch_size=WEBHOOK_BATCH_SIZE,
+        max_retries=WEBHOOK_MAX_RETRIES,
+        timeout=WEBHOOK_TIMEOUT,
+        spool_dir=WEBHOOK_SPOOL_DIR,
+    ) if WEBHOOK_URL else None
+
+    CALLBACKS = Dialer(
+        dial_callback,
+        max_attempts=DIALER_MAX_ATTEMPTS,
+        backoff_base=DIALER_BACKOFF_S,
+        backoff_max=DIALER_BACKOFF_MAX_S,
+        state_file=DIALER_JOBS_FILE,
+        normalize=lambda number: normalize_phone_number(number),
+    ) if DIALER else None
+
+    # Antes de abrir los módems: una línea puede atender apenas queda lista
+    CALL_LOG.start()
+    if WEBHOOK_QUEUE:
+        WEBHOOK_QUEUE.start()
+        metrics.WEBHOOK_QUEUE_DEPTH.set_function(WEBHOOK_QUEUE.qsize)
+
+def prompt_files(configs) -> set:
+    """Todos los prompts que puede pedir una llamada con la configuración actual."""
+    prompts = {config.audio_file for config in configs}
+    if REPEAT_AUDIO_FILE:
+        prompts.add(REPEAT_AUDIO_FILE)
+    prompts.update(option.audio_file for option in MENU.values() if option.audio_file)
+    if CALLBACKS:
+        prompts.add(DIALER_AUDIO_FILE)
+    if ROUTER:
+        prompts.update(ROUTER.audio_files())
+    return prompts
+
+def warm_prompts(targets, profile):
+    """Precompila los prompts de cada línea con el códec/tasa que negoció su módem, para
+    que ninguna llamada transcodifique; quedan fijos en memoria (fuera del LRU) así
+    cambiar de regla no agrega latencia. `targets` recibe (prompts, códec, tasa) a
+    medida que las líneas quedan listas y None cuando terminaron de abrirse."""
+    start = time.monotonic()
+    with profile.phase("dsp", background=True):
+        try:
+            import dsp  # noqa: F401  NumPy y el DSP cargan mientras los módems responden a los AT
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar el DSP: {e}")
+    done = set()
     while True:
-        raw = ser.readline()
-        if not raw:
+        target = targets.get()
+        if target is None:
+            break
+        prompts, codec, rate = target
+        pending = sorted(p for p in prompts if (p, codec, rate) not in done)
+        if not pending:
             continue
+        with profile.phase(f"prompts {codec}/{rate}", background=True):
+            for audio_file in pending:
+                done.add((audio_file, codec, rate))
+                try:
+                    PROMPT_CACHE.get(audio_file, codec, rate, pin=True)
+                except Exception as e:
+                    print(f"⚠️ No se pudo precompilar {audio_file}: {e}")
+    profile.publish(metrics.STARTUP_SECONDS)
+    print(f"🗂️ {len(done)} prompt(s) precompilado(s) en {(time.monotonic() - start) * 1000:.0f} ms")
+
+def start_endpoints(lines):
+    """Gauges por línea, /metrics y API de devoluciones (no hacen falta para atender)."""
+    for line in lines:
+        # line.ser cambia si el watchdog reconecta
+        metrics.SERIAL_BACKLOG.set_function(lambda line=line: line.ser.in_waiting, line=line.name)
+    if METRICS_PORT:
+        try:
+            metrics.start_http_server(METRICS_PORT, METRICS_ADDR)
+            print(f"📈 Métricas en http://{METRICS_ADDR}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️ No se pudo abrir el endpoint de métricas: {e}")
 
-        line = raw.decode(errors="ignore").strip()
-        # Loguear toda línea para diagnóstico de RING/VCID
-        print(f"MODEM< {line}")
-        line = re.sub(r'[^\x20-\x7E]', '', line)
+    if CALLBACKS and DIALER_API_PORT:
+        try:
+            start_api(CALLBACKS, DIALER_API_PORT, DIALER_API_ADDR,
+                      prompt_files([line.config for line in lines]))
+            print(f"📤 API de devoluciones en http://{DIALER_API_ADDR}:{DIALER_API_PORT}/callbacks")
+        except OSError as e:
+            print(f"⚠️ No se pudo abrir la API de devoluciones: {e}")
+
+def shutdown(manager):
+    manager.stop()
+    CALL_LOG.stop()
+    if CALL_STORE:
+        CALL_STORE.close()
+    if WEBHOOK_QUEUE:
+        WEBHOOK_QUEUE.stop()
+
+def main() -> int:
+    """Arranca en el orden que minimiza el tiempo hasta atender la primera llamada:
+    servicios livianos, módems en paralelo (cada línea atiende apenas queda
+    lista) con los prompts compilándose en otro hilo, y recién después los
+    endpoints HTTP. Informa la duración de cada fase."""
+    global ROUTER
+    profile = StartupProfile()
+    profile.mark("imports")
+    setup_logging(LOG_LEVEL, MODEM_LOG_RATE)
+
+    with profile.phase("servicios"):
+        build_services()
+        configs = parse_lines(LINES, LineConfig(
+            port=PORT, number=LOCAL_NUMBER, max_rings=MAX_RINGS, audio_file=AUDIO_FILE, baud=BAUD,
+            country_code=COUNTRY_CODE, caller_id_mode=CALLER_ID_MODE,
+        ))
+        if ROUTES:
+            ROUTER = PromptRouter(ROUTES, HOLIDAYS)
+            ROUTER.compile_all(configs)
+
+    # Los prompts (NumPy + DSP) se preparan mientras los módems responden a los AT;
+    # cada línea encola los suyos con el códec/tasa que negoció su módem
+    warmup = None
+    targets = queue.Queue()
+    if PLAY_AUDIO or PLAY_ONLY or ROUTER:
+        warmup = threading.Thread(target=warm_prompts, args=(targets, profile),
+                                  name="prompt-warmup", daemon=True)
+        warmup.start()
+
+    def line_ready(line):
+        if warmup:
+            codec, rate = line.profile.select_vsm(VSM_CODEC, SAMPLE_RATE, AUTO_VSM)
+            targets.put((prompt_files([line.config]), codec, rate))
+
+    watchdog = WatchdogConfig(probe_interval=WATCHDOG_PROBE_S, probe_timeout=WATCHDOG_TIMEOUT_S,
+                              max_failures=WATCHDOG_FAILURES, retry_max=RECONNECT_MAX_S)
+    manager = LineManager(configs, handle_modem_line, MODEM_PROFILE_FILE,
+                          idle=dial_next if CALLBACKS else None,
+                          watchdog=watchdog, on_lost=call_lost,
+                          on_missed=call_missed)
+    with profile.phase("módems"):
+        ready = manager.open_all(start=not PLAY_ONLY, on_ready=line_ready)
+    targets.put(None)
+    if not ready:
+        shutdown(manager)
+        return 1
+    profile.ready()
+
+    with profile.phase("endpoints"):
+        start_endpoints(manager.lines)
+    print(profile.report(STARTUP_BUDGET_MS))
+    profile.publish(metrics.STARTUP_SECONDS)
+
+    # Modo prueba: solo reproducir audio (en la primera línea) y salir
+    if PLAY_ONLY:
+        print("🎧 Modo solo reproducción activado (PLAY_ONLY=1). Reproduciendo y saliendo...")
+        try:
+            if warmup:
+                warmup.join()
+            first = manager.lines[0]
+            play_audio(first, first.config.audio_file)
+        finally:
+            shutdown(manager)
+        return 0
+
+    # Loop principal (un hilo por línea)
+    try:
+        manager.run()
+    except KeyboardInterrupt:
+        shutdown(manager)
+        print("Script detenido.")
+    return 0
 
-        if not line or line == "OK":
-            continue
 
-        # Detecta número entrante (NMBR)
-        if line.startswith("NMBR"):
-            incoming_number = line.split("=")[-1].strip()
-            incoming_number = normalize_phone_number(incoming_number)
-            call_active = True
-            ring_count = 0
-            print(f"📲 Número entrante detectado: {incoming_number}")
-
-        # Detecta timbre
-        elif "RING" in line or line == "R":
-            # Si no hubo Caller ID, iniciamos la llamada con número desconocido
-            if not call_active:
-                call_active = True
-                if not incoming_number:
-                    incoming_number = "unknown"
-                ring_count = 0
-            ring_count += 1
-            print(f"📞 Ring {ring_count} de {incoming_number}")
-            if ring_count >= MAX_RINGS:
-                if PLAY_AUDIO:
-                    print("📢 Alcanzado MAX_RINGS. Enviando webhook y reproduciendo audio...")
-                    log_call(incoming_number, LOCAL_NUMBER, "answered_with_audio")
-                    call_rescue_web_hook(incoming_number, LOCAL_NUMBER, "answered_with_audio")
-                    play_audio(ser, AUDIO_FILE)
-                else:
-                    print("📢 Alcanzado MAX_RINGS. Enviando webhook y colgando...")
-                    log_call(incoming_number, LOCAL_NUMBER, "hangup_after_webhook")
-                    call_rescue_web_hook(incoming_number, LOCAL_NUMBER, "hangup_after_webhook")
-                    answer_and_hangup(ser)
-                incoming_number = None
-                call_active = False
-                ring_count = 0
-
-        # Detecta línea ocupada o corte inmediato
-        elif "BUSY" in line or "NO CARRIER" in line:
-            if call_active and incoming_number:
-                print("📵 Línea ocupada o llamada terminada rápido")
-                log_call(incoming_number, LOCAL_NUMBER, "busy")
-                call_rescue_web_hook(incoming_number, LOCAL_NUMBER, "busy")
-                incoming_number = None
-                call_active = False
-                ring_count = 0
-
-except KeyboardInterrupt:
-    ser.close()
-    print("Script detenido.")
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
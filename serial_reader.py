@@ -0,0 +1,209 @@
+"""Lector del puerto serie en su propio hilo.
+
+Un hilo por módem lee bytes apenas llegan (bloquea en `read()` con timeout
+corto, sin sondear `readline()`), arma las líneas de texto y separa los
+eventos DLE de V.253 (<DLE>b ocupado, <DLE>d tono de marcar, <DLE>R timbre,
+dígitos DTMF, ...). Así el puerto se sigue leyendo mientras otro hilo escribe
+frames VTX: si el llamante corta durante la reproducción, `hangup` se activa
+y la transmisión se puede abortar en el próximo frame.
+
+Para AT+VRX, `start_capture(sink)` hace que después de la próxima línea
+CONNECT los bytes recibidos (sin escape DLE) vayan a `sink` en vez de
+interpretarse como texto, hasta el <DLE><ETX> del módem.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+DLE = 0x10
+ETX = 0x03
+
+# Códigos DLE que indican que el otro extremo cortó (V.253 tabla 14)
+HANGUP_EVENTS = frozenset("bdl")  # ocupado, tono de marcar, corte de corriente de lazo
+# Códigos DLE que el loop principal recibe como línea (compatibilidad con RING/R)
+LINE_EVENTS = frozenset("R")
+
+
+class SerialReader:
+    """Lee el puerto en segundo plano y entrega líneas y eventos DLE."""
+
+    def __init__(self, ser, name: str = "", read_timeout: float = 0.05,
+                 clock=time.monotonic):
+        self.ser = ser
+        self.name = name or getattr(ser, "port", "") or "serial"
+        self.read_timeout = read_timeout
+        self._clock = clock
+        self.lines = queue.Queue()
+        self.events = deque(maxlen=256)  # (instante, código)
+        self.hangup = threading.Event()
+        # callables(código, instante), llamados desde el hilo lector. Tupla que se
+        # reemplaza entera (copy-on-write): el lector la recorre sin lock
+        self.listeners = ()
+        self._listeners_lock = threading.Lock()
+        self.error = None
+        self.capture_done = threading.Event()
+        self._partial = bytearray()
+        self._dle = False
+        self._sink = None       # callable(bytes) armado por start_capture
+        self._capturing = False  # True entre CONNECT y <DLE><ETX>
+        self._skip_lf = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -----------------------------
+    # Ciclo de vida
+    # -----------------------------
+    def start(self):
+        self.ser.timeout = self.read_timeout
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"serial-rx-{self.name}",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 1.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    # -----------------------------
+    # Consumo
+    # -----------------------------
+    def readline(self, timeout: float = None) -> str:
+        """Próxima línea completa o '' si no llegó ninguna en `timeout`."""
+        try:
+            return self.lines.get(timeout=timeout)
+        except queue.Empty:
+            if self.error is not None and not self.is_alive():
+                raise self.error
+            return ""
+
+    def pending(self) -> bool:
+        return not self.lines.empty()
+
+    def wait_event(self, codes, timeout: float, after: float = None):
+        """Espera un evento DLE de `codes`; devuelve el código o None."""
+        deadline = self._clock() + timeout
+        while True:
+            for t, code in list(self.events):
+                if code in codes and (after is None or t >= after):
+                    return code
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                return None
+            time.sleep(min(remaining, 0.01))
+
+    def start_capture(self, sink):
+        """Manda a `sink` el audio que siga a la próxima línea CONNECT."""
+        self.capture_done.clear()
+        self._capturing = False
+        self._sink = sink
+
+    def stop_capture(self):
+        self._sink = None
+        self._capturing = False
+
+    # -----------------------------
+    # Listeners DLE
+    # -----------------------------
+    def add_listener(self, listener):
+        with self._listeners_lock:
+            self.listeners = self.listeners + (listener,)
+
+    def remove_listener(self, listener):
+        """Quita `listener` si está registrado (sin error si ya no lo estaba)."""
+        with self._listeners_lock:
+            listeners = list(self.listeners)
+            if listener in listeners:
+                listeners.remove(listener)
+                self.listeners = tuple(listeners)
+
+    # -----------------------------
+    # Hilo lector
+    # -----------------------------
+    def _run(self):
+        ser = self.ser
+        while not self._stop.is_set():
+            try:
+                data = ser.read(ser.in_waiting or 1)
+            except Exception as e:
+                self.error = e
+                break
+            if data:
+                self.feed(data)
+
+    def feed(self, data: bytes):
+        """Separa bytes en líneas y eventos DLE (público para reproducir capturas)."""
+        if self._capturing:
+            data = self._feed_audio(data)
+        partial = self._partial
+        for i, byte in enumerate(data):
+            if self._dle:
+                self._dle = False
+                if byte == DLE:
+                    partial.append(DLE)
+                else:
+                    self._on_event(chr(byte))
+            elif byte == DLE:
+                self._dle = True
+            elif byte in (0x0D, 0x0A):
+                if partial:
+                    text = partial.decode(errors="ignore").strip()
+                    partial.clear()
+                    if text:
+                        self.lines.put(text)
+                        if self._sink is not None and text.startswith("CONNECT"):
+                            self._capturing = True
+                            self._skip_lf = True
+                            return self.feed(data[i + 1:])
+            else:
+                partial.append(byte)
+
+    def _feed_audio(self, data: bytes) -> bytes:
+        """Audio de VRX hasta <DLE><ETX>; devuelve lo que sigue (texto)."""
+        if self._skip_lf and data[:1] == b"\n":
+            data = data[1:]
+        self._skip_lf = False
+        out = bytearray()
+        rest = b""
+        for i, byte in enumerate(data):
+            if self._dle:
+                self._dle = False
+                if byte == DLE:
+                    out.append(DLE)
+                elif byte == ETX:
+                    self._capturing = False
+                    rest = data[i + 1:]
+                    break
+                else:
+                    self._on_event(chr(byte))
+            elif byte == DLE:
+                self._dle = True
+            else:
+                out.append(byte)
+        sink = self._sink
+        if out and sink is not None:
+            try:
+                sink(bytes(out))
+            except Exception as e:
+                print(f"❌ [{self.name}] Error guardando audio recibido: {e}")
+        if not self._capturing:
+            self.capture_done.set()
+        return rest
+
+    def _on_event(self, code: str):
+        now = self._clock()
+        self.events.append((now, code))
+        if code in HANGUP_EVENTS:
+            self.hangup.set()
+        if code in LINE_EVENTS:
+            self.lines.put(code)
+        for listener in self.listeners:  # la tupla actual; altas/bajas crean otra
+            try:
+                listener(code, now)
+            except Exception as e:
+                print(f"❌ [{self.name}] Error en listener DLE '{code}': {e}")
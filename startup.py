@@ -0,0 +1,74 @@
+"""Perfil del arranque: cuánto tarda cada fase hasta quedar atendiendo llamadas.
+
+run.py lo importa antes que el resto de sus módulos, así la primera fase
+("imports") mide también la carga de dependencias. Las fases en segundo
+plano (p. ej. precompilar prompts mientras se inicializan los módems) se
+informan aparte: no suman al tiempo hasta "listo".
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Origen de las mediciones: importar este módulo es lo primero que hace run.py
+T0 = time.perf_counter()
+
+
+class StartupProfile:
+    """Fases del arranque en ms, con reporte y presupuesto opcional."""
+
+    def __init__(self, origin: float = T0, clock=time.perf_counter):
+        self._clock = clock
+        self.origin = origin
+        self.phases = []       # (fase, segundos, en segundo plano)
+        self.ready_at = None   # segundos desde el origen hasta "listo"
+        self._last = origin
+        self._lock = threading.Lock()
+
+    def mark(self, name: str):
+        """Cierra una fase que va desde la marca anterior hasta ahora."""
+        now = self._clock()
+        with self._lock:
+            self.phases.append((name, now - self._last, False))
+            self._last = now
+
+    @contextmanager
+    def phase(self, name: str, background: bool = False):
+        """Mide el bloque; las fases de primer plano mueven la marca."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            now = self._clock()
+            with self._lock:
+                self.phases.append((name, now - start, background))
+                if not background:
+                    self._last = now
+
+    def ready(self) -> float:
+        """Marca el instante en que se atienden llamadas; devuelve ms desde el origen."""
+        self.ready_at = self._clock() - self.origin
+        return self.ready_at * 1000
+
+    def report(self, budget_ms: float = 0) -> str:
+        with self._lock:
+            phases = list(self.phases)
+        parts = [f"{name} {seconds * 1000:.0f} ms" for name, seconds, background in phases
+                 if not background]
+        text = "⏱️ Arranque: " + ", ".join(parts)
+        if self.ready_at is not None:
+            text += f" -> listo en {self.ready_at * 1000:.0f} ms"
+            if budget_ms and self.ready_at * 1000 > budget_ms:
+                text += f" ⚠️ (presupuesto {budget_ms:.0f} ms)"
+        background = [f"{name} {seconds * 1000:.0f} ms" for name, seconds, bg in phases if bg]
+        if background:
+            text += " | en paralelo: " + ", ".join(background)
+        return text
+
+    def publish(self, gauge):
+        """Vuelca las fases (y 'ready') en un gauge con etiqueta `phase`."""
+        with self._lock:
+            phases = list(self.phases)
+        for name, seconds, _ in phases:
+            gauge.set(seconds, phase=name)
+        if self.ready_at is not None:
+            gauge.set(self.ready_at, phase="ready")
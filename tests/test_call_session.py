@@ -0,0 +1,144 @@
+"""CallSession contra transcripciones del módem, con reloj inyectado.
+
+Cada transcripción es una lista de (segundos, línea o bytes crudos) como las
+que muestra LOG_LEVEL=DEBUG; se reproducen sin dormir moviendo un reloj falso.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from call_session import (  # noqa: E402
+    ACTION_ANSWER, ACTION_BUSY, ACTION_CALLER_ID, ANSWERING, HUNG_UP, IDLE, PLAYING,
+    RINGING, CallSession,
+)
+from modem_at import clean_line  # noqa: E402
+from serial_reader import SerialReader  # noqa: E402
+
+# Llamada con Caller ID formateado (AT+VCID=1) entre el 1er y 2do timbre; cadencia de 5 s
+RING_AND_ANSWER = [
+    (0.0, "RING"),
+    (0.5, ""),
+    (1.2, "DATE = 1016"),
+    (1.2, "TIME = 1230"),
+    (1.3, "NMBR = 099123456"),
+    (1.3, "NAME = JUAN PEREZ"),
+    (5.0, "RING"),
+    (5.4, "RING"),  # mismo ciclo (cadencia doble): no cuenta
+    (10.0, "RING"),
+]
+
+# El llamante corta después de dos timbres
+RING_THEN_SILENCE = [
+    (0.0, "RING"),
+    (0.8, "NMBR = 099123456"),
+    (5.0, "RING"),
+]
+
+# Caller ID sin ningún RING posterior (p. ej. el llamante cortó antes del primer timbre)
+CALLER_ID_ONLY = [
+    (0.0, "DATE = 1016"),
+    (0.0, "TIME = 1230"),
+    (0.1, "NMBR = 099123456"),
+]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def replay(session, clock, transcript, normalize=None):
+    """Alimenta la transcripción; devuelve las acciones (instante, acción) no nulas."""
+    actions = []
+    for t, text in transcript:
+        clock.now = t
+        action = session.feed(clean_line(text), normalize=normalize)
+        if action:
+            actions.append((t, action))
+    return actions
+
+
+def new_session(max_rings=3):
+    clock = FakeClock()
+    return CallSession(max_rings=max_rings, clock=clock), clock
+
+
+def test_ring_to_answer():
+    session, clock = new_session(max_rings=3)
+    actions = replay(session, clock, RING_AND_ANSWER, normalize=lambda raw: "+598" + raw[1:])
+    assert actions == [(1.3, ACTION_CALLER_ID), (10.0, ACTION_ANSWER)]
+    assert session.state == RINGING
+    assert session.ring_count == 3
+    assert session.incoming_number == "+59899123456"
+    assert session.caller.record.name == "JUAN PEREZ"
+
+    clock.now = 10.3
+    session.answering()
+    clock.now = 10.5
+    session.playing()
+    summary = session.summary()
+    assert summary["first_ring"] == 0.0
+    assert summary["caller_id"] == 1.3
+    assert summary["answering"] == 10.3
+    assert summary["playing"] == 10.5
+    assert not session.expire(now=60.0)  # ya contestada: no expira
+
+
+def test_ring_timeout():
+    session, clock = new_session(max_rings=3)
+    assert replay(session, clock, RING_THEN_SILENCE) == [(0.8, ACTION_CALLER_ID)]
+    assert session.ring_count == 2
+    # Dentro del hueco normal entre timbres sigue sonando
+    assert not session.expire(now=5.0 + session.ring_gap_timeout - 0.1)
+    assert session.state == RINGING
+    assert session.expire(now=5.0 + session.ring_gap_timeout + 0.1)
+    assert session.state == HUNG_UP
+    assert session.hangup_reason == "ring_timeout"
+    assert session.incoming_number == "099123456"
+
+    session.reset()
+    assert session.state == IDLE and not session.call_active
+
+
+def test_caller_id_timeout():
+    session, clock = new_session()
+    assert replay(session, clock, CALLER_ID_ONLY) == [(0.1, ACTION_CALLER_ID)]
+    assert session.state == IDLE and session.call_active
+    assert not session.expire(now=0.1 + session.caller_id_timeout - 0.1)
+    assert session.expire(now=0.1 + session.caller_id_timeout + 0.1)
+    assert session.hangup_reason == "caller_id_timeout"
+    assert session.ring_count == 0
+
+
+def test_hangup_during_playback():
+    session, clock = new_session(max_rings=2)
+    replay(session, clock, [(0.0, "NMBR = 099123456"), (0.5, "RING"), (5.5, "RING")])
+    clock.now = 5.6
+    session.answering()
+    assert session.state == ANSWERING
+    clock.now = 5.9
+    session.playing()
+    assert session.state == PLAYING
+
+    # Durante VTX el módem avisa el corte con <DLE>b / <DLE>d (V.253), no con texto
+    reader = SerialReader(None, "test", clock=clock)
+    events = []
+    reader.add_listener(lambda code, t: events.append((t, code)))
+    clock.now = 8.2
+    reader.feed(b"\x10\x10\x10b")  # DLE escapado (dato) y luego <DLE>b
+    assert reader.hangup.is_set()
+    assert events == [(8.2, "b")]
+    session.hang_up("caller_hangup")
+    assert session.state == HUNG_UP
+    assert session.summary()["hung_up"] == 8.2 - 0.0
+
+    # Después de VTX el texto NO CARRIER/BUSY también corta una llamada en curso
+    session.reset()
+    replay(session, clock, [(20.0, "NMBR = 099123456"), (20.5, "RING")])
+    clock.now = 21.0
+    assert session.feed("NO CARRIER") == ACTION_BUSY
+    assert session.hangup_reason == "busy"
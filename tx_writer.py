@@ -0,0 +1,149 @@
+"""Escritura temporizada de frames VTX con colchón en el buffer del módem.
+
+Recibe frames de 20 ms ya escapados con DLE (ver prompt_cache) y los escribe
+al puerto con temporización por reloj monotónico. No concatena ni re-corta
+buffers: cada frame es un objeto bytes inmutable creado una sola vez al
+compilar el prompt, que pyserial escribe sin copiarlo.
+
+En vez de escribir cada frame justo en su deadline, el scheduler mantiene
+`lead` segundos de audio adelantados en el buffer del módem:
+- al arrancar manda una ráfaga de `burst` segundos (el audio suena antes y
+  el colchón se llena de entrada);
+- si el host se atrasa tanto que el buffer se vacía (underrun), re-ancla el
+  tiempo en vez de mandar todo lo atrasado de golpe y agranda `lead` un frame
+  (hasta `max_lead`): con CPU cargada se degrada a más latencia, no a cortes;
+- con CTS bajo (rtscts) o la cola del driver llena espera en pasos cortos en
+  lugar de bloquearse dentro de write();
+- los eventos del módem <DLE>u (underrun) y <DLE>o (overrun) ajustan `lead`
+  hacia arriba o hacia abajo (ver `on_modem_event`).
+"""
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from metrics import FRAME_LATENESS, TX_UNDERRUNS
+from prompt_cache import FRAME_MS
+
+
+@dataclass
+class TxStats:
+    """Estadísticas de una transmisión."""
+    frames: int = 0
+    bytes: int = 0
+    late_frames: int = 0  # frames que llegaron cuando el módem ya no tenía audio
+    max_late: float = 0.0  # peor atraso (hueco) en segundos
+    elapsed: float = 0.0
+    underruns: int = 0       # el buffer estimado del módem se vació
+    modem_underruns: int = 0  # <DLE>u informados por el módem
+    modem_overruns: int = 0   # <DLE>o informados por el módem
+    flow_waits: int = 0       # esperas por CTS bajo o cola del driver llena
+    lead: float = 0.0         # colchón objetivo al terminar (s)
+
+
+class FrameWriter:
+    """Escribe frames a ritmo de tiempo real (FRAME_MS por frame) con colchón adaptativo."""
+
+    def __init__(self, ser, frame_seconds: float = FRAME_MS / 1000.0,
+                 sleep=time.sleep, clock=time.monotonic, lead: float = 0.1,
+                 burst: float = 0.2, max_lead: float = 0.4, bytes_per_second: int = 8000):
+        self.ser = ser
+        self.frame_seconds = frame_seconds
+        self._sleep = sleep
+        self._clock = clock
+        self.lead = max(lead, 0.0)
+        self.burst = max(burst, self.lead)
+        self.max_lead = max(max_lead, self.lead)
+        # Cola del driver por encima de esto (bytes) = el módem no está tomando datos
+        self._max_out = int(bytes_per_second * self.max_lead) or None
+        # Solo se consulta el control de flujo si el puerto lo expone (pyserial sí;
+        # sumideros de prueba no); se apaga si la consulta falla (pty, sockets)
+        self._flow = bool(getattr(ser, "rtscts", False)) or hasattr(ser, "out_waiting")
+        self._modem_underruns = 0
+        self._modem_overruns = 0
+
+    def on_modem_event(self, code: str, now: float = None):
+        """Listener de SerialReader: <DLE>u / <DLE>o durante la transmisión."""
+        if code == "u":
+            self._modem_underruns += 1
+        elif code == "o":
+            self._modem_overruns += 1
+
+    def _flow_blocked(self) -> bool:
+        """True si escribir ahora bloquearía (CTS bajo o cola del driver llena)."""
+        if not self._flow:
+            return False
+        ser = self.ser
+        try:
+            if getattr(ser, "rtscts", False) and not ser.cts:
+                return True
+            if self._max_out and getattr(ser, "out_waiting", 0) > self._max_out:
+                return True
+        except Exception:
+            # Puertos sin líneas de módem (pty, sockets): solo pacing por tiempo
+            self._flow = False
+        return False
+
+    def write_frames(self, frames, stop=None) -> TxStats:
+        """Escribe `frames` en orden. `stop()` verdadero corta la transmisión."""
+        stats = TxStats()
+        write = self.ser.write
+        clock = self._clock
+        sleep = self._sleep
+        step = self.frame_seconds
+        lead = self.lead
+        burst = self.burst
+        # Atraso por bucket de FRAME_LATENESS (memoria fija); se vuelca al final, fuera del loop
+        buckets = FRAME_LATENESS.buckets
+        late_counts = [0] * (len(buckets) + 1)
+        late_total = 0.0
+        seen_underruns = self._modem_underruns
+        seen_overruns = self._modem_overruns
+        start = clock()
+        anchor = start   # instante en que empieza a sonar el primer frame
+        queued = 0.0     # segundos de audio escritos desde anchor
+        for frame in frames:
+            if stop is not None and stop():
+                break
+            now = clock()
+            buffered = anchor + queued - now
+            if buffered < 0 and stats.frames:
+                # Se vació el buffer del módem (el frame llega tarde a sonar):
+                # re-anclar en vez de mandar lo atrasado de golpe y pedir más colchón
+                late_counts[bisect_left(buckets, -buffered)] += 1
+                late_total -= buffered
+                stats.late_frames += 1
+                stats.max_late = max(stats.max_late, -buffered)
+                stats.underruns += 1
+                anchor = now - queued
+                buffered = 0.0
+                lead = min(lead + step, self.max_lead)
+            if self._modem_underruns != seen_underruns:
+                seen_underruns = self._modem_underruns
+                lead = min(lead + step, self.max_lead)
+            if self._modem_overruns != seen_overruns:
+                seen_overruns = self._modem_overruns
+                lead = max(lead - step, 0.0)
+            target = burst if queued < burst else lead
+            wait = buffered - target
+            if wait > 0:
+                sleep(wait)
+            if self._flow_blocked():
+                stats.flow_waits += 1
+                deadline = clock() + max(buffered, step)
+                while self._flow_blocked() and clock() < deadline:
+                    if stop is not None and stop():
+                        break
+                    sleep(step / 4)
+            write(frame)
+            queued += step
+            stats.frames += 1
+            stats.bytes += len(frame)
+        stats.elapsed = clock() - start
+        stats.lead = lead
+        stats.modem_underruns = self._modem_underruns
+        stats.modem_overruns = self._modem_overruns
+        late_counts[bisect_left(buckets, 0.0)] += stats.frames - stats.late_frames
+        FRAME_LATENESS.observe_buckets(late_counts, late_total)
+        if stats.underruns:
+            TX_UNDERRUNS.inc(stats.underruns)
+        return stats
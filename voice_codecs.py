@@ -0,0 +1,200 @@
+"""Codificación de salida para el módem sin audioop.
+
+Convierte PCM 16-bit mono (little-endian) a los formatos que acepta AT+VSM:
+μ-law, A-law, PCM 8-bit (signed/unsigned) y PCM 16-bit lineal. Las leyes G.711
+se resuelven con tablas precalculadas de 65536 entradas (una por muestra
+posible), bit a bit idénticas a audioop; con NumPy instalado la búsqueda es
+vectorizada, si no se usa map() sobre la tabla en C. PCM 8-bit usa slicing y
+bytes.translate.
+"""
+import sys
+from array import array
+
+CODEC_PCM8 = 128
+CODEC_ALAW = 129
+CODEC_ULAW = 130
+# El id del PCM 16-bit lineal depende del chipset (ver AT+VSM=?); se usa
+# solo si se fuerza con VSM_CODEC, nunca por autodetección.
+CODEC_PCM16 = 132
+
+_BIG_ENDIAN = sys.byteorder == "big"
+
+_SEG_UEND = (0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF)
+_SEG_AEND = (0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF)
+
+
+def _segment(value: int, table: tuple) -> int:
+    for i, end in enumerate(table):
+        if value <= end:
+            return i
+    return len(table)
+
+
+def _ulaw_from_14bit(pcm_val: int) -> int:
+    if pcm_val < 0:
+        pcm_val = -pcm_val
+        mask = 0x7F
+    else:
+        mask = 0xFF
+    pcm_val = min(pcm_val, 8159) + (0x84 >> 2)
+    seg = _segment(pcm_val, _SEG_UEND)
+    if seg >= 8:
+        return 0x7F ^ mask
+    return ((seg << 4) | ((pcm_val >> (seg + 1)) & 0x0F)) ^ mask
+
+
+def _alaw_from_13bit(pcm_val: int) -> int:
+    if pcm_val >= 0:
+        mask = 0xD5
+    else:
+        mask = 0x55
+        pcm_val = -pcm_val - 1
+    seg = _segment(pcm_val, _SEG_AEND)
+    if seg >= 8:
+        return 0x7F ^ mask
+    aval = seg << 4
+    aval |= (pcm_val >> (1 if seg < 2 else seg)) & 0x0F
+    return aval ^ mask
+
+
+def ulaw_to_linear(uval: int) -> int:
+    uval = ~uval & 0xFF
+    t = (((uval & 0x0F) << 3) + 0x84) << ((uval & 0x70) >> 4)
+    return (0x84 - t) if uval & 0x80 else (t - 0x84)
+
+
+def alaw_to_linear(aval: int) -> int:
+    aval ^= 0x55
+    t = (aval & 0x0F) << 4
+    seg = (aval & 0x70) >> 4
+    if seg == 0:
+        t += 8
+    elif seg == 1:
+        t += 0x108
+    else:
+        t = (t + 0x108) << (seg - 1)
+    return t if aval & 0x80 else -t
+
+
+def _signed(u16: int) -> int:
+    return u16 - 0x10000 if u16 & 0x8000 else u16
+
+
+# Tablas indexadas por la muestra como uint16 (0..65535); se arman al primer uso
+_tables = {}
+
+_numpy = False  # False: todavía no se intentó importar
+
+
+def numpy_or_none():
+    """NumPy si está instalado, o None. Se importa al primer uso y no al
+    importar el módulo, para no cargarlo en el arranque si no hace falta."""
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:  # NumPy es opcional
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+def _encode_table(name: str) -> bytes:
+    table = _tables.get(name)
+    if table is None:
+        if name == "ulaw":
+            table = bytes(_ulaw_from_14bit(_signed(u) >> 2) for u in range(65536))
+        else:
+            table = bytes(_alaw_from_13bit(_signed(u) >> 3) for u in range(65536))
+        _tables[name] = table
+        np = numpy_or_none()
+        if np is not None:
+            _tables[name + "_np"] = np.frombuffer(table, dtype=np.uint8)
+    return table
+
+
+# Decodificación (recepción): byte G.711 -> PCM16
+ULAW_DECODE = tuple(ulaw_to_linear(b) for b in range(256))
+ALAW_DECODE = tuple(alaw_to_linear(b) for b in range(256))
+
+# PCM 8-bit: cambio signed <-> unsigned invirtiendo el bit alto
+_FLIP_SIGN = bytes((b ^ 0x80) for b in range(256))
+
+
+def _as_uint16(data: bytes) -> array:
+    samples = array("H")
+    samples.frombytes(data[:len(data) & ~1])
+    if _BIG_ENDIAN:
+        samples.byteswap()
+    return samples
+
+
+def _lookup(data: bytes, name: str) -> bytes:
+    table = _encode_table(name)
+    np = numpy_or_none()
+    if np is not None:
+        idx = np.frombuffer(data, dtype="<u2", count=len(data) // 2)
+        return _tables[name + "_np"][idx].tobytes()
+    return bytes(map(table.__getitem__, _as_uint16(data)))
+
+
+def encode_ulaw(data: bytes) -> bytes:
+    return _lookup(data, "ulaw")
+
+
+def encode_alaw(data: bytes) -> bytes:
+    return _lookup(data, "alaw")
+
+
+def encode_pcm8(data: bytes, signed: bool = False) -> bytes:
+    """PCM16 -> PCM 8-bit tomando el byte alto de cada muestra."""
+    high = data[1::2]
+    return high if signed else high.translate(_FLIP_SIGN)
+
+
+def encode_pcm16(data: bytes) -> bytes:
+    return bytes(data[:len(data) & ~1])
+
+
+def decode_ulaw(data: bytes) -> bytes:
+    """μ-law -> PCM16 little-endian."""
+    out = array("h", map(ULAW_DECODE.__getitem__, data))
+    if _BIG_ENDIAN:
+        out.byteswap()
+    return out.tobytes()
+
+
+def decode_alaw(data: bytes) -> bytes:
+    """A-law -> PCM16 little-endian."""
+    out = array("h", map(ALAW_DECODE.__getitem__, data))
+    if _BIG_ENDIAN:
+        out.byteswap()
+    return out.tobytes()
+
+
+def encode(data: bytes, codec: int, pcm8_signed: bool = False) -> bytes:
+    """Convierte PCM16 mono al códec de salida del módem (μ-law por defecto)."""
+    if codec == CODEC_ALAW:
+        return encode_alaw(data)
+    if codec == CODEC_PCM8:
+        return encode_pcm8(data, pcm8_signed)
+    if codec == CODEC_PCM16:
+        return encode_pcm16(data)
+    return encode_ulaw(data)
+
+
+def bytes_per_sample(codec: int) -> int:
+    return 2 if codec == CODEC_PCM16 else 1
+
+
+def silence(codec: int, samples: int, pcm8_signed: bool = False) -> bytes:
+    """Silencio de `samples` muestras en el códec dado.
+    μ-law: 0xFF, A-law: 0xD5, PCM8 unsigned: 0x80 (o 0x00 si signed), PCM16: 0x0000.
+    """
+    if codec == CODEC_ULAW:
+        return b'\xff' * samples
+    if codec == CODEC_ALAW:
+        return b'\xd5' * samples
+    if codec == CODEC_PCM16:
+        return b'\x00\x00' * samples
+    return (b'\x00' if pcm8_signed else b'\x80') * samples
@@ -0,0 +1,216 @@
+"""Grabación de mensajes de voz (AT+VRX) directo a WAV.
+
+El audio recibido queda en el códec del módem: μ-law y A-law se guardan como
+WAV G.711 (formato 7 y 6, la mitad que PCM16) y PCM como WAV PCM. El
+encabezado se escribe al abrir con tamaños provisorios y se corrige al
+cerrar, así que cada bloque recibido va directo a disco y nunca se junta la
+grabación completa en memoria.
+
+Corta la grabación lo que ocurra primero: silencio sostenido después de
+haber oído voz (nivel medio por frame de 20 ms), evento de corte del módem
+(<DLE>b/d/l), silencio/quietud informado por el módem (<DLE>s/q) o la
+duración máxima.
+"""
+import os
+import struct
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+
+from serial_reader import HANGUP_EVENTS
+from voice_codecs import (ALAW_DECODE, CODEC_ALAW, CODEC_PCM8, CODEC_PCM16, CODEC_ULAW,
+                          ULAW_DECODE)
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_ALAW = 6
+WAVE_FORMAT_MULAW = 7
+
+# Eventos DLE de "no hay nadie hablando" que el módem puede informar (AT+VSD)
+SILENCE_EVENTS = frozenset("sq")
+
+_FLIP_SIGN = bytes((b ^ 0x80) for b in range(256))
+
+
+def wav_format(codec: int) -> tuple:
+    """(formato WAV, bits por muestra) para un códec de AT+VSM."""
+    if codec == CODEC_ULAW:
+        return WAVE_FORMAT_MULAW, 8
+    if codec == CODEC_ALAW:
+        return WAVE_FORMAT_ALAW, 8
+    if codec == CODEC_PCM16:
+        return WAVE_FORMAT_PCM, 16
+    return WAVE_FORMAT_PCM, 8
+
+
+class WavWriter:
+    """WAV mono escrito de forma incremental."""
+
+    def __init__(self, path: str, codec: int, rate: int, pcm8_signed: bool = False):
+        self.path = path
+        self.codec = codec
+        self.rate = rate
+        self.format, self.bits = wav_format(codec)
+        # El PCM 8-bit de WAV es sin signo
+        self._translate = _FLIP_SIGN if codec == CODEC_PCM8 and pcm8_signed else None
+        self.data_bytes = 0
+        self._file = open(path, "wb")
+        self._write_header()
+
+    def _header(self) -> bytes:
+        block_align = self.bits // 8
+        fmt = struct.pack("<HHIIHH", self.format, 1, self.rate,
+                          self.rate * block_align, block_align, self.bits)
+        chunks = []
+        if self.format == WAVE_FORMAT_PCM:
+            chunks.append(b"fmt " + struct.pack("<I", len(fmt)) + fmt)
+        else:
+            # Formatos no-PCM: fmt de 18 bytes (cbSize = 0) y chunk fact con las muestras
+            chunks.append(b"fmt " + struct.pack("<I", len(fmt) + 2) + fmt + b"\x00\x00")
+            chunks.append(b"fact" + struct.pack("<II", 4, self.data_bytes // block_align))
+        chunks.append(b"data" + struct.pack("<I", self.data_bytes))
+        body = b"WAVE" + b"".join(chunks)
+        riff_size = len(body) + self.data_bytes + (self.data_bytes & 1)
+        return b"RIFF" + struct.pack("<I", riff_size) + body
+
+    def _write_header(self):
+        self._file.seek(0)
+        self._file.write(self._header())
+
+    def write(self, data: bytes):
+        if self._translate is not None:
+            data = data.translate(self._translate)
+        self._file.write(data)
+        self.data_bytes += len(data)
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    @property
+    def duration(self) -> float:
+        return self.data_bytes / (self.rate * self.bits // 8)
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self.data_bytes & 1:
+            self._file.write(b"\x00")  # los chunks RIFF tienen largo par
+        self._write_header()
+        self._file.close()
+
+
+class SilenceDetector:
+    """Detecta silencio sostenido por el nivel medio de frames de 20 ms."""
+
+    def __init__(self, codec: int, rate: int, level: int = 500, silence_s: float = 5.0,
+                 pcm8_signed: bool = False, frame_ms: int = 20):
+        self.level = level
+        self.frame_samples = max(int(rate * frame_ms / 1000), 1)
+        self.frame_s = frame_ms / 1000.0
+        self.silence_frames = max(int(silence_s / self.frame_s), 1)
+        self.codec = codec
+        self.sample_bytes = 2 if codec == CODEC_PCM16 else 1
+        if codec == CODEC_ULAW:
+            self._levels = tuple(abs(v) for v in ULAW_DECODE)
+        elif codec == CODEC_ALAW:
+            self._levels = tuple(abs(v) for v in ALAW_DECODE)
+        elif codec == CODEC_PCM8:
+            offset = 0 if pcm8_signed else 128
+            # Escalado a 16 bits para usar el mismo umbral que PCM16
+            self._levels = tuple(abs(((b - offset + 128) & 0xFF) - 128) << 8 for b in range(256))
+        else:
+            self._levels = None
+        self._pending = b""
+        self.heard_voice = False
+        self.voice_s = 0.0
+        self._quiet = 0
+
+    def _frame_level(self, frame: bytes) -> float:
+        if self._levels is not None:
+            return sum(map(self._levels.__getitem__, frame)) / len(frame)
+        samples = array("h", frame)
+        return sum(map(abs, samples)) / len(samples)
+
+    def feed(self, data: bytes) -> bool:
+        """Agrega audio; True cuando hubo voz y después silencio sostenido."""
+        frame_bytes = self.frame_samples * self.sample_bytes
+        buf = self._pending + data if self._pending else data
+        end = len(buf) - len(buf) % frame_bytes
+        for i in range(0, end, frame_bytes):
+            if self._frame_level(buf[i:i + frame_bytes]) >= self.level:
+                self.heard_voice = True
+                self.voice_s += self.frame_s
+                self._quiet = 0
+            else:
+                self._quiet += 1
+        self._pending = bytes(buf[end:])
+        return self.heard_voice and self._quiet >= self.silence_frames
+
+
+@dataclass
+class Recording:
+    path: str
+    seconds: float
+    reason: str       # silence, hangup, modem_silence, max_duration, error
+    voice: bool       # se detectó voz
+
+
+def record_voicemail(at, reader, path: str, codec: int, rate: int,
+                     max_seconds: float = 120.0, silence_s: float = 5.0,
+                     level: int = 500, pcm8_signed: bool = False) -> Recording:
+    """Graba con AT+VRX hasta silencio, corte o `max_seconds`.
+
+    El audio lo entrega el hilo del SerialReader (ya sin escape DLE) y se
+    escribe en `path` a medida que llega.
+    """
+    writer = WavWriter(path, codec, rate, pcm8_signed)
+    detector = SilenceDetector(codec, rate, level, silence_s, pcm8_signed)
+    done = threading.Event()
+    lock = threading.Lock()  # el hilo lector escribe; este hilo cierra
+    reason = []
+
+    def on_audio(data: bytes):
+        with lock:
+            if writer.closed:
+                return
+            writer.write(data)
+        if detector.feed(data) and not done.is_set():
+            reason.append("silence")
+            done.set()
+
+    def on_event(code: str, now: float):
+        if code in HANGUP_EVENTS:
+            reason.append("hangup")
+            done.set()
+        elif code in SILENCE_EVENTS and detector.heard_voice:
+            reason.append("modem_silence")
+            done.set()
+
+    reader.add_listener(on_event)
+    reader.start_capture(on_audio)
+    try:
+        vrx = at.send("AT+VRX", timeout=3, final=("CONNECT", "ERROR"))
+        if not vrx.ok:
+            reason.append("error")
+        else:
+            if not done.wait(max_seconds):
+                reason.append("max_duration")
+            # <DLE>! termina la recepción: el módem responde <DLE><ETX> y OK
+            at.write_raw(b"\x10!")
+            reader.capture_done.wait(2)
+            at.wait("VRX", timeout=2)
+    finally:
+        reader.stop_capture()
+        reader.remove_listener(on_event)
+        with lock:
+            writer.close()
+    return Recording(path, writer.duration, reason[0] if reason else "max_duration",
+                     detector.heard_voice)
+
+
+def voicemail_path(directory: str, call_id: str, number: str = "") -> str:
+    """voicemail/AAAAMMDD-HHMMSS_<número>_<call_id>.wav"""
+    os.makedirs(directory, exist_ok=True)
+    safe = "".join(c for c in (number or "") if c.isalnum() or c == "+") or "unknown"
+    return os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{safe}_{call_id or 'call'}.wav")
@@ -0,0 +1,283 @@
+"""Entrega de webhooks en segundo plano.
+
+El loop del módem solo encola eventos en memoria; un hilo worker los envía
+con una sesión HTTP reutilizable, reintentos con backoff exponencial,
+agrupación opcional en lotes y un spool en disco para no perder eventos si el
+endpoint está caído o el proceso se reinicia. Al spool escriben el worker
+(cuando un envío falla o la cola se llenó) y stop(), nunca el hilo del módem.
+
+`requests` se importa en el hilo worker al arrancar, fuera del camino crítico
+del arranque (abrir los módems).
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from metrics import WEBHOOK_LATENCY, WEBHOOKS
+
+
+class WebhookQueue:
+    """Cola acotada de eventos con un worker que los entrega al webhook.
+
+    - submit() nunca bloquea ni toca el disco; si la cola está llena el
+      evento pasa a un desborde en memoria que el worker lleva al spool (y se
+      reintenta cuando haya lugar).
+    - Un lote cuyo primer envío falla se guarda en el spool antes de los
+      reintentos; stop() guarda lo que siga en memoria.
+    - Con batch_size > 1 se envían hasta batch_size eventos en un solo POST
+      (el cuerpo es una lista JSON en vez de un objeto).
+    - Respuestas 4xx (salvo 408/429) se consideran definitivas y se descartan.
+    """
+
+    def __init__(self, url: str, max_queue: int = 1000, batch_size: int = 1,
+                 batch_wait: float = 0.2, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 timeout: float = 5.0, spool_dir: str = None):
+        self.url = url
+        self.batch_size = max(int(batch_size), 1)
+        self.batch_wait = max(batch_wait, 0.0)
+        self.max_retries = max(int(max_retries), 0)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.spool_dir = spool_dir or None
+        self._queue = queue.Queue(maxsize=max(int(max_queue), 1))
+        self._queued = set()  # rutas de spool presentes en la cola
+        self._overflow = deque()  # eventos que no entraron en la cola; el worker los pasa al spool
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._session = None  # lo crea el worker (ver _open_session)
+        self.delivered = 0
+        self.failed = 0
+
+    # -----------------------------
+    # Spool en disco
+    # -----------------------------
+    def _spool_write(self, payload: dict):
+        if not self.spool_dir:
+            return None
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json"
+            path = os.path.join(self.spool_dir, name)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(payload, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            return path
+        except Exception as e:
+            print(f"⚠️ No se pudo escribir el spool de webhook: {e}")
+            return None
+
+    def _spool_remove(self, path: str):
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ No se pudo borrar {path} del spool: {e}")
+
+    def _spool_rescan(self):
+        """Encola eventos del spool que no están en memoria (reinicio o cola llena)."""
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            with self._lock:
+                if path in self._queued:
+                    continue
+            try:
+                with open(path) as f:
+                    payload = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Evento de spool ilegible {name}: {e}")
+                continue
+            if not self._enqueue(path, payload):
+                break
+
+    # -----------------------------
+    # API
+    # -----------------------------
+    def _enqueue(self, path, payload) -> bool:
+        try:
+            self._queue.put_nowait((path, payload))
+        except queue.Full:
+            return False
+        if path:
+            with self._lock:
+                self._queued.add(path)
+        return True
+
+    def submit(self, payload: dict) -> bool:
+        """Encola un evento sin bloquear. Devuelve False si no entró en memoria."""
+        if self._enqueue(None, payload):
+            return True
+        with self._lock:
+            self._overflow.append(payload)
+        where = "pasa al spool" if self.spool_dir else "se descarta si no se libera lugar"
+        print(f"⚠️ Cola de webhooks llena; el evento {where}")
+        return False
+
+    def _drain_overflow(self):
+        """Desde el worker: el desborde vuelve a la cola si hay lugar o va al spool."""
+        while True:
+            with self._lock:
+                if not self._overflow:
+                    return
+                payload = self._overflow.popleft()
+            if self._enqueue(None, payload):
+                continue
+            if not self._spool_write(payload):
+                self.failed += 1
+                print("❌ Cola de webhooks llena y sin spool; evento descartado")
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._spool_rescan()
+        self._thread = threading.Thread(target=self._run, name="webhook-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Detiene el worker; lo pendiente queda en el spool para el próximo arranque."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._session is not None:
+            self._session.close()
+        pending = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            pending.extend((None, payload) for payload in self._overflow)
+            self._overflow.clear()
+        self._spool_batch(pending)
+
+    # -----------------------------
+    # Worker
+    # -----------------------------
+    @staticmethod
+    def _open_session():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=1.0)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _post(self, batch) -> str:
+        """Envía un lote. Devuelve 'ok', 'retry' o 'drop'."""
+        payloads = [payload for _, payload in batch]
+        body = payloads[0] if self.batch_size == 1 else payloads
+        start = time.monotonic()
+        try:
+            response = self._session.post(self.url, json=body, timeout=self.timeout)
+        except Exception as e:
+            print(f"❌ Error enviando webhook: {e}")
+            return "retry"
+        finally:
+            WEBHOOK_LATENCY.observe(time.monotonic() - start)
+        print(f"Webhook {[p.get('CallSid') for p in payloads]} -> {response.status_code}")
+        if response.status_code < 400:
+            return "ok"
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            return "drop"
+        return "retry"
+
+    def _spool_batch(self, batch) -> list:
+        """Guarda en el spool los eventos del lote que todavía no están en disco."""
+        spooled = []
+        for path, payload in batch:
+            if path is None:
+                path = self._spool_write(payload)
+                if path:
+                    with self._lock:
+                        self._queued.add(path)
+            spooled.append((path, payload))
+        return spooled
+
+    def _finish(self, batch):
+        with self._lock:
+            for path, _ in batch:
+                self._queued.discard(path)
+
+    def _run(self):
+        self._session = self._open_session()
+        idle_since = time.monotonic()
+        while not self._stop.is_set():
+            self._drain_overflow()
+            batch = self._next_batch()
+            if not batch:
+                # En reposo, recuperar eventos que quedaron solo en el spool
+                if time.monotonic() - idle_since > 30:
+                    self._spool_rescan()
+                    idle_since = time.monotonic()
+                continue
+
+            attempt = 0
+            while True:
+                result = self._post(batch)
+                if result != "retry" or attempt >= self.max_retries:
+                    break
+                if attempt == 0:
+                    batch = self._spool_batch(batch)  # endpoint con problemas: a disco
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                attempt += 1
+                if self._stop.wait(delay):
+                    break
+
+            WEBHOOKS.inc(result="failed" if result == "retry" else result)
+            if result == "ok":
+                self.delivered += len(batch)
+                for path, _ in batch:
+                    self._spool_remove(path)
+            elif result == "drop":
+                self.failed += len(batch)
+                print(f"❌ Webhook rechazado por el endpoint; se descartan {len(batch)} evento(s)")
+                for path, _ in batch:
+                    self._spool_remove(path)
+            else:
+                self.failed += len(batch)
+                where = "queda en spool" if self.spool_dir else "se descarta"
+                batch = self._spool_batch(batch)
+                print(f"⚠️ Webhook sin entregar tras {attempt} reintento(s); {where}")
+            self._finish(batch)
+            idle_since = time.monotonic()